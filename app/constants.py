@@ -14,10 +14,128 @@ DIRECTORY_REPORTS_METADATA = DIRECTORY_REPORTS.with_name("reports_metadata")
 
 DIRECTORY_REPORTS_WEBHOOK = DIRECTORY_REPORTS.with_name("reports_webhook")
 
+DIRECTORY_REPORTS_STAGING = DIRECTORY_REPORTS.with_name("reports_staging")
+"""
+Uploads are extracted here and then renamed into DIRECTORY_REPORTS.
+Must be on the same filesystem as DIRECTORY_REPORTS.
+"""
+
+DIRECTORY_REPORTS_BLOBS = DIRECTORY_REPORTS.with_name("reports_blobs")
+"""
+Content addressed store: The files in DIRECTORY_REPORTS are hardlinks into this directory.
+Must be on the same filesystem as DIRECTORY_REPORTS.
+"""
+
+DIRECTORY_REPORTS_SPOOL = DIRECTORY_REPORTS.with_name("reports_spool")
+"""
+Partial uploads of resumable upload sessions.
+"""
+
+DIRECTORY_REPORTS_CACHE = DIRECTORY_REPORTS.with_name("reports_cache")
+"""
+Rendered html, see 'util_render_cache.py'. May be deleted at any time.
+"""
+
+DIRECTORY_REPORTS_TRASH = DIRECTORY_REPORTS.with_name("reports_trash")
+"""
+Deleted reports are renamed into this directory and then deleted in the background, see 'util_trash.py'.
+Must be on the same filesystem as DIRECTORY_REPORTS.
+"""
+
+DIRECTORY_REPORTS_COLD = DIRECTORY_REPORTS.with_name("reports_cold")
+"""
+Expired reports compacted into one archive each: 'reports_cold/<label>/report.zip'.
+See 'util_report_archive.archive_cold()'.
+"""
+
+FILENAME_REPORTS_CATALOG = DIRECTORY_REPORTS_CACHE / "reports_catalog.sqlite3"
+"""
+The reports shown on '/', see 'util_catalog.py'. Rebuilt if deleted.
+"""
+
 FILENAME_GH_LIST_JSON = "gh_list.json"
 FILENAME_EXPIRY = "expiry.json"
 FILENAME_INPUTS_JSON = "github_debug/inputs.json"
 
+ENV_REPORTS_STORAGE = "REPORTS_STORAGE"
+REPORTS_STORAGE = os.getenv(ENV_REPORTS_STORAGE, "directory")
+"""
+How uploaded reports are stored: 'directory' or 'zip'. See 'util_report_archive.py'.
+"""
+
+ENV_ARCHIVE_EXPIRED_REPORTS = "ARCHIVE_EXPIRED_REPORTS"
+ARCHIVE_EXPIRED_REPORTS = os.getenv(ENV_ARCHIVE_EXPIRED_REPORTS, "1") == "1"
+"""
+'1': Expired reports are compacted into DIRECTORY_REPORTS_COLD and may still be browsed.
+'0': Expired reports are deleted. Reports with expiry 'trash' are always deleted.
+"""
+
+ENV_UPLOAD_MAX_BYTES = "UPLOAD_MAX_BYTES"
+UPLOAD_MAX_BYTES_FALLBACK = 1024 * 1024 * 1024
+UPLOAD_MAX_BYTES = int(os.getenv(ENV_UPLOAD_MAX_BYTES, str(UPLOAD_MAX_BYTES_FALLBACK)))
+"""
+Uploads to '/upload' exceeding this size are rejected with 413 (Payload Too Large).
+"""
+
+ENV_UPLOAD_WORKERS = "UPLOAD_WORKERS"
+UPLOAD_WORKERS = int(os.getenv(ENV_UPLOAD_WORKERS, "2"))
+"""
+Number of threads extracting uploads in parallel.
+"""
+
+ENV_UPLOAD_SESSION_EXPIRY_S = "UPLOAD_SESSION_EXPIRY_S"
+UPLOAD_SESSION_EXPIRY_S = float(os.getenv(ENV_UPLOAD_SESSION_EXPIRY_S, str(24 * 3600)))
+"""
+Resumable upload sessions without activity for this time are purged.
+"""
+
+ENV_RENDER_CACHE_MAX_BYTES = "RENDER_CACHE_MAX_BYTES"
+RENDER_CACHE_MAX_BYTES = int(
+    os.getenv(ENV_RENDER_CACHE_MAX_BYTES, str(1024 * 1024 * 1024))
+)
+"""
+Disk space used by the rendered logs, markdown and .color files (each).
+The least recently used are evicted.
+"""
+
+ENV_RENDER_CACHE_MEMORY_MAX_BYTES = "RENDER_CACHE_MEMORY_MAX_BYTES"
+RENDER_CACHE_MEMORY_MAX_BYTES = int(
+    os.getenv(ENV_RENDER_CACHE_MEMORY_MAX_BYTES, str(32 * 1024 * 1024))
+)
+"""
+Memory per process used by the rendered logs, markdown and .color files (each).
+0: Rendered files are only cached on disk.
+"""
+
+ENV_TRASH_FILES_PER_S = "TRASH_FILES_PER_S"
+TRASH_FILES_PER_S = float(os.getenv(ENV_TRASH_FILES_PER_S, "1000"))
+"""
+The files deleted per second when emptying the trash.
+"""
+
+ENV_TRASH_WORKERS = "TRASH_WORKERS"
+TRASH_WORKERS = int(os.getenv(ENV_TRASH_WORKERS, "4"))
+"""
+Number of threads deleting files in parallel.
+"""
+
+ENV_STORAGE_HIGH_WATERMARK_BYTES = "STORAGE_HIGH_WATERMARK_BYTES"
+STORAGE_HIGH_WATERMARK_BYTES = int(os.getenv(ENV_STORAGE_HIGH_WATERMARK_BYTES, "0"))
+"""
+If the reports use more disk space, the least recently accessed reports are moved to the trash.
+Reports with expiry 'never' are kept. 0: Disabled.
+"""
+
+ENV_STORAGE_LOW_WATERMARK_BYTES = "STORAGE_LOW_WATERMARK_BYTES"
+STORAGE_LOW_WATERMARK_BYTES = int(
+    os.getenv(
+        ENV_STORAGE_LOW_WATERMARK_BYTES, str(int(STORAGE_HIGH_WATERMARK_BYTES * 0.9))
+    )
+)
+"""
+Reports are evicted until they use less disk space than this.
+"""
+
 
 def assert_directory_reports():
     if not DIRECTORY_REPORTS.is_dir():
@@ -26,3 +144,9 @@ def assert_directory_reports():
         )
     DIRECTORY_REPORTS_METADATA.mkdir(parents=False, exist_ok=True)
     DIRECTORY_REPORTS_WEBHOOK.mkdir(parents=False, exist_ok=True)
+    DIRECTORY_REPORTS_STAGING.mkdir(parents=False, exist_ok=True)
+    DIRECTORY_REPORTS_SPOOL.mkdir(parents=False, exist_ok=True)
+    DIRECTORY_REPORTS_BLOBS.mkdir(parents=False, exist_ok=True)
+    DIRECTORY_REPORTS_CACHE.mkdir(parents=False, exist_ok=True)
+    DIRECTORY_REPORTS_TRASH.mkdir(parents=False, exist_ok=True)
+    DIRECTORY_REPORTS_COLD.mkdir(parents=False, exist_ok=True)
@@ -1,16 +1,38 @@
-import io
+import dataclasses
+import datetime
 import logging
 import pathlib
-import shutil
-import tarfile
 import typing
 
-from fastapi import FastAPI, File, Form, HTTPException, Header, Request, UploadFile
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import (
+    Depends,
+    FastAPI,
+    Form,
+    HTTPException,
+    Header,
+    Request,
+)
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-
-from app import util_github, util_github2, util_logging, util_validate, util_webhooks
+from pydantic import BaseModel
+from starlette.datastructures import URL
+
+from app import (
+    util_blobstore,
+    util_catalog,
+    util_celery_tasks,
+    util_github,
+    util_github2,
+    util_listing,
+    util_logging,
+    util_report_archive,
+    util_trash,
+    util_upload,
+    util_upload_session,
+    util_validate,
+    util_webhooks,
+)
 
 from . import constants
 from .render_directory import render_directory_or_file
@@ -21,6 +43,11 @@ logger = logging.getLogger(__file__)
 util_logging.init_logging(level=logging.INFO)
 
 app = FastAPI()
+app.add_middleware(
+    util_upload.UploadLimitMiddleware,
+    paths=("/upload",),
+    max_bytes=constants.UPLOAD_MAX_BYTES,
+)
 
 DIRECTORY_OF_THIS_FILE = pathlib.Path(__file__).parent
 DIRECTORY_TEMPLATES = DIRECTORY_OF_THIS_FILE / "templates"
@@ -29,6 +56,11 @@ JINJA2_TEMPLATES = Jinja2Templates(directory=DIRECTORY_TEMPLATES)
 
 constants.assert_directory_reports()
 
+LISTING_PAGE_SIZE_MAX = 1000
+REPORTS_PAGE_SIZE_MAX = 1000
+EXPIRY_TAG_MAX_CHARS = 200
+PURGE_TICKS_SHOWN = 20
+
 
 @app.post("/github-webhook")
 async def github_webhook(
@@ -180,10 +212,7 @@ def jobs_next_GET(request: Request):
 
 
 @app.post("/upload")
-async def upload_tar_file(
-    file: UploadFile = File(...),
-    label: str = Form(...),
-):
+async def upload_tar_file(request: Request):
     """
     Endpoint to upload a tar file via HTTPS POST.
 
@@ -192,42 +221,147 @@ async def upload_tar_file(
     curl -X POST -F "label=ch_hans_1-2025-04-22_12-33-22" -F "file=@/home/maerki/work_octoprobe_testbed_micropython/results_yoga_2025-04-21b.tgz" -k https://reports.octoprobe.org/upload
 
     -k: Skips SSL verification
+
+    The tarball is extracted while it arrives if 'label' precedes 'file', see 'util_upload.receive_upload()'.
+    The size limit is configured by the environment variable 'UPLOAD_MAX_BYTES'.
+    For large tarballs over flaky links, see '/upload/sessions'.
     """
-    max_file_size_bytes = 10_1024_1024  # 10 MB in bytes
 
-    final_dir = constants.DIRECTORY_REPORTS / label
-    filename_tgz = final_dir / f"{label}.tgz"
+    async def ingest(label: str, fin: typing.BinaryIO) -> pathlib.Path:
+        assert_valid_label(label=label)
+        async with util_upload.label_lock(label=label):
+            return await util_upload.run_in_executor(
+                util_upload.ingest_tgz,
+                fin=fin,
+                label=label,
+                directory_reports=constants.DIRECTORY_REPORTS,
+                directory_staging=constants.DIRECTORY_REPORTS_STAGING,
+                max_bytes=constants.UPLOAD_MAX_BYTES,
+                blobstore=util_blobstore.BLOBSTORE,
+                storage=util_report_archive.REPORT_STORAGE,
+            )
+
     try:
-        # Download tarfile and keep in memory
-        tarfile_bytes = await file.read()
+        label, filename_tgz = await util_upload.receive_upload(
+            headers=request.headers, stream=request.stream(), ingest=ingest
+        )
+        await util_upload.run_in_executor(
+            util_celery_tasks.schedule_prerender_report, label=label
+        )
+        await util_upload.run_in_executor(util_github2.update_catalog, labels=[label])
 
-        # Check file size
-        tarfile_size_bytes = len(tarfile_bytes)
-        if tarfile_size_bytes > max_file_size_bytes:
-            raise HTTPException(
-                status_code=413,  # Payload Too Large
-                detail=f"File size {tarfile_size_bytes / (1024 * 1024):0.1f} MB exceeds the {max_file_size_bytes / (1024 * 1024):0.1f} MB limit!",
-            )
+        return JSONResponse(
+            content={"message": f"File '{filename_tgz}' uploaded successfully."},
+            status_code=200,
+        )
+    except HTTPException:
+        raise
+    except util_upload.UploadTooLargeError as e:
+        logger.warning(f"/upload: {e}")
+        raise HTTPException(
+            status_code=413,  # Payload Too Large
+            detail=str(e),
+        ) from e
+    except Exception as e:
+        logger.exception(e)
+        raise HTTPException(
+            status_code=500, detail=f"Failed to upload file: {str(e)}"
+        ) from e
 
-        # Prepare folder
-        shutil.rmtree(final_dir, ignore_errors=True)
-        final_dir.parent.mkdir(parents=True, exist_ok=True)
 
-        # Untar into tmp_dir
-        with tarfile.open(fileobj=io.BytesIO(tarfile_bytes), mode="r:gz") as tar:
-            tar.extractall(path=final_dir)
+def assert_valid_label(label: str) -> None:
+    if not util_upload.is_valid_label(label):
+        raise HTTPException(status_code=400, detail=f"Invalid label '{label}'!")
 
-        # Save tar file
-        filename_tgz.write_bytes(tarfile_bytes)
+
+@app.post("/upload/sessions")
+def upload_session_create(
+    label: str = Form(...),
+    size_bytes: int = Form(...),
+    sha256: str = Form(""),
+):
+    """
+    Resumable upload: See 'util_upload_session.py'.
+    """
+    assert_valid_label(label=label)
+    util_upload_session.purge_expired_sessions(
+        directory_spool=constants.DIRECTORY_REPORTS_SPOOL,
+        expiry_s=constants.UPLOAD_SESSION_EXPIRY_S,
+    )
+    session = util_upload_session.UploadSession.create(
+        directory_spool=constants.DIRECTORY_REPORTS_SPOOL,
+        label=label,
+        size_bytes=size_bytes,
+        sha256=sha256,
+        max_bytes=constants.UPLOAD_MAX_BYTES,
+    )
+    return JSONResponse(content=session.status(), status_code=201)
+
+
+@app.get("/upload/sessions/{session_id}")
+def upload_session_GET(session_id: str):
+    session = util_upload_session.UploadSession.read(
+        directory_spool=constants.DIRECTORY_REPORTS_SPOOL,
+        session_id=session_id,
+    )
+    return JSONResponse(content=session.status())
+
+
+@app.put("/upload/sessions/{session_id}")
+async def upload_session_put_chunk(
+    request: Request,
+    session_id: str,
+    offset: int,
+    x_chunk_sha256: str = Header(...),
+):
+    session = util_upload_session.UploadSession.read(
+        directory_spool=constants.DIRECTORY_REPORTS_SPOOL,
+        session_id=session_id,
+    )
+    await session.write_chunk(
+        offset=offset,
+        stream=request.stream(),
+        sha256=x_chunk_sha256,
+    )
+    return JSONResponse(content=session.status())
+
+
+@app.post("/upload/sessions/{session_id}/finalize")
+async def upload_session_finalize(session_id: str):
+    session = util_upload_session.UploadSession.read(
+        directory_spool=constants.DIRECTORY_REPORTS_SPOOL,
+        session_id=session_id,
+    )
+    try:
+        async with util_upload.label_lock(label=session.label):
+            # A concurrent finalize may have completed and deleted the session
+            session = util_upload_session.UploadSession.read(
+                directory_spool=constants.DIRECTORY_REPORTS_SPOOL,
+                session_id=session_id,
+            )
+            filename_tgz = await util_upload.run_in_executor(
+                session.finalize,
+                directory_reports=constants.DIRECTORY_REPORTS,
+                directory_staging=constants.DIRECTORY_REPORTS_STAGING,
+                max_bytes=constants.UPLOAD_MAX_BYTES,
+                blobstore=util_blobstore.BLOBSTORE,
+                storage=util_report_archive.REPORT_STORAGE,
+            )
+        await util_upload.run_in_executor(
+            util_celery_tasks.schedule_prerender_report, label=session.label
+        )
+        await util_upload.run_in_executor(
+            util_github2.update_catalog, labels=[session.label]
+        )
 
         return JSONResponse(
             content={"message": f"File '{filename_tgz}' uploaded successfully."},
             status_code=200,
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception(e)
-        # Clean up directory
-        shutil.rmtree(final_dir, ignore_errors=True)
         raise HTTPException(
             status_code=500, detail=f"Failed to upload file: {str(e)}"
         ) from e
@@ -235,48 +369,274 @@ async def upload_tar_file(
 
 @app.get("/purge")
 def purge_expired_reports(request: Request):
+    blobstore_stats = util_blobstore.BLOBSTORE.stats()
     return JINJA2_TEMPLATES.TemplateResponse(
         request=request,
         name="purge_expired_reports.html",
         context={
             "request": request,
             "list_reports": util_github2.list_reports,
+            "blobstore_stats": blobstore_stats,
+            "trash_progress": util_trash.TRASH.progress(),
+            # See 'util_github2.reports_bytes()'
+            "total_bytes": util_github2.CATALOG.total_bytes()
+            + blobstore_stats.blobs_bytes,
+            "archived_bytes": util_github2.CATALOG.archived_bytes(),
+            "archive_expired_reports": constants.ARCHIVE_EXPIRED_REPORTS,
+            "high_watermark_bytes": constants.STORAGE_HIGH_WATERMARK_BYTES,
+            "low_watermark_bytes": constants.STORAGE_LOW_WATERMARK_BYTES,
+            "purge_ticks": util_github2.CATALOG.purge_ticks(limit=PURGE_TICKS_SHOWN),
         },
     )
 
 
+@app.get("/api/trash")
+def trash_GET():
+    """
+    The progress of deleting the trashed reports, see 'util_trash.py'.
+    """
+    return JSONResponse(content=dataclasses.asdict(util_trash.TRASH.progress()))
+
+
+@app.get("/api/listing/{path:path}")
+def listing_GET(path: str = "", page: int = 1, page_size: int = 100):
+    """
+    The directory listing as json, paginated. 'page' starts with 1.
+
+    Example: http://localhost:8000/api/listing/github_selfhosted_testrun_107?page=2
+    """
+    if page < 1:
+        raise HTTPException(status_code=400, detail="'page' must be >= 1.")
+    if not 1 <= page_size <= LISTING_PAGE_SIZE_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"'page_size' must be between 1 and {LISTING_PAGE_SIZE_MAX}.",
+        )
+    directory = util_report_archive.resolve(path)
+    if not directory.is_dir():
+        raise HTTPException(status_code=404, detail=f"Directory not found: {path}")
+    entries = util_listing.list_directory(directory=directory, path=path)
+    start = (page - 1) * page_size
+    return JSONResponse(
+        content={
+            "path": path.strip("/") or ".",
+            "page": page,
+            "page_size": page_size,
+            "total": len(entries),
+            "entries": [e.as_dict() for e in entries[start : start + page_size]],
+        }
+    )
+
+
 # Mount the 'uploads' directory for browsing
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 
+@dataclasses.dataclass(slots=True, frozen=True)
+class ReportsQuery:
+    page: int
+    "Starts with 1"
+    page_size: int
+    report_filter: util_catalog.ReportFilter
+
+    @property
+    def offset(self) -> int:
+        return (self.page - 1) * self.page_size
+
+    def query(self) -> tuple[int, list[util_github2.WorkflowReport]]:
+        """
+        Returns the total number of matching reports and the reports of this page.
+        """
+        total = util_github2.count_reports(report_filter=self.report_filter)
+        list_reports = util_github2.list_reports(
+            report_filter=self.report_filter,
+            limit=self.page_size,
+            offset=self.offset,
+        )
+        return total, list_reports
+
+
+def reports_query(
+    page: int = 1,
+    page_size: int = util_github2.LIST_REPORTS_PAGE_SIZE,
+    author: str = "",
+    conclusion: str = "",
+    pr_number: str = "",
+    started_from: str = "",
+    started_to: str = "",
+    workflow: str = "",
+    archived: bool = False,
+) -> ReportsQuery:
+    """
+    The query parameters of '/' and '/api/reports'.
+    Empty parameters do not filter: The html form submits all fields.
+
+    author: Substring of the email, case insensitive
+    started_from, started_to: Example 2025-05-27, inclusive
+    workflow: 'github' or 'manual'
+    archived: Only the expired reports served from the archive
+    """
+
+    def date(name: str, value: str) -> str:
+        if value == "":
+            return ""
+        try:
+            return datetime.date.fromisoformat(value).isoformat()
+        except ValueError as e:
+            raise HTTPException(
+                status_code=400, detail=f"'{name}' must be a date like 2025-05-27."
+            ) from e
+
+    if page < 1:
+        raise HTTPException(status_code=400, detail="'page' must be >= 1.")
+    if not 1 <= page_size <= REPORTS_PAGE_SIZE_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"'page_size' must be between 1 and {REPORTS_PAGE_SIZE_MAX}.",
+        )
+    if workflow not in ("", *util_catalog.Workflow):
+        raise HTTPException(
+            status_code=400,
+            detail=f"'workflow' must be one of {', '.join(util_catalog.Workflow)}.",
+        )
+    return ReportsQuery(
+        page=page,
+        page_size=page_size,
+        report_filter=util_catalog.ReportFilter(
+            author=author.strip(),
+            conclusion=conclusion.strip(),
+            pr_number=pr_number.strip(),
+            started_from=date("started_from", started_from),
+            started_to=date("started_to", started_to),
+            workflow=util_catalog.Workflow(workflow) if workflow else None,
+            archived=archived,
+        ),
+    )
+
+
+def assert_valid_expiries(
+    labels: list[str], tag: str | None, expiry: str | None
+) -> None:
+    for label in labels:
+        assert_valid_label(label=label)
+        if not (
+            (constants.DIRECTORY_REPORTS / label).is_dir()
+            or (constants.DIRECTORY_REPORTS_METADATA / label).is_dir()
+            or (constants.DIRECTORY_REPORTS_COLD / label).is_dir()
+        ):
+            raise HTTPException(status_code=404, detail=f"Report not found: {label}")
+    if expiry is not None and not util_github2.WorkflowExpiry.is_valid_expiry(expiry):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid expiry '{expiry}': Expected a date like 2025-08-16, "
+            f"'{util_github2.EXPIRY_NEVER}' or '{util_github2.EXPIRY_TRASH}'.",
+        )
+    if tag is not None and len(tag) > EXPIRY_TAG_MAX_CHARS:
+        raise HTTPException(status_code=400, detail="'tag' is too long.")
+
+
+@app.post("/expiry")
+def expiry_POST(
+    request: Request,
+    workflow_unique_id: str = Form(...),
+    tag: str = Form(""),
+    expiry: str = Form(...),
+):
+    """
+    The expiry dialog on '/'. Redirects back to the page of the dialog.
+    """
+    assert_valid_expiries(labels=[workflow_unique_id], tag=tag, expiry=expiry)
+    util_github2.update_expiries(labels=[workflow_unique_id], tag=tag, expiry=expiry)
+    referer = URL(request.headers.get("referer", "/"))
+    url = referer.path if referer.query == "" else f"{referer.path}?{referer.query}"
+    return RedirectResponse(url=url, status_code=303)
+
+
+class ExpiryUpdate(BaseModel):
+    labels: list[str]
+    "Example: ['github_selfhosted_testrun_106', 'github_selfhosted_testrun_107']"
+    tag: str | None = None
+    "None: Keep the tag"
+    expiry: str | None = None
+    "Example: 2025-08-16, 'never', 'trash'. None: Keep the expiry"
+
+
+@app.post("/api/expiry")
+def expiry_api_POST(expiry_update: ExpiryUpdate):
+    """
+    Updates the expiry of many reports at once.
+
+    curl -X POST -H "Content-Type: application/json" -d '{"labels": ["github_selfhosted_testrun_106"], "tag": "Micropython release testing", "expiry": "never"}' http://localhost:8000/api/expiry
+    """
+    labels = sorted(set(expiry_update.labels))
+    assert_valid_expiries(
+        labels=labels, tag=expiry_update.tag, expiry=expiry_update.expiry
+    )
+    util_github2.update_expiries(
+        labels=labels, tag=expiry_update.tag, expiry=expiry_update.expiry
+    )
+    return JSONResponse(content={"updated": len(labels)})
+
+
+@app.get("/api/reports")
+def reports_api_GET(query: ReportsQuery = Depends(reports_query)):
+    """
+    The reports shown on '/' as json, paginated. 'page' starts with 1.
+
+    Example: http://localhost:8000/api/reports?author=hans&conclusion=failure&started_from=2025-05-01
+    """
+    total, list_reports = query.query()
+    return JSONResponse(
+        content={
+            "page": query.page,
+            "page_size": query.page_size,
+            "total": total,
+            "reports": [r.as_dict() for r in list_reports],
+        }
+    )
+
+
 @app.get("/")
-def reports(request: Request, read_github: bool = False):
+def reports(
+    request: Request,
+    read_github: bool = False,
+    query: ReportsQuery = Depends(reports_query),
+):
     """
     This top route '/' overrides the following '/{path:path}'!
 
     read_github: http://localhost:8000/?read_github=1
-    """
-    workflow_unique_id = request.query_params.get("workflow_unique_id", None)
-    if workflow_unique_id is not None:
-        # Expiry dialog. Write back values
-        tag = request.query_params["tag"]
-        expiry = request.query_params["expiry"]
-        workflow_expiry = util_github2.WorkflowExpiry(tag=tag, expiry=expiry)
-        workflow_expiry.write(workflow_unique_id=workflow_unique_id)
+    For the filters, see 'reports_query()': http://localhost:8000/?workflow=manual&page=2
 
+    Read only: The expiry dialog posts to '/expiry'.
+    """
     if read_github:
         try:
             util_github2.get_gh_list()
         except Exception as e:
             print(f"ERROR: {e}")
 
-    list_reports = util_github2.list_reports()
+    total, list_reports = query.query()
+
+    url = request.url.remove_query_params("read_github")
+    url_previous = None
+    if query.page > 1:
+        url_previous = str(url.include_query_params(page=query.page - 1))
+    url_next = None
+    if query.offset + len(list_reports) < total:
+        url_next = str(url.include_query_params(page=query.page + 1))
+
     return JINJA2_TEMPLATES.TemplateResponse(
         request=request,
         name="reports.html",
         context={
             "request": request,
             "list_reports": list_reports,
+            "query": query,
+            "total": total,
+            "url_previous": url_previous,
+            "url_next": url_next,
+            "workflows": list(util_catalog.Workflow),
         },
     )
 
@@ -286,11 +646,20 @@ async def browse_directory(
     request: Request,
     path: str = "",
     severity: str = SEVERITY_DEFAULT,
+    page: int | None = None,
 ):
     """
     Custom endpoint to browse the 'uploads' directory and list files.
+
+    page: Logfiles only: Show this page of the lines at 'severity'.
     """
+    if (page is not None) and (page < 1):
+        raise HTTPException(status_code=400, detail="'page' must be >= 1.")
+    label = path.strip("/").partition("/")[0]
+    if util_upload.is_valid_label(label) and util_github2.access_due(label=label):
+        # A stat and a sqlite write: Not on the event loop
+        await util_upload.run_in_executor(util_github2.record_access, label=label)
     url = request.url_for("browse_directory", path=path)
     return render_directory_or_file(
-        request=request, path=path, url=url, severity=severity
+        request=request, path=path, url=url, severity=severity, page=page
     )
@@ -1,129 +1,165 @@
 """
+Render a .color file (ANSI colors) as html.
 
-https://github.com/pycontribs/ansi2html/blob/main/src/ansi2html/converter.py#L329-L333
-https://github.com/pycontribs/ansi2html/blob/main/src/ansi2html/converter.py#L342
-
-    def do_linkify(self, line: str) -> str:
-        if not isinstance(line, str):
-            return line  # If line is an object, e.g. OSC_Link, it
-            # will be expanded to a string later
-        if self.latex:
-            return self.url_matcher.sub(r"\\url{\1}", line)
-        return self.url_matcher.sub(r'<a href="\1">\1</a>', line)
+The lines are converted by 'util_ansi.AnsiHtml' and streamed:
+The file is never held in memory as a whole.
+The paths are linkified in the same pass, like in the logfiles (see 'util_path_replace').
 """
 
-import pathlib
-import re
-
-from ansi2html import Ansi2HTMLConverter
-from fastapi import HTTPException
-from fastapi.responses import HTMLResponse
-from starlette.datastructures import URL
-
-from .constants import DIRECTORY_REPORTS
-
-RE_LINKS = re.compile(r"\/(?:[^\/\s]+\/)*[^\/\s]+")
-r"""
-\/ matches the starting /
+from __future__ import annotations
 
-(?:[^\/\s]+\/)* matches any number of folders
+import typing
 
-[^\/\s]+ matches the final file or folder name
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from starlette.datastructures import URL
 
-Avoids whitespace so you don't catch incomplete or invalid paths
+from . import (
+    constants,
+    util_ansi,
+    util_context,
+    util_path_replace,
+    util_render_cache,
+    util_report_archive,
+)
+from .render_log import FLUSH_SIZE_CHARS
+from .util_html import HtmlWriter, escape
+
+RENDERER_VERSION = 1
+"""
+Increment whenever the rendered html changes: Invalidates the cached renders.
 """
 
-
-def replace_links(text: str, url: URL) -> str:
-    def f(match: re.Match):
-        link = match.group(0)
-        link = link.replace("/home/octoprobe/testbed_micropython/results", "")
-        return f"{url.scheme}://{link}"
-
-    return RE_LINKS.sub(f, text)
-
-
-def do_linkify(text: str, url: URL) -> str:
-    def f(match: re.Match):
-        link = match.group(0)
-        link_small = link.replace("/home/octoprobe/testbed_micropython/results/", "")
-        return f'<a href="{url.scheme}://{link}">{link_small}</a>'
-
-    return RE_LINKS.sub(f, text)
-
-
-def render_ansi_color(color_file: pathlib.Path, url: URL) -> HTMLResponse:
-    """
-    Convert a .color file (ASCII colors) into colorized HTML using ansi2html.
-    """
-    try:
-        # Read the .color file
-        color_content = color_file.read_text(encoding="utf-8")
-
-        linkify = False
-
-        if linkify:
-            color_content = replace_links(color_content, url=url)
-
-        # Convert ANSI color codes to HTML
-        title = str(color_file.relative_to(DIRECTORY_REPORTS))
-        # scheme = "ansi2html"
-        scheme = "xterm"
-        # scheme = "osx"
-        # scheme = "osx-basic"
-        # scheme = "osx-solid-colors"
-        # scheme = "solarized"
-        # scheme = "mint-terminal"
-        # scheme = "dracula"
-        conv = Ansi2HTMLConverter(
-            title=title,
-            dark_bg=False,
-            linkify=linkify,
-            scheme=scheme,
-            markup_lines=True,
-            font_size="120%",
-        )
-        full = False
-        html_content = conv.convert(color_content, full=False)
-        if not linkify:
-            html_content = do_linkify(html_content, url=url)
-
-        html_pre = ""
-        if not full:
-            html_pre = (
-                """<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN" "http://www.w3.org/TR/html4/loose.dtd">
+HTML_BEGIN = """<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN" "http://www.w3.org/TR/html4/loose.dtd">
 <html>
 <head>
 <meta http-equiv="Content-Type" content="text/html; charset=utf-8">
-<title>"""
-                + title
-                + """</title>
+<title>{title}</title>
 <style type="text/css">
-.ansi2html-content { display: inline; white-space: pre-wrap; word-wrap: break-word; }
-.body_foreground { color: #000000; }
-.body_background { background-color: #DDDDDD; }
-.inv_foreground { color: #AAAAAA; }
-.inv_background { background-color: #000000; }
-.ansi32 { color: #00cd00; }
-.ansi34 { color: #0000ee; }
-.ansi38-214 { color: #ffaf00; }
+.ansi2html-content {{ display: inline; white-space: pre-wrap; word-wrap: break-word; }}
+.body_foreground {{ color: #000000; }}
+.body_background {{ background-color: #DDDDDD; }}
+.inv_foreground {{ color: #AAAAAA; }}
+.inv_background {{ background-color: #000000; }}
 </style>
 </head>
 <body class="body_foreground body_background" style="font-size: 120%;" >
 <pre class="ansi2html-content">
 """
-            )
-        html_post = """</pre>
+"""
+The css rules of the colors are written by 'util_ansi.AnsiHtml' when used.
+"""
+
+HTML_END = """</pre>
 </body>
 </html>
 """
-        html_content = html_pre + html_content + html_post
 
-        # Wrap the content in a preformatted block for proper display
-        # html_content = f"<pre>{html_content}</pre>"
 
-        return HTMLResponse(content=html_content)
+def get_path_replace(
+    color_file: util_report_archive.ReportFile,
+) -> util_path_replace.PathReplace | None:
+    """
+    None if the report has no context: The paths are not linkified.
+    """
+    directory_testresults = util_context.get_directory_testresults(logfile=color_file)
+    if not util_context.get_context_filename(directory_testresults).is_file():
+        return None
+    return util_context.get_path_replace(directory_testresults=directory_testresults)
+
+
+def iter_render(
+    color_file: util_report_archive.ReportFile,
+    path_replace: util_path_replace.PathReplace | None,
+    title: str,
+) -> typing.Iterator[str]:
+    """
+    Yields the html in chunks of about FLUSH_SIZE_CHARS.
+    """
+    writer = HtmlWriter()
+    writer.markup(HTML_BEGIN.format(title=escape(title)))
+    yield writer.flush()
+
+    ansi_html = util_ansi.AnsiHtml(path_replace=path_replace)
+    with color_file.open("rb") as f:
+        line = b""
+        for line in f:
+            ansi_html.write_line(
+                sink=writer,
+                line=line.removesuffix(b"\n").decode("utf-8", errors="replace"),
+            )
+            if writer.size >= FLUSH_SIZE_CHARS:
+                yield writer.flush()
+        if line == b"" or line.endswith(b"\n"):
+            # Like 'str.split("\n")': The empty line after the last newline
+            ansi_html.write_line(sink=writer, line="")
+
+    writer.markup(HTML_END)
+    yield writer.flush()
+
+
+def cache_key(
+    color_file: util_report_archive.ReportFile,
+    path_replace: util_path_replace.PathReplace | None,
+) -> str:
+    # The links depend on the context of the report
+    identity_context = None
+    if path_replace is not None:
+        directory_testresults = util_context.get_directory_testresults(
+            logfile=color_file
+        )
+        identity_context = util_render_cache.identity(
+            util_context.get_context_filename(directory_testresults)
+        )
+    return util_render_cache.RenderCache.key(
+        "ansi",
+        RENDERER_VERSION,
+        util_render_cache.identity(color_file),
+        identity_context,
+    )
+
+
+def get_title(color_file: util_report_archive.ReportFile) -> str:
+    return util_report_archive.relative_path(
+        color_file, directory_reports=constants.DIRECTORY_REPORTS
+    )
+
+
+def prerender_ansi_color(color_file: util_report_archive.ReportFile) -> bool:
+    """
+    See 'util_prerender'.
+    """
+    path_replace = get_path_replace(color_file)
+    return util_render_cache.RENDER_CACHE_ANSI.warm(
+        key=cache_key(color_file, path_replace),
+        render=lambda: iter_render(
+            color_file=color_file,
+            path_replace=path_replace,
+            title=get_title(color_file),
+        ),
+    )
+
+
+def render_ansi_color(
+    request: Request, color_file: util_report_archive.ReportFile, url: URL
+) -> Response:
+    """
+    Convert a .color file (ASCII colors) into colorized HTML.
+    """
+    try:
+        title = get_title(color_file)
+        path_replace = get_path_replace(color_file)
+        key = cache_key(color_file, path_replace)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to render .color file: {str(e)}"
         ) from e
+
+    return util_render_cache.RENDER_CACHE_ANSI.serve(
+        request=request,
+        key=key,
+        media_type="text/html",
+        render=lambda: iter_render(
+            color_file=color_file, path_replace=path_replace, title=title
+        ),
+    )
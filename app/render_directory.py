@@ -1,63 +1,27 @@
 import logging
-import pathlib
-import re
 
 from fastapi import HTTPException, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import Response, StreamingResponse
 from starlette.datastructures import URL
 
-from app.render_directory_style import get_listing_style
-
-from .constants import DIRECTORY_REPORTS
+from . import util_listing, util_report_archive, util_sniff
 from .render_ansii_color import render_ansi_color
 from .render_log import DEFAULT_LOGFILE, is_logfile, render_log
 from .render_markdown import render_markdown
+from .util_file_response import file_response
+from .util_html import escape
 
 logger = logging.getLogger(__file__)
 
-# TODO: Obsolete
-RE_NUMBER = re.compile(r"((?P<number>\d+)|(?P<text>^\d+))")
-"""
-"testresults_100" -> "testresults_", "100"
-"""
-
-
-# TODO: Obsolete
-def key_number_sort(filename: pathlib.Path | str) -> str:
-    """
-    Example:
-        testresults_100
-        testresults_92
-        testresults_97
-    Returns:
-        testresults_00100
-        testresults_00092
-        testresults_00097
-
-    This then will allow sorting by numbers.
-    """
-    if isinstance(filename, pathlib.Path):
-        filename = str(filename)
-    assert isinstance(filename, str)
-
-    def f(match: re.Match) -> str:
-        number = match.group("number")
-        if number is not None:
-            return format(int(number), "010d")
-        text = match.group("text")
-        assert text is not None
-        return text
-
-    return RE_NUMBER.sub(f, filename)
-
 
 def render_directory_or_file(
     request: Request,
     path: str,
     url: URL,
     severity: str,
-) -> HTMLResponse:
-    directory = DIRECTORY_REPORTS / path
+    page: int | None = None,
+) -> Response:
+    directory = util_report_archive.resolve(path)
 
     # Ensure the directory exists
     if not directory.exists():
@@ -66,16 +30,18 @@ def render_directory_or_file(
     if directory.is_file():
         filename = directory
         if filename.suffix == ".md":
-            return render_markdown(markdown_file=filename)
+            return render_markdown(request=request, markdown_file=filename)
         if filename.suffix == ".color":
-            return render_ansi_color(color_file=filename, url=url)
+            return render_ansi_color(request=request, color_file=filename, url=url)
         if filename.suffix == ".log":
             if is_logfile(filename):
                 # Whenever we select logger_20_info.log, we fall back to logger_10_debug.log!
                 return render_log(
-                    logfile=filename.with_name(DEFAULT_LOGFILE),
+                    request=request,
+                    logfile=util_report_archive.sibling(filename, DEFAULT_LOGFILE),
                     url=url,
                     severity=severity,
+                    page=page,
                 )
 
         media_type = {
@@ -86,74 +52,57 @@ def render_directory_or_file(
             # ".spec": "text/plain",
             ".json": "text/json",
         }.get(directory.suffix, None)
-        content_bytes = directory.read_bytes()
+        sniff = util_sniff.sniff(directory)
         if media_type is None:
-            try:
-                # Try if it is an ascii file
-                content_bytes.decode("ascii")
-                media_type = "text/plain"
-            except UnicodeDecodeError:
+            if sniff is not util_sniff.Sniff.ASCII:
                 # No ascii: It is a binary file to be downloaded
-                return HTMLResponse(
-                    content=content_bytes,
+                return file_response(
+                    request=request,
+                    report_file=directory,
                     media_type="application/octet-stream",
-                    headers={
-                        "Content-Disposition": f"attachment; filename={directory.name}"
-                    },
+                    download_filename=directory.name,
                 )
-        try:
-            content_text = content_bytes.decode(encoding="utf-8")
-        except UnicodeDecodeError:
-
-            def bytes_to_ascii_escape(data: bytes) -> str:
-                return "".join(
-                    chr(b) if (0x20 <= b <= 0x7E) or (b == 0x0A) else f"\\x{b:02x}"
-                    for b in data
-                )
-
-            content_text = (
-                "ATTENTION: Non utf-8 characters!\n\n"
-                + bytes_to_ascii_escape(content_bytes)
+            media_type = "text/plain"
+        if sniff is not util_sniff.Sniff.BINARY:
+            return file_response(
+                request=request,
+                report_file=directory,
+                media_type=media_type,
             )
-
-        return HTMLResponse(content=content_text, media_type=media_type)
+        return StreamingResponse(
+            content=util_sniff.iter_escaped(directory),
+            media_type=media_type,
+        )
 
     # List files and directories
-    files = sorted(directory.glob("*"), key=key_number_sort, reverse=True)
+    path_relative = path.strip("/")
+    entries = util_listing.list_directory(directory=directory, path=path_relative)
     # prune_logfiles(files=files)
     html_files: list[str] = []
 
-    def add_html_file(filename: pathlib.Path, name_override: str | None = None) -> None:
-        try:
-            path_ = str(filename.relative_to(DIRECTORY_REPORTS))
-        except ValueError:
-            assert name_override == ".."
-            return
-        name = filename.name
-        if name_override is not None:
-            name = name_override
-        is_dir = filename.is_dir()
-        styles = " ".join(
-            [
-                get_listing_style(path=path_).css_style,
-                "directory" if is_dir else "file",
-            ]
-        )
-        image = "bootstrap_folder.svg" if is_dir else "bootstrap_file-text.svg"
+    def add_html_file(entry: util_listing.ListingEntry) -> None:
+        styles = entry.css_styles
+        image = "bootstrap_folder.svg" if entry.is_dir else "bootstrap_file-text.svg"
         html_files.append(
             f"""<li>
-<a class="{styles}" href="/{path_}">
+<a class="{styles}" href="/{escape(entry.path)}">
 <img class="{styles}" src="/static/{image}" alt="{styles}"/>
-{name}
+{escape(entry.name)}
 </a>
 </li>"""
         )
 
     # Add the top directory
-    add_html_file(filename=directory.parent, name_override="..")
+    if path_relative != "":
+        path_parent, _, _ = path_relative.rpartition("/")
+        add_html_file(
+            util_listing.ListingEntry.factory(
+                path=path_parent or ".", name="..", is_dir=True
+            )
+        )
 
-    for filename in files:
-        add_html_file(filename=filename)
+    for entry in entries:
+        add_html_file(entry)
 
     # Generate HTML response
     # html_content = f"""
@@ -181,7 +130,7 @@ def render_directory_or_file(
         name="browse.html",
         context={
             "request": request,
-            "path_relative": str(directory.relative_to(DIRECTORY_REPORTS)),
+            "path_relative": path_relative or ".",
             "html_files": html_files,
         },
     )
@@ -1,4 +1,5 @@
 import enum
+import functools
 import re
 
 from testbed_micropython.report_test import util_constants
@@ -19,41 +20,86 @@ LIST_RE_2_STYLE = [
     # Firmware
     (re.compile(r"/mpbuild$"), ListingStyle.FIRMWARE),
     (re.compile(r"/mpbuild/[^/]+$"), ListingStyle.FIRMWARE),
-    (re.compile(r"/firmware.uf2$"), ListingStyle.FIRMWARE),
-    (re.compile(r"/firmware.spec$"), ListingStyle.FIRMWARE),
-    (re.compile(r"/docker_stdout.txt$"), ListingStyle.FIRMWARE),
+    (re.compile(r"/firmware\.uf2$"), ListingStyle.FIRMWARE),
+    (re.compile(r"/firmware\.spec$"), ListingStyle.FIRMWARE),
+    (re.compile(r"/docker_stdout\.txt$"), ListingStyle.FIRMWARE),
     # Directories
     (re.compile(r"/RUN-[^/]+$"), ListingStyle.GREEN),
     (re.compile(r"/testresults$"), ListingStyle.GREEN),
     (re.compile(r"^github_(.+?)_\d+$"), ListingStyle.GREEN),
     # Logfiles
-    (re.compile(r"/journalctl.txt$"), ListingStyle.BLACK),
-    (re.compile(r"/logger_20_info.log$"), ListingStyle.GREEN),
+    (re.compile(r"/journalctl\.txt$"), ListingStyle.BLACK),
+    (re.compile(r"/logger_20_info\.log$"), ListingStyle.GREEN),
     (
-        re.compile(rf"/{util_constants.FILENAME_OCTOPROBE_SUMMARY_REPORT_STEM}.html$"),
+        re.compile(rf"/{util_constants.FILENAME_OCTOPROBE_SUMMARY_REPORT_STEM}\.html$"),
         ListingStyle.GREEN,
     ),
     (
-        re.compile(rf"/{util_constants.FILENAME_OCTOPROBE_PR_REPORT_STEM}.html$"),
+        re.compile(rf"/{util_constants.FILENAME_OCTOPROBE_PR_REPORT_STEM}\.html$"),
         ListingStyle.GREEN,
     ),
-    (re.compile(r"/task_report.md$"), ListingStyle.BLACK),
-    (re.compile(r"/testresults.txt$"), ListingStyle.BLACK),
-    (re.compile(r"/flashing_stdout.txt$"), ListingStyle.BLACK),
+    (re.compile(r"/task_report\.md$"), ListingStyle.BLACK),
+    (re.compile(r"/testresults\.txt$"), ListingStyle.BLACK),
+    (re.compile(r"/flashing_stdout\.txt$"), ListingStyle.BLACK),
 ]
 """
 Map a regular expression on a filename to a css style to be applied to this file/directory.
 """
 
 
+RE_BASENAME_LITERAL = re.compile(r"^/((?:[\w\-@]|\\\.)+)\$$")
+"""
+A regular expression matching a literal basename, for example '/task_report\\.md$'.
+"""
+
+
+class ListingStyleClassifier:
+    """
+    Classifies a path with (most of the time) one dict lookup.
+
+    Every regular expression in the form '/<basename>$' goes into a lookup table
+    by basename. The remaining regular expressions are the fallback.
+
+    The first matching regular expression in 'list_re_2_style' wins: A fallback
+    is only evaluated if it comes before the entry found in the lookup table.
+    """
+
+    def __init__(self, list_re_2_style: list[tuple[re.Pattern, ListingStyle]]) -> None:
+        self.basename_2_index: dict[str, int] = {}
+        self.fallbacks: list[tuple[int, re.Pattern]] = []
+        self.styles = [style for _re_search, style in list_re_2_style]
+        for index, (re_search, _style) in enumerate(list_re_2_style):
+            match = RE_BASENAME_LITERAL.match(re_search.pattern)
+            if (match is None) or (re_search.flags != re.UNICODE):
+                self.fallbacks.append((index, re_search))
+                continue
+            basename = match.group(1).replace("\\", "")
+            self.basename_2_index.setdefault(basename, index)
+
+    def classify(self, path: str) -> ListingStyle:
+        index_max = len(self.styles)
+        _directory, sep, basename = path.rpartition("/")
+        if sep != "":
+            index_max = self.basename_2_index.get(basename, index_max)
+        for index, re_search in self.fallbacks:
+            if index >= index_max:
+                break
+            if re_search.search(path) is not None:
+                return self.styles[index]
+        if index_max < len(self.styles):
+            return self.styles[index_max]
+        return ListingStyle.GRAY
+
+
+CLASSIFIER = ListingStyleClassifier(LIST_RE_2_STYLE)
+
+
+@functools.lru_cache(maxsize=65536)
 def get_listing_style(path: str) -> ListingStyle:
     """
     The first matching style will be returned.
+    The result is memoized per path.
     """
     assert isinstance(path, str)
 
-    for re_search, style in LIST_RE_2_STYLE:
-        match = re_search.search(path)
-        if match is not None:
-            return style
-    return ListingStyle.GRAY
+    return CLASSIFIER.classify(path)
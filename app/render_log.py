@@ -1,14 +1,22 @@
 from __future__ import annotations
 
+import functools
 import pathlib
 import re
+import typing
 
-from fastapi.responses import HTMLResponse
-from markupsafe import Markup
+from fastapi import Request
+from fastapi.responses import Response
 from starlette.datastructures import URL
 
-from . import util_context
-from .util_html import Segments
+from . import (
+    util_context,
+    util_log_index,
+    util_path_replace,
+    util_render_cache,
+    util_report_archive,
+)
+from .util_html import HtmlWriter
 
 CSS = pathlib.Path(__file__).with_suffix(".css").read_text()
 """
@@ -37,11 +45,26 @@ SEVERITY_DEFAULT = "INFO"
 DEFAULT_LOGFILE = "logger_10_debug.log"
 TASK_REPORT_FILES_TO_PRUNE = {"task_report.md", "task_report.txt"}
 
+FLUSH_SIZE_CHARS = 64 * 1024
+"""
+Rendered html is flushed to the browser in chunks of this size
+"""
+
+RENDERER_VERSION = 1
+"""
+Increment whenever the rendered html changes: Invalidates the cached renders.
+"""
+
+LOG_PAGE_LINES = 5000
+"""
+Lines per page if the log is viewed with '?page=N'.
+"""
+
 LOGFILE_TRIGGER = "logger_"
 LOGFILE_DEFAULT = "logger_10_debug.log"
 
 
-def is_logfile(filename: pathlib.Path) -> bool:
+def is_logfile(filename: util_report_archive.ReportFile) -> bool:
     return filename.name.startswith(LOGFILE_TRIGGER)
 
 
@@ -145,123 +168,270 @@ span.text.COLOR_ERROR {
 """
 
 
-def severity_link(line_number: int, severity: int, label: str) -> str:
+def parse_severity(line: str) -> tuple[int, str | None] | None:
+    """
+    See 'util_log_index.LineParser'
+    """
+    match_severity_text = RE_SEVERITY_TEXT.match(line)
+    if match_severity_text is None:
+        return None
+    return (
+        DICT_SEVERITY_TEXT[match_severity_text.group("severity")],
+        match_severity_text.group("color_schema"),
+    )
+
+
+PageOf = typing.Callable[[int, int], int]
+"""
+Returns the page showing 'line_number' at 'severity'.
+"""
+
+
+def severity_link(
+    line_number: int, severity: int, label: str, page_of: PageOf | None = None
+) -> str:
     if SEVERITY_MIN <= severity <= SEVERITY_MAX - 1:
         sev_text = DICT_SEVERITY[severity]
-        return f'<a class="severity" title="{sev_text}" href="?severity={sev_text}#line{line_number}">{label}</a>'
+        page = "" if page_of is None else f"&page={page_of(line_number, severity)}"
+        return f'<a class="severity" title="{sev_text}" href="?severity={sev_text}{page}#line{line_number}">{label}</a>'
     return ""
 
 
-def severity_links(severity: int, line_number: int) -> str:
+def severity_links(
+    severity: int, line_number: int, page_of: PageOf | None = None
+) -> str:
     return severity_link(
-        line_number=line_number, severity=severity + 1, label="-"
-    ) + severity_link(line_number, severity - 1, "+")
+        line_number=line_number, severity=severity + 1, label="-", page_of=page_of
+    ) + severity_link(line_number, severity - 1, "+", page_of=page_of)
 
 
 class Render:
-    def __init__(self, logfile: pathlib.Path, url: URL, severity_text: str) -> None:
-        assert isinstance(logfile, pathlib.Path)
+    def __init__(
+        self,
+        logfile: util_report_archive.ReportFile,
+        url: URL,
+        severity_text: str,
+        page: int | None = None,
+    ) -> None:
+        """
+        page: None: All lines. Else: Only the lines of this page (starting at 1).
+        """
         assert logfile.is_file()
         assert isinstance(url, URL)
         assert isinstance(severity_text, str)
+        assert (page is None) or (page >= 1)
 
         self.severity_text = severity_text
+        self.page = page
         self.last_severity = ""
         self.severity = DICT_SEVERITY_TEXT[severity_text]
         self.line_severity_text = SEVERITY_DEFAULT
-        self.color_schema = "COLOR_INFO"
+        self.color_schema: str | None = "COLOR_INFO"
         self.logfile = logfile
         self.url = url
-
-        directory_testresults = util_context.get_directory_testresults(logfile=logfile)
-        self.replace = util_context.get_path_replace(
+        self.page_of: PageOf | None = None
+        if page is not None:
+            self.page_of = self._page_of
+
+    @functools.cached_property
+    def replace(self) -> util_path_replace.PathReplace:
+        directory_testresults = util_context.get_directory_testresults(
+            logfile=self.logfile
+        )
+        return util_context.get_path_replace(
             directory_testresults=directory_testresults
         )
 
-    def _render_line(self, line_payload: str, line_number: int) -> Segments:
-        segments = Segments()
-
-        with segments.tag("div", params='class="line"'):
-            match_severity_text = RE_SEVERITY_TEXT.match(line_payload)
-            if match_severity_text:
-                self.line_severity_text = match_severity_text.group("severity")
-                self.color_schema = match_severity_text.group("color_schema")
-                line_payload = match_severity_text.group("payload")
-                if self.line_severity_text != self.last_severity:
-                    self.last_severity = self.line_severity_text
-                    with segments.tag(
-                        "a",
-                        params=f'id="line{line_number}" name="line{line_number}"',
-                    ):
-                        html_number = severity_links(
-                            line_number=line_number,
-                            severity=self.severity,
-                        )
-                        segments.append(Markup(html_number))
-            with segments.tag(
-                "span", params=f'class="text {self.last_severity} {self.color_schema}"'
-            ):
-                segments.extend(self.replace.expand_href_line(line=line_payload))
+    @functools.cached_property
+    def index(self) -> util_log_index.LogIndex:
+        """
+        Built on the first access, which reads the whole logfile on a cache miss:
+        The constructor runs on the event loop, 'iter_render()' in the threadpool.
+        """
+        return util_log_index.get_index(
+            logfile=self.logfile,
+            parser=parse_severity,
+            severity_default=DICT_SEVERITY_TEXT[SEVERITY_DEFAULT],
+        )
 
-        if DICT_SEVERITY_TEXT[self.line_severity_text] >= self.severity:
-            return segments
-        return Segments()
+    def _page_of(self, line_number: int, severity: int) -> int:
+        line = max(0, line_number - 1)
+        return self.index.rank(line=line, severity=severity) // LOG_PAGE_LINES + 1
 
-    def render(self) -> str:
+    @property
+    def pages(self) -> int:
+        return max(1, -(-self.index.count(self.severity) // LOG_PAGE_LINES))
+
+    def _render_line(
+        self, writer: HtmlWriter, line_payload: str, line_number: int
+    ) -> None:
+        """
+        Writes the line into 'writer' if its severity is shown.
+        """
+        html_anchor = ""
+        match_severity_text = RE_SEVERITY_TEXT.match(line_payload)
+        if match_severity_text:
+            self.line_severity_text = match_severity_text.group("severity")
+            self.color_schema = match_severity_text.group("color_schema")
+            line_payload = match_severity_text.group("payload")
+            if self.line_severity_text != self.last_severity:
+                self.last_severity = self.line_severity_text
+                html_number = severity_links(
+                    line_number=line_number,
+                    severity=self.severity,
+                    page_of=self.page_of,
+                )
+                html_anchor = f'<a id="line{line_number}" name="line{line_number}">{html_number}</a>'
+
+        if DICT_SEVERITY_TEXT[self.line_severity_text] < self.severity:
+            return
+
+        writer.markup(
+            f'<div class="line">{html_anchor}<span class="text {self.last_severity} {self.color_schema}">'
+        )
+        self.replace.write_line(sink=writer, line=line_payload)
+        writer.markup("</span></div>")
+
+    def _set_state(
+        self, line: int, severity: int, color_schema: str | None, is_anchor: bool
+    ) -> None:
+        """
+        Set the state as if all lines before 'line' had been rendered.
+        """
+        self.line_severity_text = DICT_SEVERITY[severity]
+        self.color_schema = color_schema
+        if is_anchor or (line < self.index.first_matched):
+            self.last_severity = ""
+        else:
+            self.last_severity = self.line_severity_text
+
+    def html_page_navigation(self) -> str:
+        if self.page is None:
+            return ""
+
+        def link(page: int, label: str) -> str:
+            if 1 <= page <= self.pages and page != self.page:
+                return (
+                    f'<a href="?severity={self.severity_text}&page={page}">{label}</a>'
+                )
+            return label
+
+        return f"""page: {link(1, "|&lt;")} {link(self.page - 1, "&lt;")} {self.page}/{self.pages} {link(self.page + 1, "&gt;")} {link(self.pages, "&gt;|")}<br/>
+"""
+
+    def iter_render(self) -> typing.Iterator[str]:
         """
         severity:
           text: DEBUG, INFO
           int: 1, 2, 3
         severity: The requested severity
 
+        Yields the html in chunks of about FLUSH_SIZE_CHARS.
+        Only the lines to be shown are read: The index allows to seek to them.
         """
-        logfile_text = self.logfile.read_text()
-
-        schema_color_active = logfile_text.find("[COLOR_INFO]") >= 0
+        schema_color_active = self.index.schema_color_active
         path_directory, _, _path_filename = self.url.path.rpartition("/")
 
-        segments = Segments()
+        writer = HtmlWriter()
 
-        segments.append(Markup(HTML_BEGIN))
+        writer.markup(HTML_BEGIN)
         if schema_color_active:
-            segments.append(Markup(LINE_STYLES_COLOR_SCHEMA))
+            writer.markup(LINE_STYLES_COLOR_SCHEMA)
         else:
-            segments.append(Markup(LINE_STYLES_NORMAL))
-        segments.append(
-            Markup(f"""
+            writer.markup(LINE_STYLES_NORMAL)
+        writer.markup(
+            f"""
 <p class="filename">
     <a id="line{0}" name="line{0}"/>
     <a href="{path_directory}">back to directory</a><br/>
     path: {self.url.path}</br>
-    severity: {severity_links(self.severity, line_number=0)} {self.severity_text}<br/>
-    schema_color_active: {schema_color_active}
+    severity: {severity_links(self.severity, line_number=0, page_of=self.page_of)} {self.severity_text}<br/>
+    {self.html_page_navigation()}schema_color_active: {schema_color_active}
 </p>
-""")
+"""
         )
-
-        for line_number0, line in enumerate(logfile_text.splitlines()):
-            line_payload = line.rstrip()
-            segments.extend(
+        yield writer.flush()
+
+        start, stop = 0, None
+        if self.page is not None:
+            start = (self.page - 1) * LOG_PAGE_LINES
+            stop = start + LOG_PAGE_LINES
+
+        for line_begin, line_end in self.index.iter_ranges(
+            severity=self.severity, start=start, stop=stop
+        ):
+            lines = self.index.iter_lines(
+                logfile=self.logfile, line_begin=line_begin, line_end=line_end
+            )
+            states = self.index.iter_states(line_begin=line_begin, line_end=line_end)
+            for line, text, state in zip(
+                range(line_begin, line_end), lines, states, strict=True
+            ):
+                self._set_state(line, *state)
                 self._render_line(
-                    line_payload=line_payload,
-                    line_number=line_number0 + 1,
+                    writer=writer,
+                    line_payload=text.rstrip(),
+                    line_number=line + 1,
                 )
-            )
-        return segments.as_string()
+                if writer.size >= FLUSH_SIZE_CHARS:
+                    yield writer.flush()
+        if writer.size > 0:
+            yield writer.flush()
+
+    def render(self) -> str:
+        return "".join(self.iter_render())
+
+
+def cache_key(
+    logfile: util_report_archive.ReportFile,
+    url: URL,
+    severity: str,
+    page: int | None,
+) -> str:
+    directory_testresults = util_context.get_directory_testresults(logfile=logfile)
+    context_filename = util_context.get_context_filename(directory_testresults)
+    return util_render_cache.RenderCache.key(
+        RENDERER_VERSION,
+        url.path,
+        severity,
+        page,
+        util_render_cache.identity(logfile),
+        util_render_cache.identity(context_filename),
+    )
+
+
+def prerender_log(
+    logfile: util_report_archive.ReportFile, url: URL, severity: str
+) -> bool:
+    """
+    See 'util_prerender'. Builds the index of the logfile as a side effect.
+    """
+    return util_render_cache.RENDER_CACHE_LOG.warm(
+        key=cache_key(logfile=logfile, url=url, severity=severity, page=None),
+        render=lambda: Render(
+            logfile=logfile, url=url, severity_text=severity
+        ).iter_render(),
+    )
 
 
 def render_log(
-    logfile: pathlib.Path,
+    request: Request,
+    logfile: util_report_archive.ReportFile,
     url: URL,
     severity: str,
-) -> HTMLResponse:
-    r = Render(logfile=logfile, url=url, severity_text=severity)
-    html_content = r.render()
-    return HTMLResponse(
-        content=html_content,
-        headers={
-            "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
-            "Pragma": "no-cache",
-            "Expires": "0",
-        },
+    page: int | None = None,
+) -> Response:
+    """
+    page: See 'Render'.
+
+    The html is streamed: The browser starts painting after the first chunk, the memory stays flat.
+    The rendered html is cached: The render cost is paid once per logfile, severity and page.
+    """
+    return util_render_cache.RENDER_CACHE_LOG.serve(
+        request=request,
+        key=cache_key(logfile=logfile, url=url, severity=severity, page=page),
+        media_type="text/html",
+        render=lambda: Render(
+            logfile=logfile, url=url, severity_text=severity, page=page
+        ).iter_render(),
     )
@@ -1,20 +1,48 @@
-import pathlib
-
-from fastapi import HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
 from testbed_micropython.report_test.util_markdown2 import markdown2html
 
+from . import util_render_cache, util_report_archive
+
+RENDERER_VERSION = 1
+"""
+Increment whenever the rendered html changes: Invalidates the cached renders.
+"""
+
+
+def cache_key(markdown_file: util_report_archive.ReportFile) -> str:
+    return util_render_cache.RenderCache.key(
+        "markdown", RENDERER_VERSION, util_render_cache.identity(markdown_file)
+    )
 
-def render_markdown(markdown_file: pathlib.Path) -> HTMLResponse:
-    try:
-        # Read the Markdown file
-        markdown_content = markdown_file.read_text(encoding="utf-8")
 
-        # Convert Markdown to HTML
-        html_content = markdown2html(markdown_content, title=markdown_file.name)
+def render(markdown_file: util_report_archive.ReportFile) -> list[str]:
+    # Read the Markdown file
+    markdown_content = markdown_file.read_text(encoding="utf-8")
 
-        # Return the HTML content
-        return HTMLResponse(content=html_content)
+    # Convert Markdown to HTML
+    return [markdown2html(markdown_content, title=markdown_file.name)]
+
+
+def prerender_markdown(markdown_file: util_report_archive.ReportFile) -> bool:
+    """
+    See 'util_prerender'.
+    """
+    return util_render_cache.RENDER_CACHE_MARKDOWN.warm(
+        key=cache_key(markdown_file), render=lambda: render(markdown_file)
+    )
+
+
+def render_markdown(
+    request: Request, markdown_file: util_report_archive.ReportFile
+) -> Response:
+    try:
+        return util_render_cache.RENDER_CACHE_MARKDOWN.serve(
+            request=request,
+            key=cache_key(markdown_file),
+            media_type="text/html",
+            render=lambda: render(markdown_file),
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to convert Markdown: {str(e)}"
@@ -0,0 +1,354 @@
+"""
+ANSI SGR escape sequences (colors) to html.
+
+Replaces 'ansi2html': The same css classes (xterm scheme), but line by line
+so the html may be streamed. The text is linkified in the same pass.
+
+Differences to 'ansi2html':
+  * The colors continue on the next line: Every line is closed and reopened with the current colors.
+  * Cursor up ('ESC[1A') is ignored: Streamed lines may not be taken back.
+  * OSC 8 hyperlinks are dropped, the text is kept.
+  * The css rules are written when a class is used for the first time.
+
+https://en.wikipedia.org/wiki/ANSI_escape_code#SGR_(Select_Graphic_Rendition)_parameters
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import re
+
+from .util_html import HtmlSink
+from .util_path_replace import PathReplace
+
+RE_ESCAPE = re.compile(r"\x1b(?:\[([\d;:?]*)([a-zA-Z])|\]8;;[^\x07]*\x07|\([B0])")
+"""
+Groups: 'params' and 'command' of a CSI sequence.
+The other sequences (OSC 8 hyperlinks, vt100 box drawing) are dropped.
+"""
+
+RE_PARAMS_SPLIT = re.compile(r"[;:]")
+
+XTERM_COLORS = (
+    "#000000",
+    "#cd0000",
+    "#00cd00",
+    "#cdcd00",
+    "#0000ee",
+    "#cd00cd",
+    "#00cdcd",
+    "#e5e5e5",
+    "#7f7f7f",
+    "#ff0000",
+    "#00ff00",
+    "#ffff00",
+    "#5c5cff",
+    "#ff00ff",
+    "#00ffff",
+    "#ffffff",
+)
+"""
+The 16 colors of the xterm scheme: normal 0..7, bright 8..15.
+"""
+
+CSS_ATTRIBUTES = {
+    1: "font-weight: bold",
+    2: "font-weight: lighter",
+    3: "font-style: italic",
+    4: "text-decoration: underline",
+    5: "text-decoration: blink",
+    6: "text-decoration: blink",
+    8: "visibility: hidden",
+    9: "text-decoration: line-through",
+}
+
+RESET = 0
+INTENSITY = (1, 2, 22)
+STYLE = (3, 23)
+BLINK = (5, 6, 25)
+UNDERLINE = (4, 24)
+CROSSED_OUT = (9, 29)
+VISIBILITY = (8, 28)
+NEGATIVE = (7, 27)
+FOREGROUND = 38
+FOREGROUND_DEFAULT = 39
+BACKGROUND = 48
+BACKGROUND_DEFAULT = 49
+COLOR_256 = 5
+COLOR_TRUE = 2
+
+
+def color_256(index: int) -> str:
+    """
+    The 8 bit colors: 16 xterm colors, a 6x6x6 color cube and 24 shades of grey.
+    """
+    if index < 16:
+        return XTERM_COLORS[index]
+    if index < 232:
+        index -= 16
+        components = (index // 36, index // 6 % 6, index % 6)
+        return "#" + "".join(
+            f"{0 if c == 0 else 0x37 + 0x28 * c:02x}" for c in components
+        )
+    return "#" + f"{(index - 232) * 10 + 8:02x}" * 3
+
+
+def css_rule(css_class: str) -> str | None:
+    """
+    Returns the css rule for a class written by 'SgrState.css_classes()'.
+    None if the class has no rule.
+    """
+    prefix, number, parameter = re.fullmatch(
+        r"(ansi|inv)(\d+)(?:-(\d+))?", css_class
+    ).groups()  # type: ignore[union-attr]
+    code = int(number)
+    inverted = prefix == "inv"
+
+    if parameter is None:
+        if not inverted and code in CSS_ATTRIBUTES:
+            return f".{css_class} {{ {CSS_ATTRIBUTES[code]}; }}"
+        if 30 <= code <= 37 or 90 <= code <= 97:
+            is_foreground = True
+            color = XTERM_COLORS[code % 10 + (8 if code >= 90 else 0)]
+        elif 40 <= code <= 47 or 100 <= code <= 107:
+            is_foreground = False
+            color = XTERM_COLORS[code % 10 + (8 if code >= 100 else 0)]
+        else:
+            return None
+        background = "background-color"
+    else:
+        if code not in (FOREGROUND, BACKGROUND):
+            return None
+        is_foreground = code == FOREGROUND
+        if len(parameter) == 9:
+            # True color: rrrgggbbb
+            color = "#" + "".join(
+                f"{int(parameter[i : i + 3]):02X}" for i in range(0, 9, 3)
+            )
+            background = "background-color"
+        else:
+            index = int(parameter)
+            if index > 255:
+                return None
+            color = color_256(index)
+            background = "background-color" if index < 16 else "background"
+
+    if is_foreground != inverted:
+        return f".{css_class} {{ color: {color}; }}"
+    return f".{css_class} {{ {background}: {color}; }}"
+
+
+@dataclasses.dataclass(slots=True)
+class SgrState:
+    """
+    The state of the terminal as defined by the SGR escape sequences.
+    The values are the SGR codes.
+    """
+
+    intensity: int = 22
+    style: int = 23
+    blink: int = 25
+    underline: int = 24
+    crossed_out: int = 29
+    visibility: int = 28
+    foreground: tuple[int, str | None] = (FOREGROUND_DEFAULT, None)
+    background: tuple[int, str | None] = (BACKGROUND_DEFAULT, None)
+    negative: int = 27
+
+    def reset(self) -> None:
+        self.intensity = 22
+        self.style = 23
+        self.blink = 25
+        self.underline = 24
+        self.crossed_out = 29
+        self.visibility = 28
+        self.foreground = (FOREGROUND_DEFAULT, None)
+        self.background = (BACKGROUND_DEFAULT, None)
+        self.negative = 27
+
+    def adjust(self, code: int, parameter: str | None = None) -> None:
+        if code in INTENSITY:
+            self.intensity = code
+        elif code in STYLE:
+            self.style = code
+        elif code in BLINK:
+            self.blink = code
+        elif code in UNDERLINE:
+            self.underline = code
+        elif code in CROSSED_OUT:
+            self.crossed_out = code
+        elif code in VISIBILITY:
+            self.visibility = code
+        elif 30 <= code <= 37 or 90 <= code <= 97 or code == FOREGROUND_DEFAULT:
+            self.foreground = (code, None)
+        elif code == FOREGROUND:
+            self.foreground = (code, parameter)
+        elif 40 <= code <= 47 or 100 <= code <= 107 or code == BACKGROUND_DEFAULT:
+            self.background = (code, None)
+        elif code == BACKGROUND:
+            self.background = (code, parameter)
+        elif code in NEGATIVE:
+            self.negative = code
+
+    def apply(self, params_text: str) -> None:
+        """
+        Applies the parameters of 'ESC[<params_text>m'.
+        Mimics 'ansi2html': Everything before the last reset is ignored.
+        """
+        while True:
+            length = len(params_text)
+            params_text = params_text.replace("::", ":").replace(";;", ";")
+            if len(params_text) == length:
+                break
+        try:
+            params = [int(x) for x in RE_PARAMS_SPLIT.split(params_text)]
+        except ValueError:
+            params = [RESET]
+
+        # Find the last reset
+        last_reset = None
+        skip_until = -1
+        for i, code in enumerate(params):
+            if i <= skip_until:
+                continue
+            if code == RESET:
+                last_reset = i
+            elif code in (FOREGROUND, BACKGROUND):
+                color_id = params[i + 1] if i + 1 < len(params) else -1
+                skip_until = i + (2 if color_id == COLOR_256 else 4)
+        if last_reset is not None:
+            params = params[last_reset + 1 :]
+            self.reset()
+
+        skip_until = -1
+        for i, code in enumerate(params):
+            if i <= skip_until:
+                continue
+            parameter: str | None = None
+            if code in (FOREGROUND, BACKGROUND) and i + 1 < len(params):
+                color_id = params[i + 1]
+                if color_id == COLOR_256:
+                    if i + 2 >= len(params):
+                        continue
+                    parameter = str(params[i + 2])
+                    skip_until = i + 2
+                elif color_id == COLOR_TRUE:
+                    if i + 4 >= len(params):
+                        continue
+                    parameter = "".join(f"{c:03d}" for c in params[i + 2 : i + 5])
+                    skip_until = i + 4
+            self.adjust(code, parameter)
+
+    def css_classes(self) -> str:
+        """
+        The css classes as written by 'ansi2html'.
+        """
+        classes: list[str] = []
+        for value, default in (
+            (self.intensity, 22),
+            (self.style, 23),
+            (self.blink, 25),
+            (self.underline, 24),
+            (self.crossed_out, 29),
+            (self.visibility, 28),
+        ):
+            if value != default:
+                classes.append(f"ansi{value}")
+
+        negative = self.negative == 7
+        for (value, parameter), default, css_class_negative in (
+            (self.foreground, FOREGROUND_DEFAULT, "inv_background"),
+            (self.background, BACKGROUND_DEFAULT, "inv_foreground"),
+        ):
+            if value != default:
+                prefix = "inv" if negative else "ansi"
+                suffix = str(value) if parameter is None else f"{value}-{parameter}"
+                classes.append(prefix + suffix)
+            elif negative:
+                classes.append(css_class_negative)
+        return " ".join(classes)
+
+
+class AnsiHtml:
+    """
+    Writes the lines of a file with ANSI escape sequences as html.
+    Every line becomes '<span id="line-N">...</span>': Like 'ansi2html' with 'markup_lines'.
+    """
+
+    def __init__(self, path_replace: PathReplace | None = None) -> None:
+        """
+        path_replace: Paths in the text are linkified. None: No links.
+        """
+        self.path_replace = path_replace
+        self.state = SgrState()
+        self.line_number = 0
+        self._css_classes = ""
+        "The css classes of 'state'"
+        self._transitions: dict[tuple[str, str], tuple[str, SgrState]] = {}
+        """
+        (css classes, params) -> (css classes, state) after 'SgrState.apply()'.
+        The css classes define the state. The states in here are never modified.
+        """
+        self._span = ""
+        "The css classes of the span currently open"
+        self._css_rules_written: set[str] = set()
+
+    def write_line(self, sink: HtmlSink, line: str) -> None:
+        """
+        'line' without the trailing newline.
+        """
+        separator = "\n" if self.line_number > 0 else ""
+        sink.markup(f'{separator}<span id="line-{self.line_number}">')
+        self.line_number += 1
+
+        pos = 0
+        if "\x1b" in line:
+            for match in RE_ESCAPE.finditer(line):
+                start = match.start()
+                if start > pos:
+                    self._write_text(sink, line[pos:start])
+                pos = match.end()
+                if match.group(2) == "m":
+                    self._apply(match.group(1))
+        if pos < len(line):
+            self._write_text(sink, line[pos:])
+
+        if self._span:
+            sink.markup("</span>")
+            self._span = ""
+        sink.markup("</span>")
+
+    def _apply(self, params_text: str) -> None:
+        key = (self._css_classes, params_text)
+        transition = self._transitions.get(key)
+        if transition is None:
+            state = dataclasses.replace(self.state)
+            state.apply(params_text)
+            transition = (state.css_classes(), state)
+            self._transitions[key] = transition
+        self._css_classes, self.state = transition
+
+    def _write_text(self, sink: HtmlSink, text: str) -> None:
+        if self._css_classes != self._span:
+            if self._span:
+                sink.markup("</span>")
+            if self._css_classes:
+                self._write_css_rules(sink)
+                sink.markup(f'<span class="{self._css_classes}">')
+            self._span = self._css_classes
+        if self.path_replace is None:
+            sink.text(text)
+        else:
+            self.path_replace.write_line(sink=sink, line=text)
+
+    def _write_css_rules(self, sink: HtmlSink) -> None:
+        for css_class in self._css_classes.split(" "):
+            if css_class in self._css_rules_written:
+                continue
+            self._css_rules_written.add(css_class)
+            if css_class.startswith("inv_"):
+                # Part of the stylesheet of the page
+                continue
+            rule = css_rule(css_class)
+            if rule is not None:
+                sink.markup(f"<style>{rule}</style>")
@@ -0,0 +1,176 @@
+"""
+Content addressed store for the files of the reports.
+
+Consecutive runs repeat many files byte for byte (firmware images, docker stdout, test scripts).
+Every extracted file is hashed while it streams and stored once:
+
+  reports_blobs/ab/abcdef0123...    sha256 of the content
+
+The file in the report tree is a hardlink to the blob.
+The blob is read-only: Hardlinks share the inode, so a report must never modify it.
+
+A blob with a link count of 1 is not referenced by any report anymore
+and will be removed by 'BlobStore.gc()'.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import logging
+import os
+import pathlib
+import shutil
+import stat
+import time
+import typing
+import uuid
+
+from . import constants
+
+logger = logging.getLogger(__file__)
+
+CHUNK_SIZE_BYTES = 1024 * 1024
+DIRECTORYNAME_TMP = "tmp"
+TMP_EXPIRY_S = 3600.0
+
+
+@dataclasses.dataclass(slots=True)
+class BlobStoreStats:
+    blobs: int = 0
+    blobs_bytes: int = 0
+    "Bytes on disk used by the blobs"
+    links: int = 0
+    "Files in the report trees pointing to a blob"
+    links_bytes: int = 0
+    "Bytes which would be used without deduplication"
+
+    @property
+    def dedup_ratio(self) -> float:
+        if self.blobs_bytes == 0:
+            return 1.0
+        return self.links_bytes / self.blobs_bytes
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.links_bytes - self.blobs_bytes
+
+    @property
+    def text(self) -> str:
+        return f"{self.links} files ({self.links_bytes / 1e6:0.1f} MB) stored as {self.blobs} blobs ({self.blobs_bytes / 1e6:0.1f} MB): dedup ratio {self.dedup_ratio:0.2f}"
+
+
+class BlobStore:
+    def __init__(self, directory: pathlib.Path) -> None:
+        self.directory = directory
+
+    @property
+    def directory_tmp(self) -> pathlib.Path:
+        return self.directory / DIRECTORYNAME_TMP
+
+    def blob_path(self, digest: str) -> pathlib.Path:
+        return self.directory / digest[:2] / digest
+
+    def _iter_blobs(self) -> typing.Iterator[os.DirEntry]:
+        with os.scandir(self.directory) as it_fanout:
+            for entry_fanout in it_fanout:
+                if entry_fanout.name == DIRECTORYNAME_TMP:
+                    continue
+                if not entry_fanout.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(entry_fanout.path) as it:
+                    yield from it
+
+    def add_file(
+        self,
+        fin: typing.BinaryIO,
+        target: pathlib.Path,
+        mode: int,
+        mtime: float,
+    ) -> bool:
+        """
+        Hash 'fin' while copying it, then hardlink the blob as 'target'.
+        Returns True if the content was already in the store.
+        """
+        self.directory_tmp.mkdir(parents=True, exist_ok=True)
+        filename_tmp = self.directory_tmp / uuid.uuid4().hex
+        hasher = hashlib.sha256()
+        with filename_tmp.open("wb") as fout:
+            while chunk := fin.read(CHUNK_SIZE_BYTES):
+                hasher.update(chunk)
+                fout.write(chunk)
+        blob = self.blob_path(hasher.hexdigest())
+
+        try:
+            if blob.exists():
+                try:
+                    self._link(blob=blob, target=target)
+                    return True
+                except FileNotFoundError:
+                    # The blob has been garbage collected in the meantime
+                    pass
+
+            # Blobs are read-only as they are shared by many reports
+            os.chmod(filename_tmp, stat.S_IMODE(mode) & ~0o222)
+            os.utime(filename_tmp, (mtime, mtime))
+            blob.parent.mkdir(exist_ok=True)
+            filename_tmp.rename(blob)
+            self._link(blob=blob, target=target)
+            return False
+        finally:
+            filename_tmp.unlink(missing_ok=True)
+
+    @staticmethod
+    def _link(blob: pathlib.Path, target: pathlib.Path) -> None:
+        target.unlink(missing_ok=True)
+        try:
+            os.link(blob, target)
+        except FileNotFoundError:
+            raise
+        except OSError as e:
+            # Too many links or different filesystem: Fall back to a copy
+            logger.debug(f"{blob}: {e!r}: copying")
+            shutil.copy2(blob, target)
+
+    def gc(self) -> int:
+        """
+        Remove the blobs not referenced by any report anymore.
+        Returns the number of blobs removed.
+        """
+        if not self.directory.is_dir():
+            return 0
+        blobs_removed = 0
+        time_limit = time.time() - TMP_EXPIRY_S
+        for entry in self._iter_blobs():
+            stat_result = entry.stat(follow_symlinks=False)
+            if stat_result.st_nlink > 1:
+                continue
+            if stat_result.st_ctime > time_limit:
+                # Might just be added by a running upload and not linked yet
+                continue
+            os.unlink(entry.path)
+            blobs_removed += 1
+
+        # Leftovers of interrupted uploads
+        if self.directory_tmp.is_dir():
+            with os.scandir(self.directory_tmp) as it:
+                for entry in it:
+                    if entry.stat().st_mtime < time_limit:
+                        os.unlink(entry.path)
+        return blobs_removed
+
+    def stats(self) -> BlobStoreStats:
+        stats = BlobStoreStats()
+        if not self.directory.is_dir():
+            return stats
+        for entry in self._iter_blobs():
+            stat_result = entry.stat(follow_symlinks=False)
+            links = stat_result.st_nlink - 1
+            stats.blobs += 1
+            stats.blobs_bytes += stat_result.st_size
+            stats.links += links
+            stats.links_bytes += links * stat_result.st_size
+        return stats
+
+
+BLOBSTORE = BlobStore(directory=constants.DIRECTORY_REPORTS_BLOBS)
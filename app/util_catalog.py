@@ -0,0 +1,427 @@
+"""
+Catalog of the reports: One row per report in a sqlite database.
+
+The landing page '/' lists the reports with one indexed query instead of
+scanning DIRECTORY_REPORTS and DIRECTORY_REPORTS_METADATA and parsing the json files of every report.
+
+The catalog is derived data: It is kept up to date on upload, on expiry changes and
+when the github jobs are read (see 'util_github2.update_catalog()').
+'util_github2.sync_catalog()' compares the catalog with the files and repairs it (daily and
+at startup, see 'util_celery_tasks.daily_job()'): The database may be deleted at any time.
+
+Each row stores the json documents of the report as read from the files ('documents')
+and a 'signature': The stat of these files. A row is only read again if its signature changed.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import dataclasses
+import enum
+import json
+import logging
+import pathlib
+import sqlite3
+import time
+import typing
+
+logger = logging.getLogger(__file__)
+
+SCHEMA_VERSION = 8
+"""
+Increment whenever the schema changes: The catalog is rebuilt.
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    label TEXT PRIMARY KEY,
+    sortable TEXT NOT NULL,
+    expiry TEXT NOT NULL,
+    is_valid INTEGER NOT NULL,
+    report_present INTEGER NOT NULL,
+    archived INTEGER NOT NULL,
+    is_github_workflow INTEGER NOT NULL,
+    email TEXT NOT NULL,
+    conclusion TEXT NOT NULL,
+    pr_number TEXT NOT NULL,
+    started_date TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    signature TEXT NOT NULL,
+    documents TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_sortable ON reports (is_valid, sortable DESC);
+CREATE INDEX IF NOT EXISTS reports_due ON reports (report_present, expiry);
+CREATE INDEX IF NOT EXISTS reports_conclusion
+    ON reports (is_valid, conclusion, sortable DESC);
+CREATE INDEX IF NOT EXISTS reports_pr_number
+    ON reports (is_valid, pr_number, sortable DESC);
+CREATE INDEX IF NOT EXISTS reports_started_date ON reports (is_valid, started_date);
+CREATE INDEX IF NOT EXISTS reports_workflow
+    ON reports (is_valid, is_github_workflow, sortable DESC);
+CREATE INDEX IF NOT EXISTS reports_archived
+    ON reports (is_valid, archived, sortable DESC);
+CREATE TABLE IF NOT EXISTS purge_ticks (
+    started_at REAL NOT NULL,
+    duration_s REAL NOT NULL,
+    reports_due INTEGER NOT NULL,
+    reports_expired INTEGER NOT NULL,
+    reports_archived INTEGER NOT NULL,
+    metadata_purged INTEGER NOT NULL,
+    reports_evicted INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS report_access (
+    label TEXT PRIMARY KEY,
+    accessed_at REAL NOT NULL
+);
+"""
+
+PURGE_TICKS_MAX = 2000
+"""
+The number of purge ticks kept: One week at one tick every 300s.
+"""
+
+COLUMNS = (
+    "label",
+    "sortable",
+    "expiry",
+    "is_valid",
+    "report_present",
+    "archived",
+    "is_github_workflow",
+    "email",
+    "conclusion",
+    "pr_number",
+    "started_date",
+    "size_bytes",
+    "created_at",
+    "signature",
+    "documents",
+)
+"""
+The columns of the table: The fields of 'CatalogEntry'.
+"""
+
+EXPIRY_NEVER = "never"
+EXPIRY_TRASH = "trash"
+
+TIMEOUT_S = 10.0
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class CatalogEntry:
+    label: str
+    "Example: github_selfhosted_testrun_107"
+    sortable: str
+    "See 'util_github2.BaseDirectory.sortable'"
+    expiry: str
+    "Example: 2025-05-27, 'never', 'trash'"
+    is_valid: bool
+    report_present: bool
+    "False: Only metadata exists"
+    archived: bool
+    "The report has expired and is served from DIRECTORY_REPORTS_COLD, see 'util_report_archive.archive_cold()'"
+    is_github_workflow: bool
+    email: str
+    "Example: buhtig.hans.maerki@ergoinfo.ch"
+    conclusion: str
+    "Example: success, failure, in_progress"
+    pr_number: str
+    "Example: 4711"
+    started_date: str
+    "Example: 2025-05-27. Empty if unknown"
+    size_bytes: int
+    "On disk, without the files in the blob store (see 'util_blobstore'). Archived: The archive"
+    created_at: float
+    "Seconds since the epoch"
+    signature: str
+    documents: dict[str, typing.Any]
+    "The json documents read, for example {'expiry': {...}}. Do not modify!"
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class PurgeTick:
+    started_at: float
+    "Seconds since the epoch"
+    duration_s: float
+    reports_due: int
+    "Expired reports found using the index"
+    reports_expired: int
+    "Reports trashed"
+    reports_archived: int
+    "Reports compacted into DIRECTORY_REPORTS_COLD"
+    metadata_purged: int
+    reports_evicted: int
+    "See 'util_github2.evict_reports()'"
+
+    @property
+    def started_at_text(self) -> str:
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at))
+
+
+BOOLEAN_COLUMNS = {"is_valid", "report_present", "archived", "is_github_workflow"}
+
+
+def _to_row(entry: CatalogEntry) -> tuple[typing.Any, ...]:
+    return tuple(
+        json.dumps(entry.documents) if column == "documents" else getattr(entry, column)
+        for column in COLUMNS
+    )
+
+
+def _from_row(row: tuple[typing.Any, ...]) -> CatalogEntry:
+    values: dict[str, typing.Any] = dict(zip(COLUMNS, row, strict=True))
+    for column in BOOLEAN_COLUMNS:
+        values[column] = bool(values[column])
+    values["documents"] = json.loads(values["documents"])
+    return CatalogEntry(**values)
+
+
+class Workflow(enum.StrEnum):
+    GITHUB = "github"
+    MANUAL = "manual"
+    "Started manually using 'mptest'"
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class ReportFilter:
+    """
+    Empty fields do not filter.
+    """
+
+    author: str = ""
+    "Case insensitive substring of the email: No index, the valid reports are scanned"
+    conclusion: str = ""
+    pr_number: str = ""
+    started_from: str = ""
+    "Example: 2025-05-01, inclusive"
+    started_to: str = ""
+    "Example: 2025-05-31, inclusive"
+    workflow: Workflow | None = None
+    archived: bool = False
+    "Only the archived reports: Their expiry has passed, they are listed anyway"
+
+    def where(self) -> tuple[list[str], list[typing.Any]]:
+        """
+        Returns the sql conditions and their parameters.
+        """
+        conditions: list[str] = []
+        params: list[typing.Any] = []
+        if self.author:
+            conditions.append("instr(lower(email), ?) > 0")
+            params.append(self.author.lower())
+        if self.conclusion:
+            conditions.append("conclusion = ?")
+            params.append(self.conclusion)
+        if self.pr_number:
+            conditions.append("pr_number = ?")
+            params.append(self.pr_number)
+        if self.started_from:
+            conditions.append("started_date >= ?")
+            params.append(self.started_from)
+        if self.started_to:
+            conditions.append("started_date != '' AND started_date <= ?")
+            params.append(self.started_to)
+        if self.workflow is not None:
+            conditions.append("is_github_workflow = ?")
+            params.append(self.workflow is Workflow.GITHUB)
+        if self.archived:
+            conditions.append("archived = 1")
+        return conditions, params
+
+
+class ReportCatalog:
+    def __init__(self, filename: pathlib.Path) -> None:
+        self.filename = filename
+
+    @contextlib.contextmanager
+    def _connect(self) -> typing.Iterator[sqlite3.Connection]:
+        """
+        A connection per call: The web server and the celery worker share the database.
+        """
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.filename, timeout=TIMEOUT_S)
+        try:
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                with connection:
+                    connection.execute("DROP TABLE IF EXISTS reports")
+                    connection.execute("DROP TABLE IF EXISTS purge_ticks")
+                    connection.execute("DROP TABLE IF EXISTS report_access")
+                    connection.executescript(SCHEMA)
+                    connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                connection.execute("PRAGMA journal_mode = WAL")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def upsert(self, entries: typing.Iterable[CatalogEntry]) -> None:
+        with self._connect() as connection:
+            connection.executemany(
+                f"""INSERT OR REPLACE INTO reports ({", ".join(COLUMNS)})
+                VALUES ({", ".join("?" * len(COLUMNS))})""",
+                (_to_row(e) for e in entries),
+            )
+
+    def delete(self, labels: typing.Iterable[str]) -> None:
+        rows = [(label,) for label in labels]
+        with self._connect() as connection:
+            connection.executemany("DELETE FROM reports WHERE label = ?", rows)
+            connection.executemany("DELETE FROM report_access WHERE label = ?", rows)
+
+    def record_access(self, label: str, accessed_at: float) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO report_access VALUES (?, ?)",
+                (label, accessed_at),
+            )
+
+    def total_bytes(self) -> int:
+        """
+        The reports on disk without the blob store, see 'util_github2.reports_bytes()'.
+        """
+        with self._connect() as connection:
+            return connection.execute(
+                "SELECT COALESCE(SUM(size_bytes), 0) FROM reports WHERE report_present = 1"
+            ).fetchone()[0]
+
+    def archived_bytes(self) -> int:
+        """
+        The archives in DIRECTORY_REPORTS_COLD.
+        """
+        with self._connect() as connection:
+            return connection.execute(
+                "SELECT COALESCE(SUM(size_bytes), 0) FROM reports WHERE archived = 1"
+            ).fetchone()[0]
+
+    def eviction_candidates(self) -> list[tuple[str, int]]:
+        """
+        (label, size_bytes) of the reports on disk which may be evicted:
+        The least recently accessed first. Reports never accessed count as accessed when created.
+        """
+        with self._connect() as connection:
+            return list(
+                connection.execute(
+                    """SELECT reports.label, size_bytes FROM reports
+                    LEFT JOIN report_access ON reports.label = report_access.label
+                    WHERE report_present = 1 AND expiry != ?
+                    ORDER BY COALESCE(accessed_at, created_at)""",
+                    (EXPIRY_NEVER,),
+                )
+            )
+
+    def signatures(self) -> dict[str, str]:
+        """
+        label -> signature
+        """
+        with self._connect() as connection:
+            return dict(connection.execute("SELECT label, signature FROM reports"))
+
+    def __len__(self) -> int:
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+
+    def due(self, today: str) -> list[str]:
+        """
+        The labels of the valid reports which expired, the oldest expiry first.
+        Uses the index 'reports_due': Only the expired rows are read.
+        """
+        with self._connect() as connection:
+            return [
+                label
+                for (label,) in connection.execute(
+                    """SELECT label FROM reports
+                    WHERE report_present = 1 AND (expiry < ? OR expiry = ?) AND is_valid = 1
+                    ORDER BY expiry""",
+                    (today, EXPIRY_TRASH),
+                )
+            ]
+
+    def metadata_only(self) -> list[str]:
+        """
+        The labels with metadata but without report: Neither on disk nor archived.
+        """
+        with self._connect() as connection:
+            return [
+                label
+                for (label,) in connection.execute(
+                    "SELECT label FROM reports WHERE report_present = 0 AND archived = 0"
+                )
+            ]
+
+    def record_tick(self, purge_tick: PurgeTick) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO purge_ticks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                dataclasses.astuple(purge_tick),
+            )
+            connection.execute(
+                """DELETE FROM purge_ticks WHERE started_at < (
+                    SELECT started_at FROM purge_ticks
+                    ORDER BY started_at DESC LIMIT 1 OFFSET ?)""",
+                (PURGE_TICKS_MAX - 1,),
+            )
+
+    def purge_ticks(self, limit: int) -> list[PurgeTick]:
+        """
+        The latest first.
+        """
+        with self._connect() as connection:
+            return [
+                PurgeTick(*row)
+                for row in connection.execute(
+                    "SELECT * FROM purge_ticks ORDER BY started_at DESC LIMIT ?",
+                    (limit,),
+                )
+            ]
+
+    @staticmethod
+    def _where(
+        today: str,
+        including_expired: bool,
+        report_filter: ReportFilter | None,
+    ) -> tuple[str, list[typing.Any]]:
+        conditions = ["is_valid = 1"]
+        params: list[typing.Any] = []
+        if report_filter is not None and report_filter.archived:
+            including_expired = True
+        if not including_expired:
+            conditions.append("expiry != ? AND (expiry = ? OR expiry >= ?)")
+            params += [EXPIRY_TRASH, EXPIRY_NEVER, today]
+        if report_filter is not None:
+            filter_conditions, filter_params = report_filter.where()
+            conditions += filter_conditions
+            params += filter_params
+        return " AND ".join(conditions), params
+
+    def count(
+        self,
+        today: str,
+        including_expired: bool = False,
+        report_filter: ReportFilter | None = None,
+    ) -> int:
+        where, params = self._where(today, including_expired, report_filter)
+        with self._connect() as connection:
+            return connection.execute(
+                f"SELECT COUNT(*) FROM reports WHERE {where}", params
+            ).fetchone()[0]
+
+    def query(
+        self,
+        today: str,
+        including_expired: bool = False,
+        report_filter: ReportFilter | None = None,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> list[CatalogEntry]:
+        """
+        The valid reports, the newest first.
+        today: Example 2025-05-27. Reports with an expiry before 'today' have expired.
+        """
+        where, params = self._where(today, including_expired, report_filter)
+        sql = f"""SELECT {", ".join(COLUMNS)} FROM reports
+            WHERE {where} ORDER BY sortable DESC LIMIT ? OFFSET ?"""
+        params += [-1 if limit is None else limit, offset]
+        with self._connect() as connection:
+            return [_from_row(row) for row in connection.execute(sql, params)]
@@ -1,9 +1,19 @@
 import logging
 import os
+import time
 
 from celery import Celery
-
-from . import util_github2, util_webhooks
+from celery.signals import worker_ready
+
+from . import (
+    constants,
+    util_blobstore,
+    util_github2,
+    util_prerender,
+    util_trash,
+    util_upload_session,
+    util_webhooks,
+)
 
 logger = logging.getLogger(__file__)
 
@@ -21,9 +31,22 @@ app.conf.beat_schedule = {
         "task": "app.util_celery_tasks.recurring_job",
         "schedule": 300.0,
         # "schedule": 10.0,
-    }
+    },
+    "empty_trash": {
+        "task": "app.util_celery_tasks.empty_trash",
+        "schedule": 60.0,
+    },
+    "daily_job": {
+        "task": "app.util_celery_tasks.daily_job",
+        "schedule": 24 * 3600.0,
+    },
 }
 
+EMPTY_TRASH_TIME_BUDGET_S = 50.0
+"""
+Less than the schedule of 'empty_trash': The worker runs other tasks in between.
+"""
+
 
 @app.task
 def ping() -> str:
@@ -32,6 +55,18 @@ def ping() -> str:
 
 
 def run_recurring_job() -> None:
+    """
+    Every 300s: Only work proportional to what changed, see 'run_daily_job()'.
+    """
+    time_start = time.monotonic()
+
+    sessions_purged = util_upload_session.purge_expired_sessions(
+        directory_spool=constants.DIRECTORY_REPORTS_SPOOL,
+        expiry_s=constants.UPLOAD_SESSION_EXPIRY_S,
+    )
+    if sessions_purged > 0:
+        logger.info(f"purge_expired_sessions(): {sessions_purged=}")
+
     try:
         gh_list = util_github2.get_gh_list()
     except Exception:
@@ -42,9 +77,8 @@ def run_recurring_job() -> None:
         logger.info("Octoprobe test in progress...")
         return
 
-    reports_expired, metadata_purged = util_github2.puge_reports()
-    if reports_expired + metadata_purged > 0:
-        logger.info(f"puge_reports(): {reports_expired=} {metadata_purged=}")
+    purge_tick = util_github2.puge_reports(time_start=time_start)
+    logger.info(f"puge_reports(): {purge_tick}")
 
     for repo in util_webhooks.REPOS:
         if util_webhooks.Webhooks.recurring_job(
@@ -60,5 +94,70 @@ def recurring_job() -> str:
     return "recurring_job"
 
 
+def run_daily_job() -> None:
+    """
+    Scans all reports and blobs: Repairs what the recurring job might have missed.
+    """
+    reports_updated = util_github2.sync_catalog()
+    if reports_updated > 0:
+        logger.info(f"sync_catalog(): {reports_updated=}")
+
+    expiries_written = util_github2.persist_default_expiries()
+    if expiries_written > 0:
+        logger.info(f"persist_default_expiries(): {expiries_written=}")
+
+    blobs_purged = util_blobstore.BLOBSTORE.gc()
+    if blobs_purged > 0:
+        logger.info(f"BLOBSTORE.gc(): {blobs_purged=}")
+
+
+@app.task
+def daily_job() -> str:
+    run_daily_job()
+    return "daily_job"
+
+
+@worker_ready.connect
+def on_worker_ready(**kwargs) -> None:
+    """
+    Beat runs 'daily_job' a day after it started: Also run it at startup.
+    """
+    daily_job.delay()
+
+
+@app.task
+def empty_trash() -> str:
+    progress = util_trash.TRASH.empty(
+        files_per_s=constants.TRASH_FILES_PER_S,
+        workers=constants.TRASH_WORKERS,
+        time_budget_s=EMPTY_TRASH_TIME_BUDGET_S,
+    )
+    if progress.files_deleted > 0:
+        logger.info(f"empty_trash(): {progress.text}")
+        if progress.directories == 0:
+            # The last links of the blobs of the deleted reports are in the blob store
+            blobs_purged = util_blobstore.BLOBSTORE.gc()
+            logger.info(f"BLOBSTORE.gc(): {blobs_purged=}")
+    return "empty_trash"
+
+
+@app.task
+def prerender_report(label: str) -> int:
+    """
+    Scheduled by '/upload', see 'util_prerender'.
+    """
+    return util_prerender.prerender_report(label=label)
+
+
+def schedule_prerender_report(label: str) -> None:
+    """
+    Never fails: An upload must not fail because the broker is not available.
+    """
+    try:
+        prerender_report.delay(label)
+    except Exception:
+        logger.exception(f"{label}: Failed to schedule prerender_report()")
+
+
 if __name__ == "__main__":
     run_recurring_job()
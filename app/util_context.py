@@ -1,34 +1,98 @@
+"""
+The context of a report: 'context.json' in the top directory of the report.
+
+The parsed context is cached per process: A log view does not read and parse
+'context.json' again. The key is the identity (inode, size, mtime) of 'context.json':
+A re-uploaded report is read again.
+"""
+
+from __future__ import annotations
+
+import dataclasses
 import json
-import pathlib
+import typing
 
 from octoprobe.util_constants import DirectoryTag
+from testbed_micropython.report_test.util_baseclasses import ResultContext
 from testbed_micropython.report_test.util_constants import FILENAME_CONTEXT_JSON
 
-from . import constants, util_path_replace
+from . import constants, util_lru, util_path_replace, util_report_archive
 
 
-def get_directory_testresults(logfile: pathlib.Path) -> pathlib.Path:
-    logfile_relative = logfile.relative_to(constants.DIRECTORY_REPORTS)
-    directoryname_testresults = logfile_relative.parts[0]
-    directory_testresults = constants.DIRECTORY_REPORTS / directoryname_testresults
+def get_directory_testresults(
+    logfile: util_report_archive.ReportFile,
+) -> util_report_archive.ReportFile:
+    directory_testresults = util_report_archive.report_root(
+        logfile, directory_reports=constants.DIRECTORY_REPORTS
+    )
     assert directory_testresults.is_dir(), directory_testresults
     return directory_testresults
 
 
+def get_context_filename(
+    directory_testresults: util_report_archive.ReportFile,
+) -> util_report_archive.ReportFile:
+    return directory_testresults / FILENAME_CONTEXT_JSON
+
+
+@dataclasses.dataclass(slots=True)
+class ReportContext:
+    label: str
+    context_json: dict[str, typing.Any]
+    "Shared by all users of the cache: Do not modify!"
+    _path_replace: util_path_replace.PathReplace | None = None
+    _result_context: ResultContext | None = None
+
+    @property
+    def path_replace(self) -> util_path_replace.PathReplace:
+        if self._path_replace is None:
+            self._path_replace = util_path_replace.PathReplace(
+                directories=self.context_json["directories"],
+                git_ref=self.context_json["git_ref"],
+                urls={
+                    # DirectoryTag.R: f"https://reports.octoprobe.org/{label}",
+                    DirectoryTag.R: f"/{self.label}/",
+                    DirectoryTag.T: "http://t/",
+                },
+            )
+        return self._path_replace
+
+    @property
+    def result_context(self) -> ResultContext:
+        if self._result_context is None:
+            self._result_context = ResultContext.from_dict(json_dict=self.context_json)
+        return self._result_context
+
+
+CACHE_SIZE = 256
+_CACHE: util_lru.LruCache[tuple[str, int, int, int], ReportContext] = util_lru.LruCache(
+    maxsize=CACHE_SIZE
+)
+
+
+def get_report_context(
+    directory_testresults: util_report_archive.ReportFile,
+) -> ReportContext:
+    context_filename = get_context_filename(directory_testresults)
+    stat_result = util_report_archive.stat(context_filename)
+    key = (
+        str(context_filename),
+        stat_result.st_ino,
+        stat_result.st_size,
+        stat_result.st_mtime_ns,
+    )
+    report_context = _CACHE.get(key)
+    if report_context is None:
+        assert context_filename.is_file(), context_filename
+        report_context = ReportContext(
+            label=util_report_archive.report_label(directory_testresults),
+            context_json=json.loads(context_filename.read_text()),
+        )
+        _CACHE.put(key, report_context)
+    return report_context
+
+
 def get_path_replace(
-    directory_testresults: pathlib.Path,
+    directory_testresults: util_report_archive.ReportFile,
 ) -> util_path_replace.PathReplace:
-    context_filename = directory_testresults / FILENAME_CONTEXT_JSON
-    assert context_filename.is_file(), context_filename
-    context_text = context_filename.read_text()
-    context_json = json.loads(context_text)
-
-    return util_path_replace.PathReplace(
-        directories=context_json["directories"],
-        git_ref=context_json["git_ref"],
-        urls={
-            # DirectoryTag.R: f"https://reports.octoprobe.org/{directory_testresults.name}",
-            DirectoryTag.R: f"/{directory_testresults.name}/",
-            DirectoryTag.T: "http://t/",
-        },
-    )
+    return get_report_context(directory_testresults).path_replace
@@ -0,0 +1,118 @@
+"""
+Serve the files of a report without loading them into memory.
+
+* Files on disk: 'FileResponse' - sendfile capable (pathsend), HTTP Range requests.
+* Members of an archive: Streamed in chunks.
+
+Uploaded reports never change: Strong ETags and 'Last-Modified' allow
+the browser to revalidate and get a '304 Not Modified' without any body bytes.
+"""
+
+from __future__ import annotations
+
+import email.utils
+import os
+import pathlib
+import typing
+import zipfile
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from . import util_report_archive
+
+CHUNK_SIZE_BYTES = 64 * 1024
+
+CACHE_CONTROL = "public, no-cache"
+"""
+'no-cache': The browser may cache but has to revalidate (ETag), as a report may be re-uploaded.
+"""
+
+
+def etag(
+    report_file: util_report_archive.ReportFile, stat_result: os.stat_result
+) -> str:
+    """
+    Strong ETag derived from inode, size and mtime.
+    For a member of an archive: Additionally the crc of the member.
+    """
+    tag = f"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"
+    if isinstance(report_file, zipfile.Path):
+        zinfo = report_file.root.getinfo(report_file.at)
+        tag += f"-{zinfo.CRC:x}"
+    return f'"{tag}"'
+
+
+def etag_matches(request: Request, etag_: str) -> bool:
+    """
+    True if 'If-None-Match' contains 'etag_'.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return ("*" in tags) or (etag_ in tags)
+
+
+def is_not_modified(
+    request: Request,
+    etag_: str,
+    stat_result: os.stat_result,
+) -> bool:
+    """
+    See https://httpwg.org/specs/rfc9110.html#evaluation
+    """
+    if "if-none-match" in request.headers:
+        return etag_matches(request=request, etag_=etag_)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return int(stat_result.st_mtime) <= since.timestamp()
+
+    return False
+
+
+def file_response(
+    request: Request,
+    report_file: util_report_archive.ReportFile,
+    media_type: str,
+    download_filename: str | None = None,
+) -> Response:
+    stat_result = util_report_archive.stat(report_file)
+    headers = {
+        "etag": etag(report_file, stat_result),
+        "last-modified": email.utils.formatdate(stat_result.st_mtime, usegmt=True),
+        "cache-control": CACHE_CONTROL,
+    }
+
+    if is_not_modified(request=request, etag_=headers["etag"], stat_result=stat_result):
+        return Response(status_code=304, headers=headers)
+
+    if isinstance(report_file, pathlib.Path):
+        return FileResponse(
+            path=report_file,
+            headers=headers,
+            media_type=media_type,
+            filename=download_filename,
+            stat_result=stat_result,
+        )
+
+    if download_filename is not None:
+        headers["content-disposition"] = f'attachment; filename="{download_filename}"'
+    zinfo = report_file.root.getinfo(report_file.at)
+    headers["content-length"] = str(zinfo.file_size)
+
+    def iter_member() -> typing.Iterator[bytes]:
+        with report_file.open("rb") as f:
+            while chunk := f.read(CHUNK_SIZE_BYTES):
+                yield chunk
+
+    return StreamingResponse(
+        content=iter_member(),
+        headers=headers,
+        media_type=media_type,
+    )
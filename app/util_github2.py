@@ -4,10 +4,15 @@ import dataclasses
 import datetime
 import json
 import logging
+import os
 import pathlib
 import re
 import shutil
+import sqlite3
+import threading
 import time
+import typing
+import zipfile
 
 from git_cached_repo.git_cached_repo import GitMetadata, GitSpec
 from markupsafe import Markup
@@ -18,18 +23,44 @@ from testbed_micropython.report_test.util_push_testresults import (
 )
 
 from app.constants import (
+    ARCHIVE_EXPIRED_REPORTS,
     DIRECTORY_REPORTS,
+    DIRECTORY_REPORTS_COLD,
     DIRECTORY_REPORTS_METADATA,
     FILENAME_EXPIRY,
     FILENAME_GH_LIST_JSON,
     FILENAME_INPUTS_JSON,
+    FILENAME_REPORTS_CATALOG,
+    STORAGE_HIGH_WATERMARK_BYTES,
+    STORAGE_LOW_WATERMARK_BYTES,
     assert_directory_reports,
 )
 
-from . import util_github
+from . import (
+    util_blobstore,
+    util_catalog,
+    util_context,
+    util_github,
+    util_lru,
+    util_report_archive,
+    util_trash,
+)
 
 logger = logging.getLogger(__file__)
 
+CATALOG = util_catalog.ReportCatalog(filename=FILENAME_REPORTS_CATALOG)
+
+LIST_REPORTS_PAGE_SIZE = 100
+"""
+The number of reports shown on '/'.
+"""
+
+ARCHIVE_TIME_BUDGET_S = 120.0
+"""
+Archiving is slow: A purge tick stops archiving after this time.
+The remaining expired reports are archived by the next tick.
+"""
+
 
 @dataclasses.dataclass(slots=True)
 class WorkflowInput:
@@ -92,6 +123,7 @@ def save_as_workflow_input(
     filename = directory_metadata / FILENAME_INPUTS_JSON
     filename.parent.mkdir(parents=True, exist_ok=True)
     filename.write_text(json_text)
+    update_catalog(labels=[directory_metadata.name])
 
 
 def run_job2(form_startjob: util_github.FormStartJob) -> util_github.ReturncodeStartJob:
@@ -181,8 +213,12 @@ class WorkflowJob:
         )
 
 
-EXPIRY_TRASH = "trash"
-EXPIRY_NEVER = "never"
+EXPIRY_TRASH = util_catalog.EXPIRY_TRASH
+EXPIRY_NEVER = util_catalog.EXPIRY_NEVER
+EXPIRY_DAYS = 30
+"""
+The expiry of a report without 'expiry.json'.
+"""
 
 
 @dataclasses.dataclass(slots=True)
@@ -207,6 +243,14 @@ class WorkflowExpiry:
         now_date = WorkflowExpiry.format_expiry(0)
         return now_date > self.expiry
 
+    @property
+    def archive_when_expired(self) -> bool:
+        """
+        True: The report will be archived, see 'archive_report()'.
+        False: The report will be deleted.
+        """
+        return ARCHIVE_EXPIRED_REPORTS and self.expiry != EXPIRY_TRASH
+
     @property
     def expiry_markup(self) -> Markup:
         if self.expiry:
@@ -214,39 +258,68 @@ class WorkflowExpiry:
         return Markup("")
 
     @staticmethod
-    def format_expiry(days: int) -> str:
+    def format_expiry(days: int, start: float | None = None) -> str:
         """
         Return the expiry date in the form "2025-08-16"
+        start: Seconds since the epoch, default: now
         """
-        d = time.time() + days * 24 * 3600
+        if start is None:
+            start = time.time()
+        d = start + days * 24 * 3600
         return datetime.datetime.fromtimestamp(d).strftime("%Y-%m-%d")
 
     @staticmethod
     def default() -> WorkflowExpiry:
-        return WorkflowExpiry(tag="", expiry=WorkflowExpiry.format_expiry(30))
+        return WorkflowExpiry(tag="", expiry=WorkflowExpiry.format_expiry(EXPIRY_DAYS))
+
+    @staticmethod
+    def default_for(workflow_unique_id: str) -> WorkflowExpiry:
+        """
+        EXPIRY_DAYS after the report (or its metadata) has been created.
+        Stable over time: May be computed on every read.
+        """
+        return WorkflowExpiry(
+            tag="",
+            expiry=WorkflowExpiry.format_expiry(
+                EXPIRY_DAYS, start=created_at(label=workflow_unique_id)
+            ),
+        )
 
-    def write(self, workflow_unique_id: str) -> None:
+    @staticmethod
+    def filename(workflow_unique_id: str) -> pathlib.Path:
         base_directory = workflow_unique_id
-        filename = DIRECTORY_REPORTS_METADATA / base_directory / FILENAME_EXPIRY
+        return DIRECTORY_REPORTS_METADATA / base_directory / FILENAME_EXPIRY
+
+    def write(self, workflow_unique_id: str) -> pathlib.Path:
+        """
+        Atomic, the file is synced but not the directory: See 'write_expiries()'.
+        Returns the filename written.
+        """
+        filename = self.filename(workflow_unique_id=workflow_unique_id)
         filename.parent.mkdir(parents=True, exist_ok=True)
         json_text = json.dumps(dataclasses.asdict(self), indent=4)
-        filename.write_text(json_text)
+        filename_tmp = filename.with_suffix(".tmp")
+        with filename_tmp.open("w") as f:
+            f.write(json_text)
+            f.flush()
+            os.fsync(f.fileno())
+        filename_tmp.replace(filename)
+        return filename
 
     def trash(self, workflow_unique_id: str) -> bool:
         base_directory = workflow_unique_id
-        directory = DIRECTORY_REPORTS / base_directory
-        if directory.is_dir():
-            shutil.rmtree(directory, ignore_errors=True)
-            return True
-        return False
+        # Returns immediately: The files are deleted in the background
+        trashed = util_trash.TRASH.move(DIRECTORY_REPORTS / base_directory)
+        trashed_cold = util_trash.TRASH.move(DIRECTORY_REPORTS_COLD / base_directory)
+        return trashed or trashed_cold
 
     @staticmethod
     def read_or_default(workflow_unique_id: str) -> WorkflowExpiry:
         """
         Example: workflow_unique_id
+        Read only: If 'expiry.json' is missing, see 'default_for()' and 'persist_default_expiries()'.
         """
-        base_directory = workflow_unique_id
-        expiry_json = DIRECTORY_REPORTS_METADATA / base_directory / FILENAME_EXPIRY
+        expiry_json = WorkflowExpiry.filename(workflow_unique_id=workflow_unique_id)
         if expiry_json.is_file():
             try:
                 json_text = expiry_json.read_text()
@@ -255,9 +328,142 @@ class WorkflowExpiry:
             except Exception as e:
                 logger.debug(f"{expiry_json}: {e!r}")
 
-        workflow_expiry = WorkflowExpiry.default()
-        workflow_expiry.write(workflow_unique_id=workflow_unique_id)
-        return workflow_expiry
+        return WorkflowExpiry.default_for(workflow_unique_id=workflow_unique_id)
+
+    @staticmethod
+    def is_valid_expiry(expiry: str) -> bool:
+        if expiry in (EXPIRY_NEVER, EXPIRY_TRASH):
+            return True
+        try:
+            datetime.date.fromisoformat(expiry)
+        except ValueError:
+            return False
+        return len(expiry) == len("2025-08-16")
+
+
+def created_at(label: str) -> float | None:
+    """
+    The report (or its metadata) has been created: Seconds since the epoch.
+    """
+    for directory in (DIRECTORY_REPORTS, DIRECTORY_REPORTS_METADATA):
+        try:
+            return (directory / label).stat().st_mtime
+        except OSError:
+            continue
+    return None
+
+
+def _iter_stat(directory: str) -> typing.Iterator[os.stat_result]:
+    """
+    The files in 'directory', recursively.
+    """
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from _iter_stat(entry.path)
+                else:
+                    yield entry.stat(follow_symlinks=False)
+    except FileNotFoundError:
+        pass
+
+
+def directory_size_bytes(directory: str) -> int:
+    """
+    The space used on disk by the files in 'directory' not shared with the blob store.
+    The blobs are counted once, see 'reports_bytes()'.
+    """
+    return sum(
+        stat_result.st_blocks * 512
+        for stat_result in _iter_stat(directory)
+        if stat_result.st_nlink == 1
+    )
+
+
+def reports_bytes() -> int:
+    """
+    The space used by the reports on disk: Each inode is counted once.
+    """
+    return CATALOG.total_bytes() + util_blobstore.BLOBSTORE.stats().blobs_bytes
+
+
+def reclaimable_bytes(directory: str, links: dict[int, int]) -> int:
+    """
+    The space freed when 'directory' is deleted and 'BlobStore.gc()' has run.
+    A blob is freed once the blob store holds its last link.
+    links: inode -> links left: Updated for the next directory to be deleted
+    """
+    total = 0
+    for stat_result in _iter_stat(directory):
+        links_left = links.get(stat_result.st_ino, stat_result.st_nlink) - 1
+        links[stat_result.st_ino] = links_left
+        if links_left == 0 or (links_left == 1 and stat_result.st_nlink > 1):
+            total += stat_result.st_blocks * 512
+    return total
+
+
+def fsync_directory(directory: pathlib.Path) -> None:
+    """
+    Makes the renames in 'directory' durable.
+    """
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_expiries(expiries: dict[str, WorkflowExpiry]) -> None:
+    """
+    label -> expiry
+    Every file is synced, then every directory once: Not the whole host.
+    The catalog is updated in one transaction.
+    """
+    if len(expiries) == 0:
+        return
+    directories: set[pathlib.Path] = set()
+    for label, workflow_expiry in expiries.items():
+        filename = workflow_expiry.write(workflow_unique_id=label)
+        # A new report directory: Its entry in DIRECTORY_REPORTS_METADATA as well
+        directories.update((filename.parent, filename.parent.parent))
+    for directory in sorted(directories):
+        fsync_directory(directory)
+    update_catalog(labels=expiries.keys())
+
+
+def update_expiries(
+    labels: typing.Iterable[str], tag: str | None, expiry: str | None
+) -> None:
+    """
+    None: Keep the current value.
+    EXPIRY_TRASH: The reports are moved to the trash right away.
+    """
+    expiries: dict[str, WorkflowExpiry] = {}
+    for label in labels:
+        workflow_expiry = WorkflowExpiry.read_or_default(workflow_unique_id=label)
+        if tag is not None:
+            workflow_expiry.tag = tag
+        if expiry is not None:
+            workflow_expiry.expiry = expiry
+        if workflow_expiry.expiry == EXPIRY_TRASH:
+            workflow_expiry.trash(workflow_unique_id=label)
+        expiries[label] = workflow_expiry
+    write_expiries(expiries)
+
+
+def persist_default_expiries() -> int:
+    """
+    Writes 'expiry.json' for all reports without.
+    Called in the background: Loading a report never writes.
+    Returns the number of files written.
+    """
+    expiries = {
+        label: WorkflowExpiry.default_for(workflow_unique_id=label)
+        for label in sorted(report_names())
+        if not WorkflowExpiry.filename(workflow_unique_id=label).is_file()
+    }
+    write_expiries(expiries)
+    return len(expiries)
 
 
 class BaseDirectory:
@@ -313,6 +519,15 @@ class BaseDirectory:
         # return self.base_directory
 
 
+RE_STARTED_DATE = re.compile(
+    r"(?P<year>\d{4})-?(?P<month>\d{2})-?(?P<day>\d{2})[-_]\d{2}-?\d{2}-?\d{2}$"
+)
+"""
+The start of a manual workflow is encoded in the label:
+"local_hostname_20250116-185542", "ch_hans_1-2025-04-22_12-33-22"
+"""
+
+
 @dataclasses.dataclass(slots=True)
 class WorkflowReport:
     base_directory: BaseDirectory
@@ -320,6 +535,12 @@ class WorkflowReport:
     expiry: WorkflowExpiry
     input: WorkflowInput | None
     result_context: ResultContext | None
+    report_present: bool = True
+    "False: Only the metadata exists"
+    archived: bool = False
+    "See 'CatalogEntry.archived'"
+    size_bytes: int = 0
+    "See 'CatalogEntry.size_bytes'"
 
     def __post_init__(self) -> None:
         assert isinstance(self.base_directory, BaseDirectory)
@@ -330,59 +551,45 @@ class WorkflowReport:
 
     @classmethod
     def factory(cls, base_directory: str) -> WorkflowReport:
-        workflow_job: WorkflowJob | None = None
-        workflow_input: WorkflowInput | None = None
-        workflow_expiry = WorkflowExpiry.default()
-        result_context: ResultContext | None = None
-
-        assert_directory_reports()
+        return cls.from_catalog_entry(read_catalog_entry(label=base_directory))
 
-        gh_list_json = (
-            DIRECTORY_REPORTS_METADATA / base_directory / FILENAME_GH_LIST_JSON
-        )
-        if gh_list_json.is_file():
-            try:
-                json_text = gh_list_json.read_text()
-                json_dict = json.loads(json_text)
-                workflow_job = WorkflowJob(**json_dict)
-            except Exception as e:
-                logger.debug(f"{gh_list_json}: {e!r}")
-
-        workflow_expiry = WorkflowExpiry.read_or_default(
-            workflow_unique_id=base_directory
-        )
-
-        inputs_json = DIRECTORY_REPORTS / base_directory / FILENAME_INPUTS_JSON
-        if not inputs_json.is_file():
-            # Metadata fallback
-            inputs_json = (
-                DIRECTORY_REPORTS_METADATA / base_directory / FILENAME_INPUTS_JSON
+    @classmethod
+    def from_catalog_entry(cls, entry: util_catalog.CatalogEntry) -> WorkflowReport:
+        key = (entry.label, entry.signature)
+        workflow_report = _CACHE_WORKFLOW_REPORTS.get(key)
+        if workflow_report is None:
+            workflow_report = cls.from_documents(
+                label=entry.label,
+                documents=entry.documents,
+                report_present=entry.report_present,
+                archived=entry.archived,
+                size_bytes=entry.size_bytes,
             )
-        if inputs_json.is_file():
-            try:
-                json_text = inputs_json.read_text()
-                json_dict = json.loads(json_text)
-                workflow_input = WorkflowInput(**json_dict)
-            except Exception as e:
-                logger.debug(f"{gh_list_json}: {e!r}")
-
-        context_json = (
-            DIRECTORY_REPORTS / base_directory / util_constants.FILENAME_CONTEXT_JSON
-        )
-        if context_json.is_file():
-            try:
-                json_text = context_json.read_text()
-                json_dict = json.loads(json_text)
-                result_context = ResultContext.from_dict(json_dict=json_dict)
-            except Exception as e:
-                logger.debug(f"{gh_list_json}: {e!r}")
+            _CACHE_WORKFLOW_REPORTS.put(key, workflow_report)
+        return workflow_report
 
+    @classmethod
+    def from_documents(
+        cls,
+        label: str,
+        documents: dict[str, typing.Any],
+        report_present: bool,
+        archived: bool,
+        size_bytes: int,
+    ) -> WorkflowReport:
         return WorkflowReport(
-            base_directory=BaseDirectory(base_directory=base_directory),
-            job=workflow_job,
-            expiry=workflow_expiry,
-            input=workflow_input,
-            result_context=result_context,
+            base_directory=BaseDirectory(base_directory=label),
+            job=_from_document(WorkflowJob, documents[DOCUMENT_GH_LIST]),
+            expiry=WorkflowExpiry(**documents[DOCUMENT_EXPIRY]),
+            input=_from_document(WorkflowInput, documents[DOCUMENT_INPUTS]),
+            result_context=(
+                None
+                if documents[DOCUMENT_CONTEXT] is None
+                else ResultContext.from_dict(json_dict=documents[DOCUMENT_CONTEXT])
+            ),
+            report_present=report_present,
+            archived=archived,
+            size_bytes=size_bytes,
         )
 
     @property
@@ -407,27 +614,57 @@ class WorkflowReport:
         return self.base_directory.is_github_workflow
 
     @property
-    def conclusion_status_markup(self) -> Markup:
-        def markup(conclusion: str) -> Markup:
-            link = f"/{self.base_directory.base_directory}/{util_constants.FILENAME_OCTOPROBE_SUMMARY_REPORT_STEM}.html"
-            return Markup(
-                f'<a href="{link}" target="_blank" title="Summary Report">{conclusion}</a>'
-            )
-
+    def conclusion(self) -> str:
+        """
+        Example: success, failure, in_progress, missing
+        """
         if not self.is_github_workflow:
             # This reports where sent from a manually started 'mptest'
-            conclusion = "success"
             if self.result_context is not None:
                 if self.result_context.error != "":
-                    conclusion = self.result_context.error
-            return markup(conclusion=conclusion)
+                    return self.result_context.error
+            return "success"
         if self.job is None:
-            return Markup("???")
+            return "???"
         if self.job.status in ("in_progress", "queued"):
-            return Markup(self.job.status)
-        if not (DIRECTORY_REPORTS / self.base_directory.base_directory).is_dir():
-            return Markup("missing")
-        return markup(conclusion=self.job.conclusion)
+            return self.job.status
+        if not (self.report_present or self.archived):
+            return "missing"
+        return self.job.conclusion
+
+    @property
+    def has_summary_report(self) -> bool:
+        if not self.is_github_workflow:
+            return True
+        return self.conclusion not in ("???", "in_progress", "queued", "missing")
+
+    @property
+    def conclusion_status_markup(self) -> Markup:
+        conclusion = self.conclusion
+        if not self.has_summary_report:
+            return Markup(conclusion)
+        link = f"/{self.base_directory.base_directory}/{util_constants.FILENAME_OCTOPROBE_SUMMARY_REPORT_STEM}.html"
+        return Markup(
+            f'<a href="{link}" target="_blank" title="Summary Report">{conclusion}</a>'
+        )
+
+    @property
+    def started_date(self) -> str:
+        """
+        Example: 2025-05-27. Empty if unknown.
+        """
+        if self.job is not None:
+            return self.job.startedAt[:10]
+        match = RE_STARTED_DATE.search(self.base_directory.base_directory)
+        if match is None:
+            return ""
+        return "-".join(match.group("year", "month", "day"))
+
+    @property
+    def pr_number(self) -> str:
+        if self.input is None:
+            return ""
+        return self.input.pr_number
 
     @property
     def repo_tests_commit_markup(self) -> Markup:
@@ -488,8 +725,14 @@ class WorkflowReport:
         return self.expiry.expired
 
     def trash_if_expired(self) -> bool:
-        if self.expiry.expired:
-            return self.expiry.trash(workflow_unique_id=self.unique_id)
+        if self.expiry.expired and self.report_present:
+            if self.expiry.archive_when_expired:
+                expired = archive_report(label=self.unique_id)
+            else:
+                expired = self.expiry.trash(workflow_unique_id=self.unique_id)
+            if expired:
+                update_catalog(labels=[self.unique_id])
+                return True
 
         return False
 
@@ -509,6 +752,20 @@ class WorkflowReport:
             return "-"
         return self.job.duration_text
 
+    @property
+    def repo_firmware(self) -> str:
+        if self.input is None:
+            assert self.result_context is not None
+            return self.result_context.ref_firmware
+        return self.input.repo_firmware
+
+    @property
+    def repo_tests(self) -> str:
+        if self.input is None:
+            assert self.result_context is not None
+            return self.result_context.ref_tests
+        return self.input.repo_tests
+
     @property
     def repo_firmware_markup(self) -> Markup | str:
         if self.input is None:
@@ -536,6 +793,236 @@ class WorkflowReport:
             return self.result_context.commandline
         return self.input.arguments
 
+    def as_dict(self) -> dict[str, typing.Any]:
+        """
+        See '/api/reports'.
+        """
+        return {
+            "label": self.unique_id,
+            "is_github_workflow": self.is_github_workflow,
+            "github_action_url": None if self.job is None else self.job.url,
+            "conclusion": self.conclusion,
+            "started_at": self.started_at_text,
+            "duration": str(self.duration_text),
+            "job_title": "" if self.input is None else self.input.job_title,
+            "pr_number": self.pr_number,
+            "email_testreport": self.email_testreport,
+            "arguments": self.arguments,
+            "repo_tests": str(self.repo_tests),
+            "repo_firmware": str(self.repo_firmware),
+            "expiry": self.expiry.expiry,
+            "tag": self.expiry.tag,
+            "archived": self.archived,
+        }
+
+
+DOCUMENT_GH_LIST = "gh_list"
+DOCUMENT_EXPIRY = "expiry"
+DOCUMENT_INPUTS = "inputs"
+DOCUMENT_CONTEXT = "context"
+"""
+The keys of 'CatalogEntry.documents'.
+"""
+
+_CACHE_WORKFLOW_REPORTS = util_lru.LruCache[tuple[str, str], WorkflowReport](
+    maxsize=10 * LIST_REPORTS_PAGE_SIZE
+)
+"""
+(label, signature) -> WorkflowReport
+"""
+
+_SYNC_LOCK = threading.Lock()
+_synced = False
+
+
+def _from_document(
+    cls: typing.Any, document: dict[str, typing.Any] | None
+) -> typing.Any:
+    if document is None:
+        return None
+    return cls(**document)
+
+
+def _read_document(
+    filename: util_report_archive.ReportFile, cls: typing.Any
+) -> dict[str, typing.Any] | None:
+    """
+    Returns None if the file does not exist or does not match 'cls'.
+    """
+    if not filename.is_file():
+        return None
+    try:
+        json_dict = json.loads(filename.read_text())
+        _from_document(cls, json_dict)
+        return json_dict
+    except Exception as e:
+        logger.debug(f"{filename}: {e!r}")
+        return None
+
+
+def catalog_signature(label: str) -> str:
+    """
+    The stat of all files read by 'read_catalog_entry()'.
+    """
+    directory_metadata = DIRECTORY_REPORTS_METADATA / label
+    directory_report = DIRECTORY_REPORTS / label
+    parts: list[str] = []
+    for filename in (
+        directory_metadata,
+        directory_metadata / FILENAME_GH_LIST_JSON,
+        directory_metadata / FILENAME_EXPIRY,
+        directory_metadata / FILENAME_INPUTS_JSON,
+        directory_report,
+        directory_report / util_report_archive.FILENAME_REPORT_ARCHIVE,
+        directory_report / FILENAME_INPUTS_JSON,
+        directory_report / util_constants.FILENAME_CONTEXT_JSON,
+        DIRECTORY_REPORTS_COLD / label / util_report_archive.FILENAME_REPORT_ARCHIVE,
+    ):
+        try:
+            stat_result = filename.stat()
+        except OSError:
+            parts.append("-")
+            continue
+        parts.append(
+            f"{stat_result.st_ino}:{stat_result.st_size}:{stat_result.st_mtime_ns}"
+        )
+    return ",".join(parts)
+
+
+def read_catalog_entry(label: str) -> util_catalog.CatalogEntry:
+    assert_directory_reports()
+
+    # Before reading: A file changing while reading is read again by 'sync_catalog()'
+    signature = catalog_signature(label=label)
+
+    gh_list_json = DIRECTORY_REPORTS_METADATA / label / FILENAME_GH_LIST_JSON
+    workflow_expiry = WorkflowExpiry.read_or_default(workflow_unique_id=label)
+
+    inputs_json: util_report_archive.ReportFile = util_report_archive.resolve(
+        f"{label}/{FILENAME_INPUTS_JSON}"
+    )
+    if not inputs_json.is_file():
+        # Metadata fallback
+        inputs_json = DIRECTORY_REPORTS_METADATA / label / FILENAME_INPUTS_JSON
+
+    context_json: dict[str, typing.Any] | None = None
+    directory_report = util_report_archive.resolve(label)
+    if util_context.get_context_filename(directory_report).is_file():
+        try:
+            report_context = util_context.get_report_context(directory_report)
+            # Validate
+            _ = report_context.result_context
+            context_json = report_context.context_json
+        except Exception as e:
+            logger.debug(f"{directory_report}: {e!r}")
+
+    documents = {
+        DOCUMENT_GH_LIST: _read_document(gh_list_json, WorkflowJob),
+        DOCUMENT_EXPIRY: dataclasses.asdict(workflow_expiry),
+        DOCUMENT_INPUTS: _read_document(inputs_json, WorkflowInput),
+        DOCUMENT_CONTEXT: context_json,
+    }
+    report_present = (DIRECTORY_REPORTS / label).is_dir()
+    archived = (not report_present) and (
+        DIRECTORY_REPORTS_COLD / label / util_report_archive.FILENAME_REPORT_ARCHIVE
+    ).is_file()
+    report_size_bytes = directory_size_bytes(
+        str((DIRECTORY_REPORTS_COLD if archived else DIRECTORY_REPORTS) / label)
+    )
+    workflow_report = WorkflowReport.from_documents(
+        label=label,
+        documents=documents,
+        report_present=report_present,
+        archived=archived,
+        size_bytes=report_size_bytes,
+    )
+    return util_catalog.CatalogEntry(
+        label=label,
+        sortable=workflow_report.base_directory.sortable,
+        expiry=workflow_expiry.expiry,
+        is_valid=workflow_report.is_valid,
+        report_present=report_present,
+        archived=archived,
+        is_github_workflow=workflow_report.is_github_workflow,
+        email=workflow_report.email_testreport,
+        conclusion=workflow_report.conclusion,
+        pr_number=workflow_report.pr_number,
+        started_date=workflow_report.started_date,
+        size_bytes=report_size_bytes,
+        created_at=created_at(label=label) or time.time(),
+        signature=signature,
+        documents=documents,
+    )
+
+
+def report_names() -> set[str]:
+    set_reports = set()
+    for d in (DIRECTORY_REPORTS, DIRECTORY_REPORTS_METADATA, DIRECTORY_REPORTS_COLD):
+        for f in d.glob(pattern="*"):
+            if f.is_dir():
+                set_reports.add(f.name)
+    return set_reports
+
+
+def update_catalog(labels: typing.Iterable[str]) -> None:
+    """
+    Call whenever files of these reports have been written or deleted.
+    Never fails: 'sync_catalog()' will repair the catalog.
+    """
+    entries: list[util_catalog.CatalogEntry] = []
+    labels_deleted: list[str] = []
+    for label in labels:
+        if not (
+            (DIRECTORY_REPORTS / label).is_dir()
+            or (DIRECTORY_REPORTS_METADATA / label).is_dir()
+            or (DIRECTORY_REPORTS_COLD / label).is_dir()
+        ):
+            labels_deleted.append(label)
+            continue
+        try:
+            entries.append(read_catalog_entry(label=label))
+        except Exception as e:
+            logger.warning(f"{label}: Failed to read report: {e!r}")
+    try:
+        CATALOG.delete(labels_deleted)
+        CATALOG.upsert(entries)
+    except sqlite3.Error as e:
+        logger.warning(f"{CATALOG.filename}: Failed to update: {e!r}")
+
+
+def sync_catalog() -> int:
+    """
+    Compares the catalog with DIRECTORY_REPORTS, DIRECTORY_REPORTS_METADATA and DIRECTORY_REPORTS_COLD.
+    Only reports with a changed 'catalog_signature()' are read.
+    Returns the number of reports updated.
+    """
+    assert_directory_reports()
+
+    names = report_names()
+    signatures = CATALOG.signatures()
+    # Deleted reports
+    labels_changed = sorted(set(signatures) - names)
+    labels_changed.extend(
+        label
+        for label in sorted(names)
+        if signatures.get(label) != catalog_signature(label=label)
+    )
+    update_catalog(labels=labels_changed)
+    return len(labels_changed)
+
+
+def _sync_catalog_once() -> None:
+    """
+    A newly started process does not know whether the catalog is up to date.
+    """
+    global _synced  # pylint: disable=global-statement
+    with _SYNC_LOCK:
+        if not _synced:
+            updated = sync_catalog()
+            if updated > 0:
+                logger.info(f"sync_catalog(): {updated} reports updated")
+            _synced = True
+
 
 @dataclasses.dataclass(slots=True, frozen=True)
 class GhList:
@@ -553,6 +1040,7 @@ def get_gh_list() -> GhList:
     jobs = util_github.get_gh_jobs()
     next_directory_metadata: pathlib.Path | None = None
     in_progress = False
+    labels_changed: list[str] = []
     for json_job in jobs:
         workflow_job = WorkflowJob(**json_job)  # type: ignore[arg-type]
         if next_directory_metadata is None:
@@ -564,8 +1052,14 @@ def get_gh_list() -> GhList:
             in_progress = True
         json_text = json.dumps(json_job, indent=4, sort_keys=True)
         filename = workflow_job.directory_metadata / FILENAME_GH_LIST_JSON
+        if filename.is_file() and filename.read_text() == json_text:
+            # Unchanged: Keep the catalog signature
+            continue
         filename.parent.mkdir(parents=True, exist_ok=True)
         filename.write_text(json_text)
+        labels_changed.append(workflow_job.base_directory)
+
+    update_catalog(labels=labels_changed)
 
     return GhList(
         in_progress=in_progress,
@@ -573,46 +1067,189 @@ def get_gh_list() -> GhList:
     )
 
 
-def list_reports(including_expired=False) -> list[WorkflowReport]:
-    def report_names() -> set[str]:
-        set_reports = set()
-        for d in (DIRECTORY_REPORTS, DIRECTORY_REPORTS_METADATA):
-            for f in d.glob(pattern="*"):
-                if f.is_dir():
-                    set_reports.add(f.name)
-        return set_reports
-
-    workflows = [
-        WorkflowReport.factory(base_directory) for base_directory in report_names()
-    ]
-    workflows = [w for w in workflows if w.is_valid]
-    if not including_expired:
-        workflows = [w for w in workflows if not w.expired]
-    return sorted(
-        workflows,
-        key=lambda wr: wr.base_directory.sortable,
-        reverse=True,
+def list_reports(
+    including_expired: bool = False,
+    report_filter: util_catalog.ReportFilter | None = None,
+    limit: int | None = None,
+    offset: int = 0,
+) -> list[WorkflowReport]:
+    """
+    The newest first. See 'util_catalog'.
+    """
+    _sync_catalog_once()
+    entries = CATALOG.query(
+        today=WorkflowExpiry.format_expiry(0),
+        including_expired=including_expired,
+        report_filter=report_filter,
+        limit=limit,
+        offset=offset,
+    )
+    return [WorkflowReport.from_catalog_entry(entry) for entry in entries]
+
+
+def count_reports(
+    including_expired: bool = False,
+    report_filter: util_catalog.ReportFilter | None = None,
+) -> int:
+    _sync_catalog_once()
+    return CATALOG.count(
+        today=WorkflowExpiry.format_expiry(0),
+        including_expired=including_expired,
+        report_filter=report_filter,
     )
 
 
-def puge_reports() -> tuple[int, int]:
-    reports_expired = 0
-    metadata_purged = 0
-    reports = list_reports()
+_ACCESSED_AT: dict[str, float] = {}
+"""
+label -> time of the last 'record_access()' written to the catalog
+"""
 
-    # Purge expored reports
-    for report in reports:
-        if report.trash_if_expired():
-            reports_expired += 1
+ACCESS_RESOLUTION_S = 3600.0
+"""
+The time of access is written at most once per hour and report.
+"""
+
+
+def access_due(label: str) -> bool:
+    """
+    False if the access has been recorded within ACCESS_RESOLUTION_S: No io.
+    """
+    return time.time() - _ACCESSED_AT.get(label, 0.0) >= ACCESS_RESOLUTION_S
+
+
+def record_access(label: str) -> None:
+    """
+    Called when a report is browsed. Never fails.
+    Blocking: Call it in a thread.
+    """
+    if not access_due(label=label):
+        return
+    if not (DIRECTORY_REPORTS / label).is_dir():
+        return
+    now = time.time()
+    try:
+        CATALOG.record_access(label=label, accessed_at=now)
+    except sqlite3.Error as e:
+        logger.warning(f"{CATALOG.filename}: Failed to record access: {e!r}")
+        return
+    _ACCESSED_AT[label] = now
+
+
+def evict_reports(high_watermark_bytes: int, low_watermark_bytes: int) -> int:
+    """
+    If the reports use more than 'high_watermark_bytes':
+    Moves the least recently accessed reports to the trash until below 'low_watermark_bytes'.
+    Reports with expiry 'never' are never evicted.
+    0: Disabled.
+    Returns the number of reports evicted.
+    """
+    if high_watermark_bytes <= 0:
+        return 0
+    total_bytes = reports_bytes()
+    if total_bytes <= high_watermark_bytes:
+        return 0
+    labels_evicted: list[str] = []
+    links: dict[int, int] = {}
+    for label, _report_size_bytes in CATALOG.eviction_candidates():
+        if total_bytes <= low_watermark_bytes:
+            break
+        # Measured before the move: Files shared with other reports free nothing
+        report_reclaimable_bytes = reclaimable_bytes(
+            str(DIRECTORY_REPORTS / label), links=links
+        )
+        if util_trash.TRASH.move(DIRECTORY_REPORTS / label):
+            logger.warning(
+                f"{label}: evicted ({report_reclaimable_bytes / 1e6:0.1f} MB), "
+                f"reports use {total_bytes / 1e6:0.1f} MB, low watermark {low_watermark_bytes / 1e6:0.1f} MB"
+            )
+            labels_evicted.append(label)
+            total_bytes -= report_reclaimable_bytes
+    update_catalog(labels=labels_evicted)
+    return len(labels_evicted)
+
+
+def archive_report(label: str) -> bool:
+    """
+    Compacts the report into DIRECTORY_REPORTS_COLD and moves the extracted report to the trash.
+    The report stays in the catalog ('CatalogEntry.archived') and is served from the archive.
+    If archiving fails, the report is kept: The next purge tick tries again.
+    """
+    try:
+        filename_zip = util_report_archive.archive_cold(label=label)
+    except (OSError, zipfile.BadZipFile) as e:
+        logger.warning(f"{label}: Failed to archive: {e!r}")
+        return False
+    report_size_bytes = directory_size_bytes(str(DIRECTORY_REPORTS / label))
+    util_trash.TRASH.move(DIRECTORY_REPORTS / label)
+    logger.info(
+        f"{label}: archived {report_size_bytes / 1e6:0.1f} MB "
+        f"into {filename_zip.stat().st_size / 1e6:0.1f} MB"
+    )
+    return True
+
+
+def puge_reports(time_start: float | None = None) -> util_catalog.PurgeTick:
+    """
+    Only the expired reports are touched: See 'ReportCatalog.due()'.
+    The duration of each call is recorded, see 'ReportCatalog.purge_ticks()'.
+    time_start: 'time.monotonic()' when the tick started, default: now
+    """
+    if time_start is None:
+        time_start = time.monotonic()
+    started_at = time.time() - (time.monotonic() - time_start)
+
+    # Archive or purge expired reports
+    labels_due = CATALOG.due(today=WorkflowExpiry.format_expiry(0))
+    labels_expired: list[str] = []
+    labels_archived: list[str] = []
+    for label in labels_due:
+        # The files are the truth: The catalog might be outdated
+        workflow_expiry = WorkflowExpiry.read_or_default(workflow_unique_id=label)
+        if not workflow_expiry.expired:
+            continue
+        if workflow_expiry.archive_when_expired:
+            if time.monotonic() - time_start > ARCHIVE_TIME_BUDGET_S:
+                # Still due: The next tick continues
+                continue
+            if archive_report(label=label):
+                labels_archived.append(label)
+            continue
+        if workflow_expiry.trash(workflow_unique_id=label):
+            labels_expired.append(label)
+    update_catalog(labels=labels_expired + labels_archived)
+
+    reports_evicted = evict_reports(
+        high_watermark_bytes=STORAGE_HIGH_WATERMARK_BYTES,
+        low_watermark_bytes=STORAGE_LOW_WATERMARK_BYTES,
+    )
 
     # Purge metadata
-    for dir_metadata in DIRECTORY_REPORTS_METADATA.glob(pattern="*"):
-        dir_report = DIRECTORY_REPORTS / dir_metadata.name
-        if not dir_report.is_dir():
-            metadata_purged += 1
+    labels_purged: list[str] = []
+    for label in CATALOG.metadata_only():
+        dir_metadata = DIRECTORY_REPORTS_METADATA / label
+        if (
+            dir_metadata.is_dir()
+            and not (DIRECTORY_REPORTS / label).is_dir()
+            and not (DIRECTORY_REPORTS_COLD / label).is_dir()
+        ):
             shutil.rmtree(dir_metadata, ignore_errors=True)
-
-    return reports_expired, metadata_purged
+            labels_purged.append(label)
+    update_catalog(labels=labels_purged)
+
+    purge_tick = util_catalog.PurgeTick(
+        started_at=started_at,
+        duration_s=time.monotonic() - time_start,
+        reports_due=len(labels_due),
+        reports_expired=len(labels_expired),
+        reports_archived=len(labels_archived),
+        metadata_purged=len(labels_purged),
+        reports_evicted=reports_evicted,
+    )
+    try:
+        CATALOG.record_tick(purge_tick)
+    except sqlite3.Error as e:
+        logger.warning(f"{CATALOG.filename}: Failed to record the purge tick: {e!r}")
+    return purge_tick
 
 
 if __name__ == "__main__":
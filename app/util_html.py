@@ -1,13 +1,77 @@
+"""
+Emission of html.
+
+Escape once: Text is escaped exactly once - when it is written.
+Markup (tags, links) is written as is.
+
+HtmlWriter: The fast path for the renderers.
+  Text is escaped immediately and collected as strings. 'flush()' returns
+  a chunk to be sent by a streaming response.
+
+Segments: A list of 'str' (not yet escaped) and 'Markup'.
+  Keeps the segments apart: Used where the segments are inspected (tests).
+
+Both implement 'text()' and 'markup()': See 'HtmlSink'.
+"""
+
 from __future__ import annotations
 
 import html
 import io
+import typing
 from contextlib import contextmanager
 
 from markupsafe import Markup
 
+escape = html.escape
+
+
+class HtmlSink(typing.Protocol):
+    def text(self, text: str) -> None:
+        """
+        'text' will be escaped.
+        """
+
+    def markup(self, markup: str) -> None:
+        """
+        'markup' is html and written as is.
+        """
+
+
+class HtmlWriter:
+    __slots__ = ("_parts", "size")
+
+    def __init__(self) -> None:
+        self._parts: list[str] = []
+        self.size = 0
+        "Number of characters written since the last 'flush()'"
+
+    def text(self, text: str) -> None:
+        text = escape(text)
+        self._parts.append(text)
+        self.size += len(text)
+
+    def markup(self, markup: str) -> None:
+        self._parts.append(markup)
+        self.size += len(markup)
+
+    def flush(self) -> str:
+        """
+        Returns the html written since the last 'flush()'.
+        """
+        chunk = "".join(self._parts)
+        self._parts.clear()
+        self.size = 0
+        return chunk
+
 
 class Segments(list[str | Markup]):
+    def text(self, text: str) -> None:
+        self.append(text)
+
+    def markup(self, markup: str) -> None:
+        self.append(Markup(markup))
+
     def write(self, fout: io.StringIO) -> None:
         for segment in self:
             if isinstance(segment, Markup):
@@ -0,0 +1,128 @@
+"""
+Listing of a report directory for the directory browser.
+
+A directory is scanned using 'os.scandir()': The file type comes with the
+'DirEntry', no additional 'stat()' per entry.
+The natural sort key and the listing style are computed once per entry.
+
+The listing is cached. The key contains the identity of the directory
+(inode and mtime): Adding/removing entries or re-uploading a report invalidates it.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import os
+import pathlib
+import re
+import typing
+
+from . import util_lru, util_report_archive
+from .render_directory_style import ListingStyle, get_listing_style
+
+RE_NUMBER = re.compile(r"((?P<number>\d+)|(?P<text>^\d+))")
+"""
+"testresults_100" -> "testresults_", "100"
+"""
+
+
+def key_number_sort(filename: util_report_archive.ReportFile | str) -> str:
+    """
+    Example:
+        testresults_100
+        testresults_92
+        testresults_97
+    Returns:
+        testresults_00100
+        testresults_00092
+        testresults_00097
+
+    This then will allow sorting by numbers.
+    """
+    if not isinstance(filename, str):
+        filename = str(filename)
+    assert isinstance(filename, str)
+
+    def f(match: re.Match) -> str:
+        number = match.group("number")
+        if number is not None:
+            return format(int(number), "010d")
+        text = match.group("text")
+        assert text is not None
+        return text
+
+    return RE_NUMBER.sub(f, filename)
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class ListingEntry:
+    name: str
+    path: str
+    "Relative to DIRECTORY_REPORTS"
+    is_dir: bool
+    style: ListingStyle
+
+    @property
+    def css_styles(self) -> str:
+        return " ".join([self.style.css_style, "directory" if self.is_dir else "file"])
+
+    def as_dict(self) -> dict[str, typing.Any]:
+        return {
+            "name": self.name,
+            "path": self.path,
+            "is_dir": self.is_dir,
+            "style": str(self.style),
+        }
+
+    @staticmethod
+    def factory(path: str, name: str, is_dir: bool) -> ListingEntry:
+        return ListingEntry(
+            name=name,
+            path=path,
+            is_dir=is_dir,
+            style=get_listing_style(path=path),
+        )
+
+
+CACHE_SIZE = 1024
+_CACHE: util_lru.LruCache[
+    tuple[str, int, int], tuple[ListingEntry, ...]
+] = util_lru.LruCache(maxsize=CACHE_SIZE)
+
+
+def _scan(directory: util_report_archive.ReportFile) -> list[tuple[str, bool]]:
+    """
+    Returns a list of (name, is_dir)
+    """
+    if isinstance(directory, pathlib.Path):
+        with os.scandir(directory) as it:
+            return [(entry.name, entry.is_dir()) for entry in it]
+    return [(entry.name, entry.is_dir()) for entry in directory.iterdir()]
+
+
+def list_directory(
+    directory: util_report_archive.ReportFile, path: str
+) -> tuple[ListingEntry, ...]:
+    """
+    path: 'directory' relative to DIRECTORY_REPORTS.
+    Returns the entries sorted descending by 'key_number_sort()'.
+    """
+    path = path.strip("/")
+    stat_result = util_report_archive.stat(directory)
+    key = (str(directory), stat_result.st_ino, stat_result.st_mtime_ns)
+    entries = _CACHE.get(key)
+    if entries is not None:
+        return entries
+
+    prefix = "" if path == "" else f"{path}/"
+    names = sorted(
+        _scan(directory=directory),
+        key=lambda name_is_dir: key_number_sort(name_is_dir[0]),
+        reverse=True,
+    )
+    entries = tuple(
+        ListingEntry.factory(path=f"{prefix}{name}", name=name, is_dir=is_dir)
+        for name, is_dir in names
+    )
+    _CACHE.put(key, entries)
+    return entries
@@ -0,0 +1,416 @@
+"""
+Index of a logfile: Random access to the lines of a given severity.
+
+The index is a sidecar file in DIRECTORY_REPORTS_METADATA:
+
+  reports_metadata/<label>/log_index/<path of the logfile>.idx
+
+It is built on the first view and memory mapped afterwards.
+The identity (inode, size, mtime) of the logfile is stored in the index:
+A re-uploaded report invalidates the index.
+
+Layout:
+  MAGIC
+  header length (uint32), header (json)
+  offsets      int64[lines]  byte offset of the line (the line might share a physical line, see 'sub_index()')
+  run_starts   int64[runs]   first line of a run of lines with the same severity
+  run_counts   int64[(runs + 1) * 4]  lines with severity >= s before the run, for s in 1..4
+  schemas      uint8[lines]  index into header['schemas']
+  flags        uint8[lines]  FLAG_ANCHOR
+  run_severity uint8[runs]
+
+The severity of a line is carried forward from the last line starting with a severity.
+"""
+
+from __future__ import annotations
+
+import bisect
+import dataclasses
+import json
+import logging
+import mmap
+import os
+import pathlib
+import struct
+import tempfile
+import typing
+
+from . import constants, util_lru, util_report_archive
+
+logger = logging.getLogger(__file__)
+
+MAGIC = b"LOGIDX01"
+DIRECTORY_LOG_INDEX = "log_index"
+
+SEVERITIES = (1, 2, 3, 4)
+"""
+See 'render_log.DICT_SEVERITY_TEXT'
+"""
+
+FLAG_ANCHOR = 0x01
+"""
+The severity changed: The line gets an anchor.
+"""
+
+_HEADER_LENGTH = struct.Struct("<I")
+_ALIGNMENT = 8
+
+LineParser = typing.Callable[[str], "tuple[int, str | None] | None"]
+"""
+Returns (severity, color_schema) if the line starts with a severity, else None.
+"""
+
+
+def decode_record(record: bytes) -> list[str]:
+    """
+    A record is a physical line terminated by b'\\n'.
+    Returns the same lines as 'read_text().splitlines()' would.
+    """
+    return record.decode("utf-8", errors="replace").splitlines()
+
+
+def index_filename(logfile: util_report_archive.ReportFile) -> pathlib.Path:
+    relative_path = util_report_archive.relative_path(
+        logfile, directory_reports=constants.DIRECTORY_REPORTS
+    )
+    label, _, path = relative_path.partition("/")
+    return (
+        constants.DIRECTORY_REPORTS_METADATA
+        / label
+        / DIRECTORY_LOG_INDEX
+        / f"{path}.idx"
+    )
+
+
+def _identity(logfile: util_report_archive.ReportFile) -> list[int]:
+    stat_result = util_report_archive.stat(logfile)
+    return [stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns]
+
+
+@dataclasses.dataclass(slots=True)
+class LogIndex:
+    header: dict[str, typing.Any]
+    offsets: typing.Sequence[int]
+    run_starts: typing.Sequence[int]
+    run_counts: typing.Sequence[int]
+    schemas: typing.Sequence[int]
+    flags: typing.Sequence[int]
+    run_severity: typing.Sequence[int]
+
+    @property
+    def lines(self) -> int:
+        return self.header["lines"]
+
+    @property
+    def runs(self) -> int:
+        return self.header["runs"]
+
+    @property
+    def first_matched(self) -> int:
+        """
+        The first line starting with a severity. 'lines' if there is none.
+        """
+        return self.header["first_matched"]
+
+    @property
+    def schema_color_active(self) -> bool:
+        return self.header["schema_color_active"]
+
+    def schema(self, line: int) -> str | None:
+        return self.header["schemas"][self.schemas[line]]
+
+    def is_anchor(self, line: int) -> bool:
+        return bool(self.flags[line] & FLAG_ANCHOR)
+
+    def severity(self, line: int) -> int:
+        return self.run_severity[bisect.bisect_right(self.run_starts, line) - 1]
+
+    def _run_count(self, run: int, severity: int) -> int:
+        return self.run_counts[run * len(SEVERITIES) + severity - 1]
+
+    def _run_end(self, run: int) -> int:
+        if run + 1 < self.runs:
+            return self.run_starts[run + 1]
+        return self.lines
+
+    def count(self, severity: int) -> int:
+        """
+        Number of lines with a severity >= 'severity'.
+        """
+        return self._run_count(self.runs, severity)
+
+    def rank(self, line: int, severity: int) -> int:
+        """
+        Number of lines with a severity >= 'severity' before 'line'.
+        """
+        if self.runs == 0:
+            return 0
+        run = bisect.bisect_right(self.run_starts, line) - 1
+        rank = self._run_count(run, severity)
+        if self.run_severity[run] >= severity:
+            rank += line - self.run_starts[run]
+        return rank
+
+    def iter_ranges(
+        self, severity: int, start: int = 0, stop: int | None = None
+    ) -> typing.Iterator[tuple[int, int]]:
+        """
+        Yields (line_begin, line_end) of the lines with a severity >= 'severity'.
+        'start' and 'stop' select a slice of these lines, see 'rank()'.
+        """
+        if stop is None:
+            stop = self.count(severity)
+        run_first = bisect.bisect_right(
+            range(self.runs + 1), start, key=lambda run: self._run_count(run, severity)
+        )
+        range_begin, range_end = 0, 0
+        for run in range(max(0, run_first - 1), self.runs):
+            count = self._run_count(run, severity)
+            if count >= stop:
+                break
+            if self.run_severity[run] < severity:
+                continue
+            begin = self.run_starts[run] + max(0, start - count)
+            end = min(self._run_end(run), self.run_starts[run] + stop - count)
+            if begin >= end:
+                continue
+            if begin == range_end:
+                # Adjacent runs: Merge
+                range_end = end
+                continue
+            if range_begin < range_end:
+                yield range_begin, range_end
+            range_begin, range_end = begin, end
+        if range_begin < range_end:
+            yield range_begin, range_end
+
+    def iter_states(
+        self, line_begin: int, line_end: int
+    ) -> typing.Iterator[tuple[int, str | None, bool]]:
+        """
+        Yields (severity, color_schema, is_anchor) for the lines.
+        """
+        schemas = self.header["schemas"]
+        run = bisect.bisect_right(self.run_starts, line_begin) - 1
+        run_end = self._run_end(run)
+        for line in range(line_begin, line_end):
+            while line >= run_end:
+                run += 1
+                run_end = self._run_end(run)
+            yield (
+                self.run_severity[run],
+                schemas[self.schemas[line]],
+                bool(self.flags[line] & FLAG_ANCHOR),
+            )
+
+    def sub_index(self, line: int) -> int:
+        """
+        The position of 'line' within its physical line.
+        """
+        offset = self.offsets[line]
+        sub = 0
+        while line - sub > 0 and self.offsets[line - sub - 1] == offset:
+            sub += 1
+        return sub
+
+    def iter_lines(
+        self,
+        logfile: util_report_archive.ReportFile,
+        line_begin: int,
+        line_end: int,
+    ) -> typing.Iterator[str]:
+        """
+        Seeks to 'line_begin' and yields the lines up to 'line_end'.
+        """
+        remaining = line_end - line_begin
+        if remaining <= 0:
+            return
+        sub = self.sub_index(line_begin)
+        with logfile.open("rb") as f:
+            f.seek(self.offsets[line_begin])
+            while remaining > 0:
+                record = f.readline()
+                if record == b"":
+                    return
+                lines = decode_record(record)[sub : sub + remaining]
+                sub = 0
+                remaining -= len(lines)
+                yield from lines
+
+    @staticmethod
+    def build(
+        logfile: util_report_archive.ReportFile,
+        parser: LineParser,
+        severity_default: int,
+    ) -> LogIndex:
+        """
+        One pass over the logfile. Replicates the state machine of 'render_log.Render'.
+        """
+        offsets: list[int] = []
+        schemas: list[str | None] = ["COLOR_INFO"]
+        schema_ids = bytearray()
+        flags = bytearray()
+        run_starts: list[int] = []
+        run_severity = bytearray()
+        run_counts: list[int] = []
+        totals = [0] * len(SEVERITIES)
+
+        def close_run(line_end: int) -> None:
+            if run_starts:
+                length = line_end - run_starts[-1]
+                for s in SEVERITIES:
+                    if run_severity[-1] >= s:
+                        totals[s - 1] += length
+
+        severity = severity_default
+        schema_id = 0
+        last_severity: int | None = None
+        first_matched: int | None = None
+        schema_color_active = False
+        dict_schema_ids: dict[str | None, int] = {schemas[0]: 0}
+
+        line = 0
+        offset = 0
+        with logfile.open("rb") as f:
+            for record in f:
+                if b"[COLOR_INFO]" in record:
+                    schema_color_active = True
+                for text in decode_record(record):
+                    flag = 0
+                    parsed = parser(text.rstrip())
+                    if parsed is not None:
+                        severity, schema = parsed
+                        schema_id = dict_schema_ids.get(schema, -1)
+                        if schema_id == -1:
+                            schema_id = dict_schema_ids[schema] = len(schemas)
+                            schemas.append(schema)
+                        if severity != last_severity:
+                            flag = FLAG_ANCHOR
+                            last_severity = severity
+                        if first_matched is None:
+                            first_matched = line
+                    if (not run_starts) or (severity != run_severity[-1]):
+                        close_run(line_end=line)
+                        run_counts.extend(totals)
+                        run_starts.append(line)
+                        run_severity.append(severity)
+                    offsets.append(offset)
+                    schema_ids.append(schema_id)
+                    flags.append(flag)
+                    line += 1
+                offset += len(record)
+        close_run(line_end=line)
+        run_counts.extend(totals)
+
+        assert len(schemas) < 256
+        return LogIndex(
+            header={
+                "identity": _identity(logfile),
+                "lines": line,
+                "runs": len(run_starts),
+                "first_matched": line if first_matched is None else first_matched,
+                "schemas": schemas,
+                "schema_color_active": schema_color_active,
+            },
+            offsets=offsets,
+            run_starts=run_starts,
+            run_counts=run_counts,
+            schemas=bytes(schema_ids),
+            flags=bytes(flags),
+            run_severity=bytes(run_severity),
+        )
+
+    def write(self, filename: pathlib.Path) -> None:
+        """
+        Atomic: Written to a temporary file which is then renamed.
+        """
+        header = json.dumps(self.header).encode()
+        header_length = _HEADER_LENGTH.size + len(header)
+        padding = b"\x00" * (-(len(MAGIC) + header_length) % _ALIGNMENT)
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        fd, filename_tmp = tempfile.mkstemp(dir=filename.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(MAGIC)
+                f.write(_HEADER_LENGTH.pack(len(header) + len(padding)))
+                f.write(header)
+                f.write(padding)
+                for values in (self.offsets, self.run_starts, self.run_counts):
+                    f.write(struct.pack(f"<{len(values)}q", *values))
+                for values in (self.schemas, self.flags, self.run_severity):
+                    f.write(bytes(values))
+            os.replace(filename_tmp, filename)
+        except BaseException:
+            pathlib.Path(filename_tmp).unlink(missing_ok=True)
+            raise
+
+    @staticmethod
+    def load(filename: pathlib.Path) -> LogIndex:
+        with filename.open("rb") as f:
+            data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        if data[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{filename}: Not a log index")
+        pos = len(MAGIC)
+        (header_length,) = _HEADER_LENGTH.unpack(data[pos : pos + _HEADER_LENGTH.size])
+        pos += _HEADER_LENGTH.size
+        header = json.loads(bytes(data[pos : pos + header_length]).rstrip(b"\x00"))
+        pos += header_length
+
+        def column(length: int, fmt: typing.Literal["q", "B"]) -> memoryview[int]:
+            nonlocal pos
+            size = length * struct.calcsize(fmt)
+            view = data[pos : pos + size].cast(fmt)
+            pos += size
+            return view
+
+        lines, runs = header["lines"], header["runs"]
+        return LogIndex(
+            header=header,
+            offsets=column(lines, "q"),
+            run_starts=column(runs, "q"),
+            run_counts=column((runs + 1) * len(SEVERITIES), "q"),
+            schemas=column(lines, "B"),
+            flags=column(lines, "B"),
+            run_severity=column(runs, "B"),
+        )
+
+
+CACHE_SIZE = 64
+_CACHE: util_lru.LruCache[tuple[str, tuple[int, ...]], LogIndex] = util_lru.LruCache(
+    maxsize=CACHE_SIZE
+)
+
+
+def get_index(
+    logfile: util_report_archive.ReportFile,
+    parser: LineParser,
+    severity_default: int,
+) -> LogIndex:
+    """
+    Returns the index of 'logfile': From memory, from the sidecar or built now.
+    """
+    identity = _identity(logfile)
+    key = (str(logfile), tuple(identity))
+    log_index = _CACHE.get(key)
+    if log_index is not None:
+        return log_index
+
+    filename = index_filename(logfile)
+    try:
+        log_index = LogIndex.load(filename)
+        if log_index.header["identity"] != identity:
+            log_index = None
+    except (OSError, ValueError):
+        log_index = None
+
+    if log_index is None:
+        log_index = LogIndex.build(
+            logfile=logfile, parser=parser, severity_default=severity_default
+        )
+        try:
+            log_index.write(filename)
+        except OSError as e:
+            logger.warning(f"{filename}: Failed to write log index: {e!r}")
+
+    _CACHE.put(key, log_index)
+    return log_index
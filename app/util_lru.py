@@ -0,0 +1,73 @@
+"""
+A small thread safe LRU cache.
+
+The keys usually contain the identity of a file (inode, size, mtime):
+A re-uploaded report gets new keys, the stale entries are evicted over time.
+"""
+
+from __future__ import annotations
+
+import collections
+import threading
+import typing
+
+
+class LruCache[K: typing.Hashable, V]:
+    def __init__(
+        self,
+        maxsize: int,
+        on_evict: typing.Callable[[V], None] | None = None,
+    ) -> None:
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        """
+        Called for every value which leaves the cache: Evicted, replaced or cleared.
+        For example to close a file.
+        """
+        self._entries: collections.OrderedDict[K, V] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: K, value: V) -> None:
+        evicted: list[V] = []
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None and previous is not value:
+                evicted.append(previous)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                evicted.append(self._entries.popitem(last=False)[1])
+        self._evict(evicted)
+
+    def pop(self, key: K) -> None:
+        with self._lock:
+            value = self._entries.pop(key, None)
+        if value is not None:
+            self._evict([value])
+
+    def clear(self) -> None:
+        with self._lock:
+            evicted = list(self._entries.values())
+            self._entries.clear()
+        self._evict(evicted)
+
+    def _evict(self, values: list[V]) -> None:
+        if self.on_evict is None:
+            return
+        for value in values:
+            self.on_evict(value)
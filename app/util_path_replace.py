@@ -1,15 +1,13 @@
 from __future__ import annotations
 
 import dataclasses
-import html
-import itertools
 import logging
 import re
 import typing
 
 from markupsafe import Markup
 
-from .util_html import Segments
+from .util_html import HtmlSink, Segments, escape
 
 logger = logging.getLogger(__file__)
 
@@ -37,29 +35,6 @@ class PathMatch:
     path_relevant: str
     path_after: str
 
-    @staticmethod
-    def factory(line_before: str, path_trigger: str) -> PathMatch | None:
-        # Find path begin
-        pos = line_before.find(path_trigger)
-        if pos == -1:
-            return None
-
-        path_trigger_after = line_before[pos + len(path_trigger) :]
-
-        # Find remaining path
-        pos_endof_path = PathMatch.pos_end_of_path(path=path_trigger_after)
-        path_relevant = path_trigger_after[0:pos_endof_path]
-
-        for c_check in (")", "'"):
-            if path_relevant.endswith(")"):
-                logger.warning(f"{c_check}: {path_relevant=}")
-
-        return PathMatch(
-            path_before=line_before[0:pos],
-            path_relevant=path_relevant,
-            path_after=path_trigger_after[pos_endof_path:],
-        )
-
     @staticmethod
     def pos_end_of_path(path: str) -> int:
         match_trigger_after = RE_ENDOF_PATH.search(path)
@@ -67,38 +42,31 @@ class PathMatch:
         return match_trigger_after.regs[0][0]
 
     def href(self, url) -> Markup:
-        href = f"{url}/{self.path_relevant}"
-        href = href.replace("//", "/").replace("//", "/")
-        return Markup(
-            f'<a href="{href}">{html.escape(self.path_relevant_readable)}</a>'
-        )
-
-    def line_with_href(self, url: str) -> Segments:
-        return Segments(
-            [
-                self.path_before,
-                self.href(url),
-                self.path_after,
-            ]
-        )
-
-    def line_without_href(self) -> Segments:
-        path_relevant = self.path_relevant.lstrip("/")
-        return Segments(
-            [
-                self.path_before,
-                Markup(path_relevant),
-                self.path_after,
-            ],
-        )
+        return Markup(href(url=url, path_relevant=self.path_relevant))
 
     @property
     def path_relevant_readable(self) -> str:
-        if self.path_relevant == "":
-            return "."
-        if self.path_relevant.startswith("/"):
-            return self.path_relevant[1:]
-        return self.path_relevant
+        return path_relevant_readable(self.path_relevant)
+
+
+def path_relevant_readable(path_relevant: str) -> str:
+    if path_relevant == "":
+        return "."
+    if path_relevant.startswith("/"):
+        return path_relevant[1:]
+    return path_relevant
+
+
+def href(url: str, path_relevant: str) -> str:
+    href = f"{url}/{path_relevant}"
+    href = href.replace("//", "/").replace("//", "/")
+    return f'<a href="{href}">{escape(path_relevant_readable(path_relevant))}</a>'
+
+
+RE_PATH_RELEVANT = r"[^ \n\'\"\\]*(?:\\(?!n)[^ \n\'\"\\]*)*"
+"""
+The path after the trigger up to 'RE_ENDOF_PATH' (exclusive).
+"""
 
 
 class PathReplace:
@@ -112,6 +80,24 @@ class PathReplace:
         self.git_ref = git_ref
         self.urls = urls
 
+        labels = [label for label, trigger in directories.items() if trigger != ""]
+        self._urls = {
+            f"path_{i}": urls.get(label, "") for i, label in enumerate(labels)
+        }
+        self._re_triggers: re.Pattern | None = None
+        """
+        All triggers combined: The lines are scanned once from left to right.
+        If several triggers match at the same position, the first in 'directories' wins.
+        The name of the group 'path_<i>' tells which trigger matched.
+        """
+        if len(labels) > 0:
+            self._re_triggers = re.compile(
+                "|".join(
+                    f"{re.escape(directories[label])}(?P<path_{i}>{RE_PATH_RELEVANT})"
+                    for i, label in enumerate(labels)
+                )
+            )
+
     def expand_href(self, segments: Segments) -> typing.Iterable[str | Markup]:
         for segment in segments:
             if isinstance(segment, Markup):
@@ -121,28 +107,33 @@ class PathReplace:
             yield from self.expand_href_line(line=segment)
 
     def expand_href_line(self, line: str) -> Segments:
-        """
-        html.escape may only be called ones!
-        We have to find the links one by one in sequence!
-        Option:
-        Use a list of elements:
-          str: Still not escaped
+        segments = Segments()
+        self.write_line(sink=segments, line=line)
+        return segments
 
+    def write_line(self, sink: HtmlSink, line: str) -> None:
+        """
+        Text is escaped exactly once: By the sink.
+        The text between the links is therefore written with 'sink.text()',
+        the links with 'sink.markup()'.
         """
-        line_orig = line
-        for label, path_trigger in self.directories.items():
-            url = self.urls.get(label, "")
-            for tries in itertools.count():
-                match = PathMatch.factory(line_before=line, path_trigger=path_trigger)
-                if match is None:
-                    break
-                if tries > 4:
-                    # TODO: Avoid endless loop
-                    logger.error("tries>10!")
-                    logger.error(f"{line}=")
-                    logger.error(f"{line_orig}=")
-                    break
-                if url == "":
-                    return match.line_without_href()
-                return Segments(self.expand_href(match.line_with_href(url=url)))
-        return Segments(line)
+        if self._re_triggers is None:
+            sink.text(line)
+            return
+
+        pos = 0
+        for match in self._re_triggers.finditer(line):
+            group = match.lastgroup
+            assert group is not None
+            start = match.start()
+            if start > pos:
+                sink.text(line[pos:start])
+            path_relevant = match.group(group)
+            url = self._urls[group]
+            if url == "":
+                sink.text(path_relevant.lstrip("/"))
+            else:
+                sink.markup(href(url=url, path_relevant=path_relevant))
+            pos = match.end()
+        if pos < len(line):
+            sink.text(line[pos:])
@@ -0,0 +1,150 @@
+"""
+Pre-render the files everybody opens right after an upload.
+
+Runs in the celery worker ('util_celery_tasks.prerender_report'): '/upload' is not blocked.
+The rendered html is stored in the caches on disk (see 'util_render_cache'),
+the indexes of the logfiles in 'reports_metadata' (see 'util_log_index'):
+The first request is served from the cache.
+"""
+
+from __future__ import annotations
+
+import enum
+import logging
+import os
+import pathlib
+import re
+import time
+import typing
+import zipfile
+
+from starlette.datastructures import URL
+from testbed_micropython.report_test import util_constants
+
+from . import constants, util_report_archive
+from .render_ansii_color import prerender_ansi_color
+from .render_log import DEFAULT_LOGFILE, SEVERITY_DEFAULT, is_logfile, prerender_log
+from .render_markdown import prerender_markdown
+
+logger = logging.getLogger(__file__)
+
+PRERENDER_MAX_FILES = 256
+"""
+Protects the worker against reports with thousands of matching files.
+"""
+
+CHUNK_SIZE_BYTES = 1024 * 1024
+
+
+class Prerender(enum.StrEnum):
+    LOG = "log"
+    "Rendered at SEVERITY_DEFAULT, the index is built"
+    MARKDOWN = "markdown"
+    ANSI = "ansi"
+    FILE = "file"
+    "Served as is: Read once into the page cache"
+
+
+LIST_RE_2_PRERENDER = [
+    (
+        re.compile(rf"/{util_constants.FILENAME_OCTOPROBE_SUMMARY_REPORT_STEM}\.html$"),
+        Prerender.FILE,
+    ),
+    (
+        re.compile(rf"/{util_constants.FILENAME_OCTOPROBE_PR_REPORT_STEM}\.html$"),
+        Prerender.FILE,
+    ),
+    (re.compile(r"/logger_20_info\.log$"), Prerender.LOG),
+    (re.compile(r"/task_report\.md$"), Prerender.MARKDOWN),
+    (re.compile(r"\.color$"), Prerender.ANSI),
+]
+"""
+Map a regular expression on a filename to the pre-rendering of the file.
+The first matching regular expression wins. See also 'LIST_RE_2_STYLE'.
+"""
+
+
+def get_prerender(path: str) -> Prerender | None:
+    for re_search, prerender in LIST_RE_2_PRERENDER:
+        if re_search.search(path):
+            return prerender
+    return None
+
+
+def iter_report_files(
+    label: str,
+) -> typing.Iterator[tuple[str, util_report_archive.ReportFile]]:
+    """
+    Yields (path, report_file) for all files of the report.
+    'path' is relative to DIRECTORY_REPORTS, for example 'github_selfhosted_testrun_107/RUN-TESTS_BASICS/logger_20_info.log'.
+    """
+    root = util_report_archive.resolve(
+        label, directory_reports=constants.DIRECTORY_REPORTS
+    )
+    if isinstance(root, zipfile.Path):
+        for name in root.root.namelist():
+            if not name.endswith("/"):
+                yield f"{label}/{name}", root / name
+        return
+
+    for dirpath, _dirnames, filenames in os.walk(root):
+        directory = pathlib.Path(dirpath)
+        for filename in filenames:
+            report_file = directory / filename
+            yield util_report_archive.relative_path(
+                report_file, directory_reports=constants.DIRECTORY_REPORTS
+            ), report_file
+
+
+def prerender_file(
+    path: str, report_file: util_report_archive.ReportFile, prerender: Prerender
+) -> bool:
+    """
+    Returns True if something was rendered.
+    """
+    if prerender is Prerender.LOG:
+        if is_logfile(report_file):
+            # Like 'render_directory_or_file()': Falls back to logger_10_debug.log
+            report_file = util_report_archive.sibling(report_file, DEFAULT_LOGFILE)
+        if not report_file.is_file():
+            return False
+        return prerender_log(
+            logfile=report_file, url=URL(f"/{path}"), severity=SEVERITY_DEFAULT
+        )
+    if prerender is Prerender.MARKDOWN:
+        return prerender_markdown(markdown_file=report_file)
+    if prerender is Prerender.ANSI:
+        return prerender_ansi_color(color_file=report_file)
+    assert prerender is Prerender.FILE
+    with report_file.open("rb") as f:
+        while f.read(CHUNK_SIZE_BYTES):
+            pass
+    return False
+
+
+def prerender_report(label: str) -> int:
+    """
+    Returns the number of files rendered.
+    """
+    time_start = time.monotonic()
+    rendered = 0
+    files = 0
+    for path, report_file in iter_report_files(label=label):
+        prerender = get_prerender(path)
+        if prerender is None:
+            continue
+        files += 1
+        if files > PRERENDER_MAX_FILES:
+            logger.warning(
+                f"{label}: More than {PRERENDER_MAX_FILES} files to prerender"
+            )
+            break
+        try:
+            if prerender_file(path=path, report_file=report_file, prerender=prerender):
+                rendered += 1
+        except Exception as e:
+            logger.warning(f"{path}: prerender {prerender} failed: {e!r}")
+    logger.info(
+        f"{label}: prerendered {rendered} files in {time.monotonic() - time_start:0.1f}s"
+    )
+    return rendered
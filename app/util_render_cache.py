@@ -0,0 +1,355 @@
+"""
+Cache for rendered html on disk.
+
+Uploaded reports never change: A rendered log is stored gzip compressed
+and served again without rendering.
+
+  reports_cache/<namespace>/ab/abcdef0123....html.gz    sha256 of the key
+
+The key contains everything the output depends on: The path, the identity
+(inode, size, mtime) of the input files, the query parameters and the renderer version.
+
+The cache is bounded by 'max_bytes': The least recently used entries are evicted.
+A hit updates the mtime of the entry: The mtime is the time of the last use.
+
+Optionally, small entries are also kept in memory (per process), bounded by 'memory_max_bytes'.
+
+Re-uploading a report changes the identity of its files: The stale entries are never hit
+again and are evicted over time.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import logging
+import os
+import pathlib
+import tempfile
+import threading
+import time
+import typing
+from collections import OrderedDict
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from . import constants, util_file_response, util_report_archive
+
+logger = logging.getLogger(__file__)
+
+SUFFIX = ".html.gz"
+SUFFIX_TMP = ".tmp"
+TMP_EXPIRY_S = 3600.0
+COMPRESS_LEVEL = 6
+CHUNK_SIZE_BYTES = 64 * 1024
+MEMORY_ENTRY_FRACTION = 16
+"""
+Entries larger than 'memory_max_bytes / MEMORY_ENTRY_FRACTION' are not kept in memory:
+A single large log would evict everything else.
+"""
+
+
+def accepts_gzip(request: Request) -> bool:
+    for encoding in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = encoding.partition(";")
+        if coding.strip() == "gzip":
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00")
+    return False
+
+
+def identity(report_file: util_report_archive.ReportFile) -> str:
+    """
+    Part of a key: Changes if the file is re-uploaded.
+    """
+    stat_result = util_report_archive.stat(report_file)
+    return f"{report_file}:{stat_result.st_ino}:{stat_result.st_size}:{stat_result.st_mtime_ns}"
+
+
+class RenderCache:
+    def __init__(
+        self, directory: pathlib.Path, max_bytes: int, memory_max_bytes: int = 0
+    ) -> None:
+        """
+        memory_max_bytes: 0: No entries in memory.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_max_bytes = memory_max_bytes
+        self._bytes: int | None = None
+        "Estimation of the bytes used. None: Not known yet"
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(*parts: str | int | None) -> str:
+        return hashlib.sha256(
+            "\0".join(str(part) for part in parts).encode()
+        ).hexdigest()
+
+    def filename(self, key: str) -> pathlib.Path:
+        return self.directory / key[:2] / f"{key}{SUFFIX}"
+
+    def get(self, key: str) -> pathlib.Path | None:
+        """
+        Returns the compressed entry or None.
+        """
+        filename = self.filename(key)
+        try:
+            # Mark as recently used
+            os.utime(filename)
+        except FileNotFoundError:
+            return None
+        return filename
+
+    def get_memory(self, key: str) -> bytes | None:
+        """
+        Returns the compressed entry if it is kept in memory.
+        """
+        with self._lock:
+            compressed = self._memory.get(key)
+            if compressed is not None:
+                self._memory.move_to_end(key)
+            return compressed
+
+    def put_memory(self, key: str, filename: pathlib.Path) -> None:
+        """
+        Keep the entry 'filename' in memory if it is small enough.
+        """
+        compressed: bytes | None = None
+        if self.memory_max_bytes > 0:
+            try:
+                if (
+                    filename.stat().st_size
+                    <= self.memory_max_bytes // MEMORY_ENTRY_FRACTION
+                ):
+                    compressed = filename.read_bytes()
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            if compressed is None:
+                return
+            self._memory[key] = compressed
+            self._memory_bytes += len(compressed)
+            while self._memory_bytes > self.memory_max_bytes:
+                _key, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._memory_bytes
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+        }
+
+    def serve(
+        self,
+        request: Request,
+        key: str,
+        media_type: str,
+        render: typing.Callable[[], typing.Iterable[str]],
+    ) -> Response:
+        """
+        Serves the entry 'key' from memory or disk.
+        On a miss, 'render()' is called and its output streamed and stored.
+
+        The etag is derived from 'key': The browser revalidates without a transfer.
+        """
+        headers = {
+            "etag": f'"{key[:32]}"',
+            "cache-control": util_file_response.CACHE_CONTROL,
+        }
+        if util_file_response.etag_matches(request=request, etag_=headers["etag"]):
+            return Response(status_code=304, headers=headers)
+
+        compressed = self.get_memory(key)
+        if compressed is not None:
+            with self._lock:
+                self.hits_memory += 1
+            return self.response_bytes(
+                request=request,
+                compressed=compressed,
+                media_type=media_type,
+                headers=headers,
+            )
+
+        filename = self.get(key)
+        if filename is not None:
+            with self._lock:
+                self.hits_disk += 1
+            self.put_memory(key=key, filename=filename)
+            return self.response(
+                request=request,
+                filename=filename,
+                media_type=media_type,
+                headers=headers,
+            )
+
+        with self._lock:
+            self.misses += 1
+        return StreamingResponse(
+            content=self.tee(key=key, chunks=render()),
+            media_type=media_type,
+            headers=headers,
+        )
+
+    def warm(self, key: str, render: typing.Callable[[], typing.Iterable[str]]) -> bool:
+        """
+        Renders entry 'key' unless it is cached already.
+        Returns True if rendered.
+        """
+        if self.get(key) is not None:
+            return False
+        for _chunk in self.tee(key=key, chunks=render()):
+            pass
+        return True
+
+    def response_bytes(
+        self,
+        request: Request,
+        compressed: bytes,
+        media_type: str,
+        headers: dict[str, str],
+    ) -> Response:
+        headers = {**headers, "vary": "accept-encoding"}
+        if accepts_gzip(request):
+            headers["content-encoding"] = "gzip"
+            return Response(content=compressed, media_type=media_type, headers=headers)
+        return Response(
+            content=gzip.decompress(compressed), media_type=media_type, headers=headers
+        )
+
+    def response(
+        self,
+        request: Request,
+        filename: pathlib.Path,
+        media_type: str,
+        headers: dict[str, str],
+    ) -> Response:
+        """
+        The compressed entry is sent as is if the client accepts gzip.
+        """
+        headers = {**headers, "vary": "accept-encoding"}
+        if accepts_gzip(request):
+            headers["content-encoding"] = "gzip"
+            return FileResponse(path=filename, media_type=media_type, headers=headers)
+
+        def iter_decompressed() -> typing.Iterator[bytes]:
+            with gzip.open(filename, "rb") as f:
+                while chunk := f.read(CHUNK_SIZE_BYTES):
+                    yield chunk
+
+        return StreamingResponse(
+            content=iter_decompressed(), media_type=media_type, headers=headers
+        )
+
+    def tee(self, key: str, chunks: typing.Iterable[str]) -> typing.Iterator[str]:
+        """
+        Yields 'chunks' and stores them compressed as entry 'key'.
+        The entry is only stored if all chunks have been consumed:
+        An aborted download does not leave a truncated entry.
+        """
+        filename = self.filename(key)
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        fd, filename_tmp = tempfile.mkstemp(dir=filename.parent, suffix=SUFFIX_TMP)
+        complete = False
+        try:
+            with os.fdopen(fd, "wb") as f_raw:
+                with gzip.GzipFile(
+                    fileobj=f_raw, mode="wb", compresslevel=COMPRESS_LEVEL, mtime=0
+                ) as f:
+                    for chunk in chunks:
+                        f.write(chunk.encode())
+                        yield chunk
+            os.replace(filename_tmp, filename)
+            complete = True
+            self._added(filename.stat().st_size)
+            self.put_memory(key=key, filename=filename)
+        finally:
+            if not complete:
+                pathlib.Path(filename_tmp).unlink(missing_ok=True)
+
+    def _added(self, size: int) -> None:
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += size
+            if (self._bytes is not None) and (self._bytes <= self.max_bytes):
+                return
+        self.evict()
+
+    def _iter_entries(self) -> typing.Iterator[os.DirEntry]:
+        if not self.directory.is_dir():
+            return
+        with os.scandir(self.directory) as it_fanout:
+            for entry_fanout in it_fanout:
+                if not entry_fanout.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(entry_fanout.path) as it:
+                    yield from it
+
+    def evict(self) -> int:
+        """
+        Remove the least recently used entries until the cache fits into 'max_bytes'.
+        Returns the number of entries removed.
+        """
+        time_limit = time.time() - TMP_EXPIRY_S
+        entries: list[tuple[float, int, str]] = []
+        removed = 0
+        for entry in self._iter_entries():
+            try:
+                stat_result = entry.stat(follow_symlinks=False)
+                if entry.name.endswith(SUFFIX_TMP):
+                    # Leftovers of an interrupted render
+                    if stat_result.st_mtime < time_limit:
+                        os.unlink(entry.path)
+                    continue
+            except FileNotFoundError:
+                continue
+            entries.append((stat_result.st_mtime, stat_result.st_size, entry.path))
+
+        total_bytes = sum(size for _mtime, size, _path in entries)
+        for _mtime, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            removed += 1
+
+        with self._lock:
+            self._bytes = total_bytes
+        if removed > 0:
+            logger.info(f"{self.directory}: evicted {removed} entries")
+        return removed
+
+
+RENDER_CACHE_LOG = RenderCache(
+    directory=constants.DIRECTORY_REPORTS_CACHE / "render_log",
+    max_bytes=constants.RENDER_CACHE_MAX_BYTES,
+    memory_max_bytes=constants.RENDER_CACHE_MEMORY_MAX_BYTES,
+)
+RENDER_CACHE_MARKDOWN = RenderCache(
+    directory=constants.DIRECTORY_REPORTS_CACHE / "render_markdown",
+    max_bytes=constants.RENDER_CACHE_MAX_BYTES,
+    memory_max_bytes=constants.RENDER_CACHE_MEMORY_MAX_BYTES,
+)
+RENDER_CACHE_ANSI = RenderCache(
+    directory=constants.DIRECTORY_REPORTS_CACHE / "render_ansi",
+    max_bytes=constants.RENDER_CACHE_MAX_BYTES,
+    memory_max_bytes=constants.RENDER_CACHE_MEMORY_MAX_BYTES,
+)
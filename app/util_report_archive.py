@@ -0,0 +1,314 @@
+"""
+Storage of a report as a single indexed archive instead of an extracted tree.
+
+REPORTS_STORAGE=directory (default)
+  reports/<label>/...               extracted tree
+  reports/<label>/<label>.tgz       the uploaded tarball
+
+REPORTS_STORAGE=zip
+  reports/<label>/report.zip        the tarball repacked into a zip
+
+Expired reports (see 'archive_cold()')
+  reports_cold/<label>/report.zip   the report repacked using lzma
+
+A zip has a central directory (member index): Every member may be read
+without extracting the archive. Tens of thousands of small files collapse into one inode.
+
+The renderers work on 'ReportFile' which is either a 'pathlib.Path'
+or a 'zipfile.Path' pointing into the archive.
+Both share the methods used: exists(), is_file(), is_dir(), iterdir(),
+read_text(), read_bytes(), open(), name, suffix, parent and '/'.
+"""
+
+from __future__ import annotations
+
+import enum
+import logging
+import os
+import pathlib
+import shutil
+import tarfile
+import threading
+import time
+import typing
+import zipfile
+
+from . import constants, util_lru
+
+logger = logging.getLogger(__file__)
+
+ReportFile = pathlib.Path | zipfile.Path
+
+FILENAME_REPORT_ARCHIVE = "report.zip"
+
+SUFFIXES_STORED = {".gz", ".tgz", ".zip", ".zst", ".xz", ".bz2", ".png", ".jpg"}
+"""
+These files are already compressed: Store them without compression.
+"""
+
+ZIP_DATE_TIME_MIN = (1980, 1, 1, 0, 0, 0)
+
+CHUNK_SIZE_BYTES = 1024 * 1024
+
+
+class ReportStorage(enum.StrEnum):
+    DIRECTORY = "directory"
+    ZIP = "zip"
+
+
+REPORT_STORAGE = ReportStorage(constants.REPORTS_STORAGE)
+
+
+def pack_tar(tar: tarfile.TarFile, filename_zip: pathlib.Path) -> None:
+    """
+    Repack the members of a (streamed) tarfile into a zip.
+    No file is extracted to disk.
+    """
+    with zipfile.ZipFile(
+        filename_zip,
+        mode="w",
+        compression=zipfile.ZIP_DEFLATED,
+        compresslevel=6,
+    ) as zf:
+        for member in tar:
+            member = tarfile.tar_filter(member, str(filename_zip.parent))
+            name = member.name.rstrip("/")
+            if name in ("", "."):
+                continue
+            date_time = max(time.localtime(member.mtime)[:6], ZIP_DATE_TIME_MIN)
+            if member.isdir():
+                zinfo = zipfile.ZipInfo(name + "/", date_time=date_time)
+                zinfo.external_attr = (0o40000 | member.mode) << 16
+                zf.writestr(zinfo, b"")
+                continue
+            if not member.isreg():
+                logger.debug(f"{filename_zip}: skipping {member.name}: not a file")
+                continue
+            zinfo = zipfile.ZipInfo(name, date_time=date_time)
+            zinfo.external_attr = (0o100000 | member.mode) << 16
+            zinfo.file_size = member.size
+            if pathlib.PurePosixPath(name).suffix in SUFFIXES_STORED:
+                zinfo.compress_type = zipfile.ZIP_STORED
+            else:
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+            fin = tar.extractfile(member)
+            assert fin is not None
+            with zf.open(zinfo, mode="w") as fout:
+                shutil.copyfileobj(fin, fout, CHUNK_SIZE_BYTES)
+
+
+def pack_cold(root: ReportFile, filename_zip: pathlib.Path, exclude: set[str]) -> None:
+    """
+    Repack a report (extracted tree or archive) into 'filename_zip' using lzma:
+    Slow to write, but typically a fraction of the size of deflate.
+    Each member is compressed on its own and may still be read without extracting the others.
+    exclude: Names relative to 'root' which are skipped.
+    """
+    with zipfile.ZipFile(
+        filename_zip,
+        mode="w",
+        compression=zipfile.ZIP_LZMA,
+        strict_timestamps=False,
+    ) as zf:
+
+        def compress_type(name: str) -> int:
+            if pathlib.PurePosixPath(name).suffix in SUFFIXES_STORED:
+                return zipfile.ZIP_STORED
+            return zipfile.ZIP_LZMA
+
+        if isinstance(root, zipfile.Path):
+            for info in root.root.infolist():
+                if info.filename.rstrip("/") in exclude:
+                    continue
+                zinfo = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                zinfo.external_attr = info.external_attr
+                if info.is_dir():
+                    zf.writestr(zinfo, b"")
+                    continue
+                zinfo.file_size = info.file_size
+                zinfo.compress_type = compress_type(info.filename)
+                with root.root.open(info) as fin, zf.open(zinfo, mode="w") as fout:
+                    shutil.copyfileobj(fin, fout, CHUNK_SIZE_BYTES)
+            return
+
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            directory = pathlib.Path(dirpath)
+            for name in [*dirnames, *sorted(filenames)]:
+                filename = directory / name
+                arcname = filename.relative_to(root).as_posix()
+                if arcname in exclude:
+                    continue
+                if not (filename.is_dir() or filename.is_file()):
+                    logger.debug(f"{filename_zip}: skipping {arcname}: not a file")
+                    continue
+                zf.write(filename, arcname=arcname, compress_type=compress_type(name))
+
+
+def archive_cold(
+    label: str,
+    directory_reports: pathlib.Path = constants.DIRECTORY_REPORTS,
+    directory_cold: pathlib.Path = constants.DIRECTORY_REPORTS_COLD,
+) -> pathlib.Path:
+    """
+    Compacts the report into 'directory_cold / label / FILENAME_REPORT_ARCHIVE'.
+    Afterwards 'resolve()' serves the report from there once the report in
+    'directory_reports' has been removed: The caller moves it to the trash.
+    Returns the filename of the archive.
+    """
+    directory = directory_reports / label
+    if not directory.is_dir():
+        raise FileNotFoundError(f"{directory}: Report not found")
+    root = resolve(label, directory_reports=directory_reports)
+    filename_zip = directory_cold / label / FILENAME_REPORT_ARCHIVE
+    filename_zip.parent.mkdir(parents=True, exist_ok=True)
+    filename_tmp = filename_zip.with_suffix(".tmp")
+    try:
+        # The uploaded tarball: The archive contains all of it
+        pack_cold(root=root, filename_zip=filename_tmp, exclude={f"{label}.tgz"})
+        with filename_tmp.open("rb") as f:
+            os.fsync(f.fileno())
+        filename_tmp.replace(filename_zip)
+    finally:
+        filename_tmp.unlink(missing_ok=True)
+    return filename_zip
+
+
+ARCHIVES_OPEN_MAX = 64
+
+_ARCHIVES: util_lru.LruCache[
+    str, tuple[tuple[int, int, int], zipfile.Path]
+] = util_lru.LruCache(
+    maxsize=ARCHIVES_OPEN_MAX,
+    on_evict=lambda entry: entry[1].root.close(),
+)
+"""
+filename -> (identity, root of the archive)
+Every archive holds a file descriptor: An evicted or replaced archive is closed.
+Otherwise a re-uploaded or trashed archive would stay on disk until the process ends.
+"""
+
+_ARCHIVES_LOCK = threading.Lock()
+"""
+Two threads opening the same archive: The second would close the archive of the first.
+"""
+
+
+def open_archive(filename_zip: pathlib.Path) -> zipfile.Path:
+    """
+    Returns the root of the archive. The central directory is read once
+    and then cached. ZipFile serializes concurrent reads: It may be shared by threads.
+    """
+    stat_result = filename_zip.stat()
+    identity = (stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns)
+    filename = str(filename_zip)
+    with _ARCHIVES_LOCK:
+        entry = _ARCHIVES.get(filename)
+        if entry is not None and entry[0] == identity:
+            return entry[1]
+        root = zipfile.Path(zipfile.ZipFile(filename_zip))
+        _ARCHIVES.put(filename, (identity, root))
+        return root
+
+
+def close_archive(directory: pathlib.Path) -> None:
+    """
+    Closes the archive of the report in 'directory' before the report is removed.
+    """
+    with _ARCHIVES_LOCK:
+        _ARCHIVES.pop(str(directory / FILENAME_REPORT_ARCHIVE))
+
+
+def _filename_archive(
+    label: str, directory_reports: pathlib.Path, directory_cold: pathlib.Path
+) -> pathlib.Path | None:
+    filename_zip = directory_reports / label / FILENAME_REPORT_ARCHIVE
+    if filename_zip.is_file():
+        return filename_zip
+    if (directory_reports / label).is_dir():
+        return None
+    # Expired: See 'archive_cold()'
+    filename_zip = directory_cold / label / FILENAME_REPORT_ARCHIVE
+    if filename_zip.is_file():
+        return filename_zip
+    return None
+
+
+def resolve(
+    path: str,
+    directory_reports: pathlib.Path = constants.DIRECTORY_REPORTS,
+    directory_cold: pathlib.Path = constants.DIRECTORY_REPORTS_COLD,
+) -> ReportFile:
+    """
+    'path' is relative to DIRECTORY_REPORTS, for example 'github_selfhosted_testrun_107/RUN-TESTS_BASICS'.
+    Returns a 'zipfile.Path' if the report is stored as archive or has been archived.
+    """
+    label, _, member = path.strip("/").partition("/")
+    if label != "":
+        filename_zip = _filename_archive(label, directory_reports, directory_cold)
+        if filename_zip is not None:
+            root = open_archive(filename_zip)
+            if member == "":
+                return root
+            return root / member
+    return directory_reports / path
+
+
+def is_archived(report_file: ReportFile) -> bool:
+    return isinstance(report_file, zipfile.Path)
+
+
+def archive_filename(report_file: zipfile.Path) -> pathlib.Path:
+    filename = report_file.root.filename
+    assert filename is not None
+    return pathlib.Path(filename)
+
+
+def relative_path(
+    report_file: ReportFile,
+    directory_reports: pathlib.Path = constants.DIRECTORY_REPORTS,
+) -> str:
+    """
+    Inverse of 'resolve()'.
+    """
+    if isinstance(report_file, zipfile.Path):
+        label = archive_filename(report_file).parent.name
+        return f"{label}/{report_file.at}".rstrip("/")
+    return str(report_file.relative_to(directory_reports))
+
+
+def sibling(report_file: ReportFile, name: str) -> ReportFile:
+    """
+    'report_file.parent / name': 'zipfile.Path.parent' is typed as 'os.PathLike'.
+    """
+    if isinstance(report_file, zipfile.Path):
+        return typing.cast(zipfile.Path, report_file.parent) / name
+    return report_file.parent / name
+
+
+def report_root(
+    report_file: ReportFile,
+    directory_reports: pathlib.Path = constants.DIRECTORY_REPORTS,
+) -> ReportFile:
+    """
+    Returns the top directory of the report containing 'report_file'.
+    """
+    if isinstance(report_file, zipfile.Path):
+        return zipfile.Path(report_file.root)
+    label = report_file.relative_to(directory_reports).parts[0]
+    return directory_reports / label
+
+
+def report_label(report_root_: ReportFile) -> str:
+    if isinstance(report_root_, zipfile.Path):
+        return archive_filename(report_root_).parent.name
+    return report_root_.name
+
+
+def stat(report_file: ReportFile) -> os.stat_result:
+    """
+    For a member of an archive: The stat of the archive.
+    """
+    if isinstance(report_file, zipfile.Path):
+        return archive_filename(report_file).stat()
+    return report_file.stat()
@@ -0,0 +1,100 @@
+"""
+Classify a report file as ascii, utf-8 or binary - without reading it completely.
+
+Only a bounded prefix ('SAMPLE_SIZE_BYTES') is inspected.
+The verdict is cached per file and file identity (inode, size, mtime).
+
+Files which are not utf-8 are shown with the non printable bytes escaped.
+The escaping is table driven and streams chunk by chunk.
+"""
+
+from __future__ import annotations
+
+import codecs
+import enum
+import typing
+
+from . import util_lru, util_report_archive
+
+SAMPLE_SIZE_BYTES = 64 * 1024
+CHUNK_SIZE_BYTES = 1024 * 1024
+
+ESCAPE_HEADER = "ATTENTION: Non utf-8 characters!\n\n"
+
+
+class Sniff(enum.StrEnum):
+    ASCII = "ascii"
+    UTF8 = "utf-8"
+    BINARY = "binary"
+
+
+def sniff_bytes(sample: bytes, complete: bool) -> Sniff:
+    """
+    complete: False if 'sample' is only the beginning of the file.
+      A multibyte character cut at the end of the sample is then accepted.
+    """
+    if sample.isascii():
+        return Sniff.ASCII
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        decoder.decode(sample, final=complete)
+    except UnicodeDecodeError:
+        return Sniff.BINARY
+    return Sniff.UTF8
+
+
+def _sniff_file(report_file: util_report_archive.ReportFile) -> Sniff:
+    with report_file.open("rb") as f:
+        sample = f.read(SAMPLE_SIZE_BYTES + 1)
+    complete = len(sample) <= SAMPLE_SIZE_BYTES
+    return sniff_bytes(sample[:SAMPLE_SIZE_BYTES], complete=complete)
+
+
+CACHE_SIZE = 4096
+_CACHE: util_lru.LruCache[tuple[str, int, int, int], Sniff] = util_lru.LruCache(
+    maxsize=CACHE_SIZE
+)
+
+
+def sniff(report_file: util_report_archive.ReportFile) -> Sniff:
+    """
+    The verdict is cached: The key includes the file identity (inode, size, mtime).
+    """
+    stat_result = util_report_archive.stat(report_file)
+    key = (
+        str(report_file),
+        stat_result.st_ino,
+        stat_result.st_size,
+        stat_result.st_mtime_ns,
+    )
+    verdict = _CACHE.get(key)
+    if verdict is None:
+        verdict = _sniff_file(report_file)
+        _CACHE.put(key, verdict)
+    return verdict
+
+
+ESCAPE_TABLE = [
+    chr(b) if (0x20 <= b <= 0x7E) or (b == 0x0A) else f"\\x{b:02x}" for b in range(256)
+]
+"""
+Printable ascii and newline are kept, all other bytes become '\\xNN'.
+"""
+
+_ESCAPE_TABLE_GETITEM = ESCAPE_TABLE.__getitem__
+
+_BYTES_PRINTABLE = bytes(b for b in range(256) if ESCAPE_TABLE[b] == chr(b))
+
+
+def escape_bytes(data: bytes) -> str:
+    if not data.translate(None, _BYTES_PRINTABLE):
+        # Fast path: Nothing to escape
+        return data.decode("ascii")
+    return "".join(map(_ESCAPE_TABLE_GETITEM, data))
+
+
+def iter_escaped(report_file: util_report_archive.ReportFile) -> typing.Iterator[str]:
+    yield ESCAPE_HEADER
+    with report_file.open("rb") as f:
+        while chunk := f.read(CHUNK_SIZE_BYTES):
+            yield escape_bytes(chunk)
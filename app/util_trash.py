@@ -0,0 +1,295 @@
+"""
+Deletion of large report trees without blocking and without saturating the disk.
+
+'move_to_trash()' renames a directory into DIRECTORY_REPORTS_TRASH:
+It disappears from the listings immediately, the request does not wait.
+
+'Trash.empty()' runs in the celery worker ('util_celery_tasks.empty_trash'):
+The files are unlinked by parallel threads, throttled to 'files_per_s'.
+A call returns after 'time_budget_s': The worker is not blocked for long,
+the next call continues where the previous one stopped.
+
+The progress is written to 'progress.json' in the trash, see 'Trash.progress()'.
+"""
+
+from __future__ import annotations
+
+import collections
+import concurrent.futures
+import dataclasses
+import errno
+import json
+import logging
+import os
+import pathlib
+import shutil
+import threading
+import time
+import typing
+import uuid
+
+from . import constants, util_report_archive
+
+logger = logging.getLogger(__file__)
+
+FILENAME_PROGRESS = "progress.json"
+BATCH_FILES = 64
+"""
+The files unlinked by a worker between two throttle checks.
+"""
+PROGRESS_INTERVAL_S = 2.0
+
+
+@dataclasses.dataclass(slots=True)
+class TrashProgress:
+    directories: int = 0
+    "Directories in the trash"
+    files_pending: int = 0
+    bytes_pending: int = 0
+    "Sum of the file sizes. Hardlinked files are only reclaimed when the last link is removed."
+    files_deleted: int = 0
+    bytes_deleted: int = 0
+    updated_at: float = 0.0
+    "Seconds since the epoch"
+    scanned: dict[str, list[int]] = dataclasses.field(default_factory=dict)
+    """
+    Directory in the trash -> [files_pending, bytes_pending]
+    A directory is scanned once: The next 'empty()' carries the counts forward.
+    """
+
+    @property
+    def text(self) -> str:
+        return (
+            f"{self.directories} directories, {self.files_pending} files "
+            f"({self.bytes_pending / 1e6:0.1f} MB) pending, "
+            f"{self.files_deleted} files ({self.bytes_deleted / 1e6:0.1f} MB) deleted"
+        )
+
+
+class Throttle:
+    """
+    Limits the rate over all threads.
+    """
+
+    def __init__(self, rate_per_s: float) -> None:
+        assert rate_per_s > 0.0
+        self.interval_s = 1.0 / rate_per_s
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, count: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + count * self.interval_s
+        if start > now:
+            time.sleep(start - now)
+
+
+def move_to_trash(directory: pathlib.Path, directory_trash: pathlib.Path) -> bool:
+    """
+    Returns False if 'directory' does not exist.
+    'directory_trash' has to be on the same filesystem: Otherwise 'directory' is deleted right away.
+    """
+    directory_trash.mkdir(parents=True, exist_ok=True)
+    util_report_archive.close_archive(directory)
+    # Sortable: The oldest is deleted first
+    target = (
+        directory_trash
+        / f"{time.strftime('%Y%m%d-%H%M%S')}_{uuid.uuid4().hex[:8]}_{directory.name}"
+    )
+    try:
+        directory.rename(target)
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        logger.warning(f"{directory}: {directory_trash} on another filesystem: {e!r}")
+        shutil.rmtree(directory, ignore_errors=True)
+    return True
+
+
+def _scan(directory: str) -> typing.Iterator[tuple[str, list[os.DirEntry]]]:
+    """
+    Yields (dirpath, files) bottom up: A directory is yielded after its subdirectories.
+    """
+    files: list[os.DirEntry] = []
+    subdirectories: list[str] = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                else:
+                    files.append(entry)
+    except FileNotFoundError:
+        return
+    except OSError as e:
+        # Skipped: The directory stays in the trash
+        logger.warning(f"{directory}: {e!r}")
+        return
+    for subdirectory in subdirectories:
+        yield from _scan(subdirectory)
+    yield directory, files
+
+
+def _size(entry: os.DirEntry) -> int:
+    try:
+        return entry.stat(follow_symlinks=False).st_size
+    except OSError:
+        return 0
+
+
+def _count(directory: pathlib.Path) -> list[int]:
+    """
+    Returns [files, bytes] in 'directory'.
+    """
+    files = 0
+    size = 0
+    for _dirpath, entries in _scan(str(directory)):
+        files += len(entries)
+        size += sum(_size(f) for f in entries)
+    return [files, size]
+
+
+class Trash:
+    def __init__(self, directory: pathlib.Path) -> None:
+        self.directory = directory
+
+    @property
+    def filename_progress(self) -> pathlib.Path:
+        return self.directory / FILENAME_PROGRESS
+
+    def move(self, directory: pathlib.Path) -> bool:
+        return move_to_trash(directory=directory, directory_trash=self.directory)
+
+    def _entries(self) -> list[pathlib.Path]:
+        if not self.directory.is_dir():
+            return []
+        return sorted(p for p in self.directory.iterdir() if p.is_dir())
+
+    def _read_progress(self) -> TrashProgress | None:
+        try:
+            json_dict = json.loads(self.filename_progress.read_text())
+            return TrashProgress(**json_dict)
+        except (FileNotFoundError, ValueError, TypeError):
+            return None
+
+    def progress(self) -> TrashProgress:
+        """
+        As written by the last 'empty()'.
+        Directories trashed since then are not counted yet.
+        """
+        progress = self._read_progress()
+        if progress is None:
+            return TrashProgress(directories=len(self._entries()))
+        return progress
+
+    def _write_progress(self, progress: TrashProgress) -> None:
+        progress.updated_at = time.time()
+        filename_tmp = self.filename_progress.with_suffix(".tmp")
+        filename_tmp.write_text(json.dumps(dataclasses.asdict(progress), indent=4))
+        filename_tmp.replace(self.filename_progress)
+
+    def empty(
+        self,
+        files_per_s: float,
+        workers: int,
+        time_budget_s: float,
+    ) -> TrashProgress:
+        """
+        Deletes the trash, the oldest directory first.
+        Returns after 'time_budget_s' even if the trash is not empty yet.
+        Files which can not be deleted are logged and skipped.
+        """
+        time_end = time.monotonic() + time_budget_s
+        entries = self._entries()
+        progress_previous = self._read_progress() or TrashProgress()
+        progress = TrashProgress(directories=len(entries))
+        for entry in entries:
+            # Only directories trashed since the previous call are scanned
+            pending = progress_previous.scanned.get(entry.name)
+            if pending is None:
+                pending = _count(entry)
+            progress.scanned[entry.name] = pending
+            progress.files_pending += pending[0]
+            progress.bytes_pending += pending[1]
+        self._write_progress(progress)
+
+        throttle = Throttle(rate_per_s=files_per_s)
+        lock = threading.Lock()
+        time_progress = time.monotonic() + PROGRESS_INTERVAL_S
+
+        def unlink(pending: list[int], batch: list[os.DirEntry]) -> None:
+            throttle.acquire(count=len(batch))
+            files = 0
+            size = 0
+            for f in batch:
+                file_size = _size(f)
+                try:
+                    os.unlink(f.path)
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    # For example EBUSY or EPERM: The other files are deleted
+                    logger.warning(f"{f.path}: {e!r}")
+                    continue
+                files += 1
+                size += file_size
+            with lock:
+                pending[0] -= files
+                pending[1] -= size
+                progress.files_pending -= files
+                progress.bytes_pending -= size
+                progress.files_deleted += files
+                progress.bytes_deleted += size
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="trash"
+        ) as executor:
+            for entry in entries:
+                # Bounded: Stops in time if the budget is used up
+                futures = collections.deque[concurrent.futures.Future]()
+                pending = progress.scanned[entry.name]
+                directories: list[str] = []
+                for dirpath, files in _scan(str(entry)):
+                    directories.append(dirpath)
+                    for i in range(0, len(files), BATCH_FILES):
+                        if time.monotonic() > time_end:
+                            # A directory with many files: Do not overrun the budget
+                            break
+                        if len(futures) >= 2 * workers:
+                            futures.popleft().result()
+                        futures.append(
+                            executor.submit(unlink, pending, files[i : i + BATCH_FILES])
+                        )
+                        if time.monotonic() > time_progress:
+                            time_progress = time.monotonic() + PROGRESS_INTERVAL_S
+                            with lock:
+                                self._write_progress(progress)
+                    if time.monotonic() > time_end:
+                        break
+                for future in futures:
+                    future.result()
+                if time.monotonic() > time_end:
+                    # The next call continues with the remaining files
+                    break
+                # Bottom up: The directories are empty now
+                for dirpath in directories:
+                    try:
+                        os.rmdir(dirpath)
+                    except OSError as e:
+                        logger.warning(f"{dirpath}: {e!r}")
+                # Files skipped: The next call scans the directory again
+                del progress.scanned[entry.name]
+                progress.files_pending -= pending[0]
+                progress.bytes_pending -= pending[1]
+                progress.directories -= 1
+                logger.info(f"{entry.name}: deleted")
+
+        self._write_progress(progress)
+        return progress
+
+
+TRASH = Trash(directory=constants.DIRECTORY_REPORTS_TRASH)
@@ -0,0 +1,617 @@
+"""
+Streaming ingestion of the tarballs posted to '/upload'.
+
+The tarball is never kept in memory as a whole:
+It is read chunk by chunk, decompressed and untared on the fly ('r|gz')
+and the very same chunks are written to the '.tgz' copy.
+
+'/upload' does not spool the request body: 'receive_upload()' parses the
+multipart body while it arrives and passes the chunks of the file to the
+extracting thread through a 'PipeReader'.
+
+Extraction runs in a thread pool, not on the event loop.
+The report is extracted into a staging directory and then published
+by an atomic rename: Readers never see a missing or half written report.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import contextlib
+import ctypes
+import errno
+import functools
+import logging
+import os
+import pathlib
+import re
+import shutil
+import tarfile
+import tempfile
+import typing
+import uuid
+import weakref
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from . import constants, util_blobstore, util_report_archive
+
+if typing.TYPE_CHECKING:
+    from python_multipart.multipart import MultipartCallbacks
+
+logger = logging.getLogger(__file__)
+
+CHUNK_SIZE_BYTES = 1024 * 1024
+
+RE_LABEL = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.@+-]*$")
+"""
+Example: github_selfhosted_testrun_107
+Example: ch_hans_1-2025-04-22_12-33-22
+"""
+
+EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=constants.UPLOAD_WORKERS,
+    thread_name_prefix="upload",
+)
+
+_LABEL_LOCKS: weakref.WeakValueDictionary[
+    str, asyncio.Lock
+] = weakref.WeakValueDictionary()
+"""
+One lock per label. A lock is garbage collected when no upload holds it anymore.
+"""
+
+
+def is_valid_label(label: str) -> bool:
+    """
+    The label becomes a directory name in DIRECTORY_REPORTS.
+    """
+    return RE_LABEL.match(label) is not None
+
+
+def format_mb(size_bytes: int) -> str:
+    return f"{size_bytes / (1024 * 1024):0.1f} MB"
+
+
+class UploadTooLargeError(Exception):
+    def __init__(self, size_bytes: int, max_bytes: int) -> None:
+        super().__init__(
+            f"File size {format_mb(size_bytes)} exceeds the {format_mb(max_bytes)} limit!"
+        )
+        self.size_bytes = size_bytes
+        self.max_bytes = max_bytes
+
+
+class TeeReader:
+    """
+    File like object to be passed to 'tarfile.open(mode="r|gz")'.
+
+    Every chunk read from 'fin' is counted, checked against 'max_bytes'
+    and written to 'fout' (if given).
+    """
+
+    def __init__(
+        self,
+        fin: typing.BinaryIO,
+        fout: typing.BinaryIO | None,
+        max_bytes: int,
+    ) -> None:
+        self.fin = fin
+        self.fout = fout
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            size = CHUNK_SIZE_BYTES
+        chunk = self.fin.read(size)
+        self.size_bytes += len(chunk)
+        if self.size_bytes > self.max_bytes:
+            raise UploadTooLargeError(
+                size_bytes=self.size_bytes, max_bytes=self.max_bytes
+            )
+        if self.fout is not None:
+            self.fout.write(chunk)
+        return chunk
+
+    def drain(self) -> None:
+        """
+        The tar end-of-archive padding may not have been consumed by tarfile.
+        Copy it anyway so that the '.tgz' copy is complete.
+        """
+        while self.read(CHUNK_SIZE_BYTES):
+            pass
+
+
+def _extractall(
+    tar: tarfile.TarFile,
+    directory: pathlib.Path,
+    blobstore: util_blobstore.BlobStore | None,
+) -> None:
+    if blobstore is None:
+        tar.extractall(path=directory, filter="tar")
+        return
+
+    for member in tar:
+        if not member.isreg() or member.size == 0:
+            tar.extract(member, path=directory, filter="tar")
+            continue
+        member_filtered = tarfile.tar_filter(member, str(directory))
+        target = directory / member_filtered.name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fin = tar.extractfile(member)
+        assert fin is not None
+        blobstore.add_file(
+            fin=fin,  # type: ignore[arg-type]
+            target=target,
+            mode=member_filtered.mode,
+            mtime=member_filtered.mtime,
+        )
+
+
+def extract_tgz(
+    fin: typing.BinaryIO,
+    directory: pathlib.Path,
+    filename_tgz: pathlib.Path,
+    max_bytes: int,
+    blobstore: util_blobstore.BlobStore | None = None,
+) -> int:
+    """
+    Untar 'fin' into 'directory' and save a copy as 'filename_tgz'.
+    Memory usage is bounded by CHUNK_SIZE_BYTES, independent of the size of the tarball.
+    If 'blobstore' is given, the regular files are deduplicated into the blobstore.
+
+    Returns the size of the tarball in bytes.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    filename_tgz.parent.mkdir(parents=True, exist_ok=True)
+    with filename_tgz.open("wb") as fout:
+        reader = TeeReader(fin=fin, fout=fout, max_bytes=max_bytes)
+        with tarfile.open(
+            fileobj=typing.cast(typing.BinaryIO, reader),
+            mode="r|gz",
+            bufsize=CHUNK_SIZE_BYTES,
+        ) as tar:
+            _extractall(tar=tar, directory=directory, blobstore=blobstore)
+        reader.drain()
+    logger.info(f"{filename_tgz}: {format_mb(reader.size_bytes)} extracted")
+    return reader.size_bytes
+
+
+_RENAME_EXCHANGE = 2
+_AT_FDCWD = -100
+
+
+@functools.cache
+def _renameat2() -> typing.Any:
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return None
+    renameat2.argtypes = [
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_uint,
+    ]
+    renameat2.restype = ctypes.c_int
+    return renameat2
+
+
+def rename_exchange(path_a: pathlib.Path, path_b: pathlib.Path) -> bool:
+    """
+    Atomically swap 'path_a' and 'path_b' (linux renameat2(RENAME_EXCHANGE)).
+    Returns False if not supported by the platform or filesystem.
+    """
+    renameat2 = _renameat2()
+    if renameat2 is None:
+        return False
+    rc = renameat2(
+        _AT_FDCWD,
+        os.fsencode(path_a),
+        _AT_FDCWD,
+        os.fsencode(path_b),
+        _RENAME_EXCHANGE,
+    )
+    if rc == 0:
+        return True
+    error = ctypes.get_errno()
+    if error in (errno.EINVAL, errno.ENOSYS):
+        return False
+    raise OSError(error, os.strerror(error), str(path_a), None, str(path_b))
+
+
+def publish_directory(
+    directory_new: pathlib.Path,
+    directory_final: pathlib.Path,
+) -> None:
+    """
+    Replace 'directory_final' by 'directory_new'.
+    'directory_new' has to be on the same filesystem.
+    """
+    if not directory_final.exists():
+        directory_new.rename(directory_final)
+        return
+
+    if rename_exchange(directory_new, directory_final):
+        # 'directory_new' now contains the previous report
+        shutil.rmtree(directory_new, ignore_errors=True)
+        return
+
+    # Fallback: Two renames - the report is missing for a very short moment
+    directory_old = directory_new.with_name(f"{directory_new.name}.old")
+    directory_final.rename(directory_old)
+    directory_new.rename(directory_final)
+    shutil.rmtree(directory_old, ignore_errors=True)
+
+
+def pack_tgz(
+    fin: typing.BinaryIO,
+    filename_zip: pathlib.Path,
+    max_bytes: int,
+) -> int:
+    """
+    Repack 'fin' into the archive 'filename_zip' without extracting it.
+    The tarball itself is not kept: The archive contains all of it.
+
+    Returns the size of the tarball in bytes.
+    """
+    filename_zip.parent.mkdir(parents=True, exist_ok=True)
+    reader = TeeReader(fin=fin, fout=None, max_bytes=max_bytes)
+    with tarfile.open(
+        fileobj=typing.cast(typing.BinaryIO, reader),
+        mode="r|gz",
+        bufsize=CHUNK_SIZE_BYTES,
+    ) as tar:
+        util_report_archive.pack_tar(tar=tar, filename_zip=filename_zip)
+    reader.drain()
+    logger.info(f"{filename_zip}: {format_mb(reader.size_bytes)} repacked")
+    return reader.size_bytes
+
+
+def ingest_tgz(
+    fin: typing.BinaryIO,
+    label: str,
+    directory_reports: pathlib.Path,
+    directory_staging: pathlib.Path,
+    max_bytes: int,
+    blobstore: util_blobstore.BlobStore | None = None,
+    storage: util_report_archive.ReportStorage = util_report_archive.ReportStorage.DIRECTORY,
+) -> pathlib.Path:
+    """
+    Extract 'fin' into the staging directory and publish it as 'directory_reports / label'.
+    This function is blocking: Call it using 'run_in_executor()'.
+
+    Returns the filename of the saved tarball (or archive).
+    """
+    directory_final = directory_reports / label
+    directory_new = directory_staging / f"{label}-{uuid.uuid4().hex}"
+    filename = directory_final / f"{label}.tgz"
+    try:
+        if storage is util_report_archive.ReportStorage.ZIP:
+            filename = directory_final / util_report_archive.FILENAME_REPORT_ARCHIVE
+            pack_tgz(
+                fin=fin,
+                filename_zip=directory_new / filename.name,
+                max_bytes=max_bytes,
+            )
+        else:
+            extract_tgz(
+                fin=fin,
+                directory=directory_new,
+                filename_tgz=directory_new / filename.name,
+                max_bytes=max_bytes,
+                blobstore=blobstore,
+            )
+        publish_directory(
+            directory_new=directory_new,
+            directory_final=directory_final,
+        )
+    finally:
+        shutil.rmtree(directory_new, ignore_errors=True)
+    return filename
+
+
+@contextlib.asynccontextmanager
+async def label_lock(label: str) -> typing.AsyncIterator[None]:
+    """
+    Uploads of the same label are serialized.
+    Uploads of different labels run in parallel.
+    """
+    lock = _LABEL_LOCKS.get(label)
+    if lock is None:
+        lock = asyncio.Lock()
+        _LABEL_LOCKS[label] = lock
+    async with lock:
+        yield
+
+
+async def run_in_executor(
+    func: typing.Callable[..., typing.Any], **kwargs: typing.Any
+) -> typing.Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(EXECUTOR, functools.partial(func, **kwargs))
+
+
+PIPE_MAX_CHUNKS = 16
+"""
+The chunks of the request body queued for the extracting thread.
+Bounds the memory per upload: If the thread falls behind, the body is not read further.
+"""
+
+FIELD_LABEL = "label"
+FIELD_FILE = "file"
+FIELD_MAX_BYTES = 1024
+
+
+class PipeReader:
+    """
+    File like object read by the extracting thread.
+    The event loop feeds the chunks of the request body as they arrive.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._queue: asyncio.Queue[bytes] = asyncio.Queue(maxsize=PIPE_MAX_CHUNKS)
+        self._buffer = b""
+        self._eof = False
+        self._aborted = False
+        self.closed = False
+        "No more chunks will be fed"
+
+    async def feed(self, chunk: bytes) -> None:
+        if chunk:
+            await self._queue.put(chunk)
+
+    async def feed_eof(self) -> None:
+        self.closed = True
+        await self._queue.put(b"")
+
+    def abort(self) -> None:
+        """
+        The reader fails: A truncated tarball must not be published.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self._aborted = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(b"")
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Called by the extracting thread: Blocks until a chunk arrives.
+        """
+        while not self._buffer and not self._eof:
+            chunk = asyncio.run_coroutine_threadsafe(
+                self._queue.get(), self._loop
+            ).result()
+            if chunk == b"" and self._aborted:
+                raise EOFError("The upload was aborted")
+            self._eof = chunk == b""
+            self._buffer = chunk
+        if size < 0 or size >= len(self._buffer):
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class _MultipartEvents:
+    """
+    Callbacks of 'MultipartParser': The events are collected
+    and then processed on the event loop, see 'receive_upload()'.
+    """
+
+    PART = "part"
+    "payload: The 'content-disposition' header"
+    DATA = "data"
+    PART_END = "part_end"
+
+    def __init__(self) -> None:
+        self.events: list[tuple[str, bytes]] = []
+        self._header_field = b""
+        self._header_value = b""
+        self._disposition = b""
+
+    def pop(self) -> list[tuple[str, bytes]]:
+        events, self.events = self.events, []
+        return events
+
+    def on_part_begin(self) -> None:
+        self._disposition = b""
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        if self._header_field.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        self.events.append((self.PART, self._disposition))
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        self.events.append((self.DATA, bytes(data[start:end])))
+
+    def on_part_end(self) -> None:
+        self.events.append((self.PART_END, b""))
+
+    def callbacks(self) -> MultipartCallbacks:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+
+async def _feed(pipe: PipeReader, task: asyncio.Task, chunk: bytes) -> None:
+    """
+    Returns early if 'task' failed: It will not read the chunk anymore.
+    """
+    put = asyncio.ensure_future(pipe.feed(chunk))
+    await asyncio.wait({put, task}, return_when=asyncio.FIRST_COMPLETED)
+    if not put.done():
+        put.cancel()
+
+
+async def receive_upload(
+    headers: Headers,
+    stream: typing.AsyncIterator[bytes],
+    ingest: typing.Callable[[str, typing.BinaryIO], typing.Awaitable[pathlib.Path]],
+) -> tuple[str, pathlib.Path]:
+    """
+    Parses the multipart/form-data body of '/upload' while it arrives.
+    'ingest(label, fin)' is started as soon as the file begins: The tarball is
+    extracted while it is still uploaded. This requires the form field 'label'
+    to precede the file (as curl sends '-F label=... -F file=@...').
+    Otherwise the file is spooled to a temporary file first.
+
+    Returns (label, the return value of 'ingest').
+    """
+    content_type, params = parse_options_header(headers.get("content-type"))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(
+            status_code=400, detail="Expected a 'multipart/form-data' body."
+        )
+    events = _MultipartEvents()
+    parser = MultipartParser(params[b"boundary"], events.callbacks())
+    label: str | None = None
+    name = ""
+    field = bytearray()
+    pipe: PipeReader | None = None
+    task: asyncio.Task[pathlib.Path] | None = None
+    spool: tempfile.SpooledTemporaryFile[bytes] | None = None
+    try:
+        async for chunk in stream:
+            parser.write(chunk)
+            for event, payload in events.pop():
+                if event == _MultipartEvents.PART:
+                    _, options = parse_options_header(payload)
+                    name = options.get(b"name", b"").decode("utf-8", errors="replace")
+                    field.clear()
+                    if name != FIELD_FILE:
+                        continue
+                    if label is None:
+                        spool = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE_BYTES)
+                        continue
+                    pipe = PipeReader(loop=asyncio.get_running_loop())
+                    task = asyncio.create_task(
+                        ingest(label, pipe)  # type: ignore[arg-type]
+                    )
+                elif event == _MultipartEvents.DATA:
+                    if name == FIELD_FILE:
+                        if pipe is not None and task is not None:
+                            await _feed(pipe=pipe, task=task, chunk=payload)
+                        elif spool is not None:
+                            await asyncio.to_thread(spool.write, payload)
+                    elif name == FIELD_LABEL:
+                        field += payload
+                        if len(field) > FIELD_MAX_BYTES:
+                            raise HTTPException(
+                                status_code=400, detail="Form field 'label' too long."
+                            )
+                elif event == _MultipartEvents.PART_END:
+                    if name == FIELD_LABEL:
+                        label = field.decode("utf-8", errors="replace")
+                    elif name == FIELD_FILE and pipe is not None:
+                        await pipe.feed_eof()
+            if task is not None and task.done():
+                # Failed before the end of the tarball: Do not read the rest
+                break
+        else:
+            parser.finalize()
+
+        if task is not None:
+            assert pipe is not None
+            # The body ended before the end of the file: The tarball is truncated
+            pipe.abort()
+            return label, await task  # type: ignore[return-value]
+        if label is None or spool is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Form fields '{FIELD_LABEL}' and '{FIELD_FILE}' are required.",
+            )
+        spool.seek(0)
+        return label, await ingest(label, spool)  # type: ignore[arg-type]
+    except BaseException:
+        if pipe is not None:
+            pipe.abort()
+        if task is not None:
+            # The thread fails and removes its staging directory
+            task.cancel()
+        raise
+    finally:
+        if spool is not None:
+            spool.close()
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware: Enforce 'max_bytes' on the request body of 'paths'
+    while the bytes arrive.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        paths: tuple[str, ...],
+        max_bytes: int,
+    ) -> None:
+        self.app = app
+        self.paths = paths
+        self.max_bytes = max_bytes
+
+    def _http_exception(self, size_bytes: int) -> HTTPException:
+        return HTTPException(
+            status_code=413,  # Payload Too Large
+            detail=str(
+                UploadTooLargeError(size_bytes=size_bytes, max_bytes=self.max_bytes)
+            ),
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length is not None and content_length.isdigit():
+            if int(content_length) > self.max_bytes:
+                response = JSONResponse(
+                    content={
+                        "detail": self._http_exception(int(content_length)).detail
+                    },
+                    status_code=413,
+                )
+                await response(scope, receive, send)
+                return
+
+        size_bytes = 0
+
+        async def receive_limited() -> Message:
+            nonlocal size_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                size_bytes += len(message.get("body", b""))
+                if size_bytes > self.max_bytes:
+                    raise self._http_exception(size_bytes=size_bytes)
+            return message
+
+        await self.app(scope, receive_limited, send)
@@ -0,0 +1,323 @@
+"""
+Resumable upload of large tarballs over flaky links.
+
+  1. POST /upload/sessions  label, size_bytes, sha256 (optional, of the whole tarball)
+       -> {"session_id": ...}
+  2. PUT  /upload/sessions/{session_id}?offset=N  body: chunk, header 'X-Chunk-Sha256'
+       Chunks may be sent in any order and in parallel.
+  3. GET  /upload/sessions/{session_id}
+       -> received and missing ranges: After a dropped connection, only the missing ranges have to be sent again.
+  4. POST /upload/sessions/{session_id}/finalize
+       -> Extraction as for '/upload'.
+
+Example:
+
+  curl -X POST -F "label=github_selfhosted_testrun_107" -F "size_bytes=$(stat -c %s x.tgz)" http://localhost:8000/upload/sessions
+  curl -X PUT --data-binary @x.tgz -H "X-Chunk-Sha256: $(sha256sum x.tgz | cut -d' ' -f1)" "http://localhost:8000/upload/sessions/<session_id>?offset=0"
+  curl -X POST http://localhost:8000/upload/sessions/<session_id>/finalize
+
+Layout of a session in DIRECTORY_REPORTS_SPOOL:
+
+  <session_id>/session.json
+  <session_id>/data.tgz               Preallocated, chunks are written in place
+  <session_id>/chunks/<offset>-<size> Marker: Chunk received and checksum verified
+  <session_id>/incoming/<uuid>        A chunk beeing received: Copied into 'data.tgz' once verified
+"""
+
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import re
+import shutil
+import time
+import typing
+import uuid
+
+from fastapi import HTTPException
+
+from . import util_blobstore, util_report_archive, util_upload
+
+logger = logging.getLogger(__file__)
+
+FILENAME_SESSION_JSON = "session.json"
+FILENAME_DATA = "data.tgz"
+DIRECTORYNAME_CHUNKS = "chunks"
+DIRECTORYNAME_INCOMING = "incoming"
+
+RE_SESSION_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _file_sha256(filename: pathlib.Path) -> str:
+    hasher = hashlib.sha256()
+    with filename.open("rb") as f:
+        while chunk := f.read(util_upload.CHUNK_SIZE_BYTES):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _merge_ranges(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """
+    ranges: list of (offset, size)
+    Returns the sorted list of contiguous (offset, size).
+    """
+    merged: list[tuple[int, int]] = []
+    for offset, size in sorted(ranges):
+        if merged:
+            last_offset, last_size = merged[-1]
+            if offset <= last_offset + last_size:
+                end = max(last_offset + last_size, offset + size)
+                merged[-1] = (last_offset, end - last_offset)
+                continue
+        merged.append((offset, size))
+    return merged
+
+
+@dataclasses.dataclass(slots=True)
+class UploadSession:
+    directory_spool: pathlib.Path
+    session_id: str
+    label: str
+    size_bytes: int
+    sha256: str = ""
+    "Optional: sha256 of the complete tarball"
+
+    @property
+    def directory(self) -> pathlib.Path:
+        return self.directory_spool / self.session_id
+
+    @property
+    def filename_data(self) -> pathlib.Path:
+        return self.directory / FILENAME_DATA
+
+    @property
+    def directory_chunks(self) -> pathlib.Path:
+        return self.directory / DIRECTORYNAME_CHUNKS
+
+    @property
+    def directory_incoming(self) -> pathlib.Path:
+        return self.directory / DIRECTORYNAME_INCOMING
+
+    @staticmethod
+    def create(
+        directory_spool: pathlib.Path,
+        label: str,
+        size_bytes: int,
+        sha256: str,
+        max_bytes: int,
+    ) -> UploadSession:
+        if size_bytes > max_bytes:
+            raise HTTPException(
+                status_code=413,  # Payload Too Large
+                detail=str(
+                    util_upload.UploadTooLargeError(
+                        size_bytes=size_bytes, max_bytes=max_bytes
+                    )
+                ),
+            )
+        session = UploadSession(
+            directory_spool=directory_spool,
+            session_id=uuid.uuid4().hex,
+            label=label,
+            size_bytes=size_bytes,
+            sha256=sha256.lower(),
+        )
+        session.directory_chunks.mkdir(parents=True)
+        with session.filename_data.open("wb") as f:
+            # Sparse file: Chunks are written in place
+            f.truncate(size_bytes)
+        json_text = json.dumps(
+            {
+                "label": session.label,
+                "size_bytes": session.size_bytes,
+                "sha256": session.sha256,
+            },
+            indent=4,
+        )
+        (session.directory / FILENAME_SESSION_JSON).write_text(json_text)
+        logger.info(f"{session.session_id}: created for {label} ({size_bytes=})")
+        return session
+
+    @staticmethod
+    def read(directory_spool: pathlib.Path, session_id: str) -> UploadSession:
+        session_json = directory_spool / session_id / FILENAME_SESSION_JSON
+        if not RE_SESSION_ID.match(session_id) or not session_json.is_file():
+            raise HTTPException(
+                status_code=404, detail=f"Upload session '{session_id}' not found."
+            )
+        json_dict = json.loads(session_json.read_text())
+        return UploadSession(
+            directory_spool=directory_spool,
+            session_id=session_id,
+            **json_dict,
+        )
+
+    def received_ranges(self) -> list[tuple[int, int]]:
+        ranges: list[tuple[int, int]] = []
+        for marker in self.directory_chunks.iterdir():
+            offset, _, size = marker.name.partition("-")
+            ranges.append((int(offset), int(size)))
+        return _merge_ranges(ranges)
+
+    def missing_ranges(self) -> list[tuple[int, int]]:
+        missing: list[tuple[int, int]] = []
+        pos = 0
+        for offset, size in self.received_ranges():
+            if offset > pos:
+                missing.append((pos, offset - pos))
+            pos = max(pos, offset + size)
+        if pos < self.size_bytes:
+            missing.append((pos, self.size_bytes - pos))
+        return missing
+
+    def status(self) -> dict[str, typing.Any]:
+        return {
+            "session_id": self.session_id,
+            "label": self.label,
+            "size_bytes": self.size_bytes,
+            "received": self.received_ranges(),
+            "missing": self.missing_ranges(),
+        }
+
+    async def write_chunk(
+        self,
+        offset: int,
+        stream: typing.AsyncIterator[bytes],
+        sha256: str,
+    ) -> None:
+        """
+        The chunk is spooled and verified first: Only a verified chunk is copied
+        into 'data.tgz' and marked as received.
+        A corrupt resend of a received range never overwrites the verified bytes.
+        """
+        if not 0 <= offset <= self.size_bytes:
+            raise HTTPException(
+                status_code=416,  # Range Not Satisfiable
+                detail=f"Offset {offset} is outside of 0..{self.size_bytes}!",
+            )
+        self.directory_incoming.mkdir(exist_ok=True)
+        filename_chunk = self.directory_incoming / uuid.uuid4().hex
+        hasher = hashlib.sha256()
+        size = 0
+        buffer = bytearray()
+        try:
+            with filename_chunk.open("wb") as f:
+                async for piece in stream:
+                    size += len(piece)
+                    if offset + size > self.size_bytes:
+                        raise HTTPException(
+                            status_code=416,  # Range Not Satisfiable
+                            detail=f"Chunk at offset {offset} exceeds size_bytes {self.size_bytes}!",
+                        )
+                    hasher.update(piece)
+                    buffer += piece
+                    if len(buffer) >= util_upload.CHUNK_SIZE_BYTES:
+                        await asyncio.to_thread(f.write, bytes(buffer))
+                        buffer.clear()
+                await asyncio.to_thread(f.write, bytes(buffer))
+
+            if hasher.hexdigest() != sha256.lower():
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Checksum mismatch for chunk at offset {offset}: Please resend!",
+                )
+            if size > 0:
+                await asyncio.to_thread(self._copy_chunk, filename_chunk, offset)
+                (self.directory_chunks / f"{offset}-{size}").touch()
+        finally:
+            filename_chunk.unlink(missing_ok=True)
+
+    def _copy_chunk(self, filename_chunk: pathlib.Path, offset: int) -> None:
+        fd = os.open(self.filename_data, os.O_WRONLY)
+        try:
+            with filename_chunk.open("rb") as fin:
+                pos = offset
+                while piece := fin.read(util_upload.CHUNK_SIZE_BYTES):
+                    os.pwrite(fd, piece, pos)
+                    pos += len(piece)
+        finally:
+            os.close(fd)
+
+    def finalize(
+        self,
+        directory_reports: pathlib.Path,
+        directory_staging: pathlib.Path,
+        max_bytes: int,
+        blobstore: util_blobstore.BlobStore | None = None,
+        storage: util_report_archive.ReportStorage = util_report_archive.ReportStorage.DIRECTORY,
+    ) -> pathlib.Path:
+        """
+        Hand over the complete tarball to the same extraction as '/upload'.
+        This function is blocking: Call it using 'run_in_executor()'.
+
+        Returns the filename of the saved tarball.
+        """
+        missing = self.missing_ranges()
+        if len(missing) > 0:
+            raise HTTPException(
+                status_code=409,  # Conflict
+                detail=f"Upload session '{self.session_id}' is incomplete: missing {missing}",
+            )
+        if self.sha256 != "":
+            sha256 = _file_sha256(self.filename_data)
+            if sha256 != self.sha256:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Checksum mismatch: expected {self.sha256} but got {sha256}!",
+                )
+
+        with self.filename_data.open("rb") as fin:
+            filename_tgz = util_upload.ingest_tgz(
+                fin=fin,
+                label=self.label,
+                directory_reports=directory_reports,
+                directory_staging=directory_staging,
+                max_bytes=max_bytes,
+                blobstore=blobstore,
+                storage=storage,
+            )
+        self.delete()
+        return filename_tgz
+
+    def delete(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _activity_mtime(directory: pathlib.Path) -> float:
+    """
+    The latest of: Session created, chunk received, chunk beeing received.
+    """
+    directory_incoming = directory / DIRECTORYNAME_INCOMING
+    paths = [directory, directory / DIRECTORYNAME_CHUNKS, directory_incoming]
+    try:
+        # Written to while the chunk arrives
+        paths.extend(directory_incoming.iterdir())
+    except FileNotFoundError:
+        pass
+    mtime = 0.0
+    for path in paths:
+        try:
+            mtime = max(mtime, path.stat().st_mtime)
+        except FileNotFoundError:
+            continue
+    return mtime
+
+
+def purge_expired_sessions(directory_spool: pathlib.Path, expiry_s: float) -> int:
+    """
+    Remove sessions without activity (no chunk received or beeing received) for 'expiry_s'.
+    Returns the number of sessions purged.
+    """
+    sessions_purged = 0
+    time_limit = time.time() - expiry_s
+    for directory in directory_spool.glob("*"):
+        if _activity_mtime(directory) < time_limit:
+            logger.info(f"{directory.name}: upload session expired")
+            shutil.rmtree(directory, ignore_errors=True)
+            sessions_purged += 1
+    return sessions_purged
@@ -0,0 +1,113 @@
+"""
+Benchmark: Render a .color file (test output with ANSI colors).
+
+Compares the previous rendering ('ansi2html' on the whole file, then a regex over
+the finished html to linkify) with the streaming 'util_ansi.AnsiHtml'.
+
+Run from the repository root:
+
+  python -m benchmarks.bench_ansi
+"""
+
+from __future__ import annotations
+
+import pathlib
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+import typing
+
+from ansi2html import Ansi2HTMLConverter
+from app import render_ansii_color
+from app.util_path_replace import PathReplace
+
+LINES = 200_000
+RESULTS = "/home/octoprobe/testbed_micropython/results"
+
+TEMPLATES = (
+    "\x1b[32mpass \x1b[0m basics/{test}.py",
+    "\x1b[34mskip \x1b[0m extmod/{test}.py",
+    "\x1b[38;5;214mFAIL \x1b[0m {results}/RUN-TESTS_BASICS@{board}/{test}.py.out",
+    "{board}: 12 tests performed (453 individual testcases)",
+    "\x1b[1;32m12 tests passed\x1b[0m",
+    "Traceback (most recent call last): <module> 'x' & \"y\"",
+)
+BOARDS = ("RPI_PICO2-RISCV", "ESP32_GENERIC_S3", "PYBV11")
+TESTS = ("int_big_mul", "string_format", "async_await", "bytes_compare")
+
+RE_LINKS = re.compile(r"\/(?:[^\/\s]+\/)*[^\/\s]+")
+
+
+def render_before(color_file: pathlib.Path) -> str:
+    """
+    The previous implementation.
+    """
+
+    def f(match: re.Match) -> str:
+        link = match.group(0)
+        link_small = link.replace(f"{RESULTS}/", "")
+        return f'<a href="http://{link}">{link_small}</a>'
+
+    conv = Ansi2HTMLConverter(
+        dark_bg=False, linkify=False, scheme="xterm", markup_lines=True
+    )
+    html_content = conv.convert(color_file.read_text(encoding="utf-8"), full=False)
+    return RE_LINKS.sub(f, html_content)
+
+
+def render_after(color_file: pathlib.Path) -> typing.Iterator[str]:
+    replace = PathReplace(
+        directories={"R": RESULTS},
+        git_ref={},
+        urls={"R": "/github_selfhosted_testrun_107/"},
+    )
+    return render_ansii_color.iter_render(
+        color_file=color_file, path_replace=replace, title="title"
+    )
+
+
+def create_color_file(filename: pathlib.Path) -> None:
+    rnd = random.Random(42)
+    lines = (
+        rnd.choice(TEMPLATES).format(
+            board=rnd.choice(BOARDS), test=rnd.choice(TESTS), results=RESULTS
+        )
+        for _ in range(LINES)
+    )
+    filename.write_text("\n".join(lines) + "\n")
+
+
+def consume(html: str | typing.Iterator[str]) -> int:
+    """
+    Like a response: The chunks are not kept.
+    """
+    if isinstance(html, str):
+        return len(html)
+    return sum(len(chunk) for chunk in html)
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        color_file = pathlib.Path(directory) / "testresults.color"
+        create_color_file(color_file)
+        print(f"{LINES} lines, {color_file.stat().st_size / 1e6:0.1f}MBytes")
+
+        for name, func in (("before", render_before), ("after", render_after)):
+            time_start = time.perf_counter()
+            size = consume(func(color_file))
+            duration_s = time.perf_counter() - time_start
+
+            tracemalloc.start()
+            consume(func(color_file))
+            _current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            print(
+                f"{name}: {duration_s:0.3f}s {LINES / duration_s / 1e3:0.0f}klines/s, {size / 1e6:0.1f}MChars, peak {peak / 1e6:0.1f}MBytes"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark: Display of a non utf-8 file (for example a serial capture).
+
+Compares the previous per byte generator with the table driven 'util_sniff.escape_bytes()'.
+
+Run from the repository root:
+
+  python -m benchmarks.bench_escape
+"""
+
+from __future__ import annotations
+
+import pathlib
+import random
+import tempfile
+import time
+
+from app import util_sniff
+
+SIZE_BYTES = 50 * 1024 * 1024
+
+
+def create_capture(filename: pathlib.Path) -> None:
+    """
+    Mixed text/binary, similar to a serial capture of a board.
+    """
+    rnd = random.Random(42)
+    line = b"INFO     - \x1b[32mtest_basics.py: pass\x1b[0m\r\n"
+    with filename.open("wb") as f:
+        size = 0
+        while size < SIZE_BYTES:
+            block = line * 200 + rnd.randbytes(256)
+            f.write(block)
+            size += len(block)
+
+
+def escape_before(filename: pathlib.Path) -> int:
+    content_bytes = filename.read_bytes()
+
+    def bytes_to_ascii_escape(data: bytes) -> str:
+        return "".join(
+            chr(b) if (0x20 <= b <= 0x7E) or (b == 0x0A) else f"\\x{b:02x}"
+            for b in data
+        )
+
+    content_text = util_sniff.ESCAPE_HEADER + bytes_to_ascii_escape(content_bytes)
+    return len(content_text)
+
+
+def escape_after(filename: pathlib.Path) -> int:
+    time_start = time.perf_counter()
+    size = 0
+    for i, chunk in enumerate(util_sniff.iter_escaped(filename)):
+        if i == 1:
+            print(f"  first chunk after {time.perf_counter() - time_start:0.3f}s")
+        size += len(chunk)
+    return size
+
+
+def sniff(filename: pathlib.Path) -> util_sniff.Sniff:
+    return util_sniff.sniff(filename)
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        filename = pathlib.Path(directory) / "capture.txt"
+        create_capture(filename)
+        print(f"{filename.stat().st_size / 1e6:0.1f} MB")
+
+        results = {}
+        for func in (sniff, sniff, escape_before, escape_after):
+            time_start = time.perf_counter()
+            results[func.__name__] = func(filename)
+            print(f"{func.__name__}: {time.perf_counter() - time_start:0.3f}s")
+        assert results["escape_before"] == results["escape_after"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmark: Render a logfile to html.
+
+Compares the previous 'Segments' based rendering (a context manager per tag,
+a 'Segments' and a 'StringIO' per line) with 'HtmlWriter'.
+Both render the same logfile through the same index: The output must be identical.
+
+Run from the repository root:
+
+  python -m benchmarks.bench_html
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import pathlib
+import tempfile
+import time
+import tracemalloc
+import typing
+
+from app import constants, render_log
+from app.util_html import Segments
+from markupsafe import Markup
+from starlette.datastructures import URL
+
+from .bench_path_replace import DIRECTORIES, URLS, corpus_synthetic
+
+LABEL = "github_selfhosted_testrun_107"
+
+
+class RenderBefore(render_log.Render):
+    """
+    The previous implementation.
+    """
+
+    def _render_line_before(self, line_payload: str, line_number: int) -> Segments:
+        segments = Segments()
+
+        with segments.tag("div", params='class="line"'):
+            match_severity_text = render_log.RE_SEVERITY_TEXT.match(line_payload)
+            if match_severity_text:
+                self.line_severity_text = match_severity_text.group("severity")
+                self.color_schema = match_severity_text.group("color_schema")
+                line_payload = match_severity_text.group("payload")
+                if self.line_severity_text != self.last_severity:
+                    self.last_severity = self.line_severity_text
+                    with segments.tag(
+                        "a",
+                        params=f'id="line{line_number}" name="line{line_number}"',
+                    ):
+                        html_number = render_log.severity_links(
+                            line_number=line_number,
+                            severity=self.severity,
+                            page_of=self.page_of,
+                        )
+                        segments.append(Markup(html_number))
+            with segments.tag(
+                "span", params=f'class="text {self.last_severity} {self.color_schema}"'
+            ):
+                segments.extend(self.replace.expand_href_line(line=line_payload))
+
+        if render_log.DICT_SEVERITY_TEXT[self.line_severity_text] >= self.severity:
+            return segments
+        return Segments()
+
+    def iter_render(self) -> typing.Iterator[str]:
+        it = super().iter_render()
+        # The header is unchanged
+        yield next(it)
+
+        chunk: list[str] = []
+        chunk_size = 0
+        for line_begin, line_end in self.index.iter_ranges(
+            severity=self.severity, start=0, stop=None
+        ):
+            lines = self.index.iter_lines(
+                logfile=self.logfile, line_begin=line_begin, line_end=line_end
+            )
+            states = self.index.iter_states(line_begin=line_begin, line_end=line_end)
+            for line, text, state in zip(
+                range(line_begin, line_end), lines, states, strict=True
+            ):
+                self._set_state(line, *state)
+                html_line = self._render_line_before(
+                    line_payload=text.rstrip(),
+                    line_number=line + 1,
+                ).as_string()
+                chunk.append(html_line)
+                chunk_size += len(html_line)
+                if chunk_size >= render_log.FLUSH_SIZE_CHARS:
+                    yield "".join(chunk)
+                    chunk.clear()
+                    chunk_size = 0
+        if chunk:
+            yield "".join(chunk)
+
+
+def create_report(directory: pathlib.Path) -> pathlib.Path:
+    constants.DIRECTORY_REPORTS = directory / "reports"
+    constants.DIRECTORY_REPORTS_METADATA = directory / "reports_metadata"
+    directory_report = constants.DIRECTORY_REPORTS / LABEL
+    (directory_report / "RUN-TESTS_BASICS").mkdir(parents=True)
+    (directory_report / "context.json").write_text(
+        json.dumps({"directories": DIRECTORIES, "git_ref": {}})
+    )
+    lines, _directories = corpus_synthetic()
+    logfile = directory_report / "RUN-TESTS_BASICS" / render_log.DEFAULT_LOGFILE
+    logfile.write_text("\n".join(lines) + "\n")
+    return logfile
+
+
+def consume(chunks: typing.Iterator[str]) -> tuple[str, int]:
+    """
+    Like a streaming response: The chunks are not kept.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in chunks:
+        digest.update(chunk.encode())
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        logfile = create_report(pathlib.Path(directory))
+        url = URL(f"/{LABEL}/RUN-TESTS_BASICS/{render_log.DEFAULT_LOGFILE}")
+        print(f"{logfile.stat().st_size / 1e6:0.1f}MBytes, {len(URLS)} urls")
+
+        for severity_text in ("DEBUG", "WARNING"):
+            results = {}
+            for name, cls in (("before", RenderBefore), ("after", render_log.Render)):
+                # Build the index and warm up the caches
+                cls(logfile=logfile, url=url, severity_text=severity_text)
+
+                time_start = time.perf_counter()
+                r = cls(logfile=logfile, url=url, severity_text=severity_text)
+                results[name], size = consume(r.iter_render())
+                duration_s = time.perf_counter() - time_start
+
+                tracemalloc.start()
+                r = cls(logfile=logfile, url=url, severity_text=severity_text)
+                consume(r.iter_render())
+                _current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                print(
+                    f"{severity_text} {name}: {duration_s:0.3f}s {size / duration_s / 1e6:0.1f}MChars/s, peak {peak / 1e3:0.0f}kBytes"
+                )
+            print(f"{severity_text} identical: {results['before'] == results['after']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark: Classification of the listing style of every entry in a report tree.
+
+Compares the linear scan over 'LIST_RE_2_STYLE' with the basename lookup classifier
+(cold and memoized).
+
+Run from the repository root:
+
+  python -m benchmarks.bench_listing_style [directory_reports]
+
+Without 'directory_reports', a synthetic tree of report paths is used.
+"""
+
+from __future__ import annotations
+
+import pathlib
+import sys
+import time
+
+from app import render_directory_style
+from tests.test_directory_style import get_listing_style_linear
+
+REPETITIONS = 5
+
+
+def paths_synthetic() -> list[str]:
+    paths: list[str] = []
+    for testrun in range(100, 140):
+        label = f"github_selfhosted_testrun_{testrun}"
+        paths.append(label)
+        paths.append(f"{label}/task_report.md")
+        paths.append(f"{label}/mpbuild")
+        for board in ("RPI_PICO2", "ESP32_GENERIC", "PYBV11", "NUCLEO_WB55"):
+            paths.append(f"{label}/mpbuild/{board}")
+            paths.append(f"{label}/mpbuild/{board}/firmware.uf2")
+            paths.append(f"{label}/mpbuild/{board}/docker_stdout.txt")
+        for run in ("BASICS", "EXTMOD", "PERFORMANCE", "NET"):
+            for tentacle in range(8):
+                run_dir = f"{label}/RUN-TESTS_{run}@{tentacle}"
+                paths.append(run_dir)
+                paths.append(f"{run_dir}/testresults")
+                paths.append(f"{run_dir}/testresults.txt")
+                paths.append(f"{run_dir}/logger_10_debug.log")
+                paths.append(f"{run_dir}/logger_20_info.log")
+                paths.append(f"{run_dir}/flashing_stdout.txt")
+                for test in range(20):
+                    paths.append(f"{run_dir}/testresults/test_{test}.py.out")
+    return paths
+
+
+def paths_directory(directory_reports: pathlib.Path) -> list[str]:
+    return [str(p.relative_to(directory_reports)) for p in directory_reports.rglob("*")]
+
+
+def main() -> None:
+    if len(sys.argv) > 1:
+        paths = paths_directory(pathlib.Path(sys.argv[1]))
+    else:
+        paths = paths_synthetic()
+    print(f"{len(paths)} paths")
+
+    funcs = (
+        ("linear", get_listing_style_linear),
+        ("classifier", render_directory_style.CLASSIFIER.classify),
+        ("memoized", render_directory_style.get_listing_style),
+    )
+    results = {}
+    for name, func in funcs:
+        time_start = time.perf_counter()
+        for _ in range(REPETITIONS):
+            results[name] = [func(path) for path in paths]
+        duration_s = (time.perf_counter() - time_start) / REPETITIONS
+        print(
+            f"{name}: {duration_s * 1e3:0.1f}ms ({duration_s / len(paths) * 1e6:0.2f}us/path)"
+        )
+    assert results["linear"] == results["classifier"] == results["memoized"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Benchmark: Linkify the paths in the lines of a logfile.
+
+Compares the previous 'PathReplace' (one 'str.find()' per trigger, recursion)
+with the combined regular expression.
+
+Run from the repository root:
+
+  python -m benchmarks.bench_path_replace [logger_10_debug.log context.json]
+
+Without arguments, a corpus is generated from line templates taken from real testrun logs.
+"""
+
+from __future__ import annotations
+
+import json
+import pathlib
+import random
+import sys
+import time
+
+from app.util_html import Segments
+from app.util_path_replace import PathMatch, PathReplace
+from markupsafe import Markup
+
+LINES = 200_000
+
+DIRECTORIES = {
+    "R": "/home/octoprobe/testbed_micropython/results",
+    "T": "/home/octoprobe/octoprobe_downloads/cache_git/micropython_firmware",
+    "F": "/home/octoprobe/octoprobe_downloads/cache_git/micropython_firmware/ports",
+    "W": "/home/octoprobe/testbed_micropython/results/worktree",
+}
+URLS = {"R": "/github_selfhosted_testrun_107/", "T": "http://t/"}
+
+TEMPLATES = (
+    "DEBUG    - EventExitRun: {R}/RUN-TESTS_BASICS@{board}/testresults.txt",
+    "DEBUG    - subprocess: cd {T} && python run-tests.py --result-dir={R}/RUN-TESTS_EXTMOD_HARDWARE@{board}/testresults -t port:{tty}",
+    "INFO     - [COLOR_INFO]{board}: Firmware build start.",
+    "INFO     - [COLOR_SUCCESS]{board}: Flashing {R}/mpbuild/{board}/firmware.uf2 done in 3.2s",
+    "DEBUG    - {board}: Serial {tty} 115200 baud: 'soft reboot'",
+    "WARNING  - [COLOR_FAILED]{board}: {R}/RUN-TESTS_NET@{board}/testresults.txt: 3 tests failed: {F}/rp2/boards/{board}/mpconfigboard.h",
+    "DEBUG    - git -C {T} checkout v1.26.0",
+    "DEBUG    - pass  basics/{test}.py",
+    "ERROR    - [COLOR_ERROR]{board}: Timeout after 60s: see {R}/RUN-TESTS_BASICS@{board}/logger_20_info.log and {W}/tests/{test}.py.out",
+    "DEBUG    - tests.py: {W}/tests/{test}.py 'ok'",
+)
+
+BOARDS = (
+    "RPI_PICO2-RISCV",
+    "ESP32_GENERIC_S3",
+    "PYBV11",
+    "NUCLEO_WB55",
+    "LOLIN_C3_MINI",
+)
+TESTS = ("int_big_mul", "string_format", "async_await", "bytes_compare", "fun_defargs")
+
+
+def corpus_synthetic() -> tuple[list[str], dict[str, str]]:
+    rnd = random.Random(42)
+    lines = [
+        rnd.choice(TEMPLATES).format(
+            board=rnd.choice(BOARDS),
+            test=rnd.choice(TESTS),
+            tty=f"/dev/ttyACM{rnd.randrange(8)}",
+            **DIRECTORIES,
+        )
+        for _ in range(LINES)
+    ]
+    return lines, DIRECTORIES
+
+
+def corpus_logfile(
+    logfile: pathlib.Path, context_json: pathlib.Path
+) -> tuple[list[str], dict[str, str]]:
+    directories = json.loads(context_json.read_text())["directories"]
+    return logfile.read_text().splitlines(), directories
+
+
+def expand_href_line_before(self: PathReplace, line: str) -> Segments:
+    """
+    The previous implementation.
+    """
+    for label, path_trigger in self.directories.items():
+        url = self.urls.get(label, "")
+        pos = line.find(path_trigger)
+        if pos == -1:
+            continue
+        after = line[pos + len(path_trigger) :]
+        pos_endof_path = PathMatch.pos_end_of_path(path=after)
+        match = PathMatch(
+            path_before=line[0:pos],
+            path_relevant=after[0:pos_endof_path],
+            path_after=after[pos_endof_path:],
+        )
+        if url == "":
+            return Segments(
+                [
+                    match.path_before,
+                    Markup(match.path_relevant.lstrip("/")),
+                    match.path_after,
+                ]
+            )
+        segments = Segments([match.path_before, match.href(url), match.path_after])
+        return Segments(
+            s
+            for segment in segments
+            for s in (
+                [segment]
+                if isinstance(segment, Markup)
+                else expand_href_line_before(self, segment)
+            )
+        )
+    return Segments([line])
+
+
+def main() -> None:
+    if len(sys.argv) > 2:
+        lines, directories = corpus_logfile(
+            pathlib.Path(sys.argv[1]), pathlib.Path(sys.argv[2])
+        )
+    else:
+        lines, directories = corpus_synthetic()
+    replace = PathReplace(directories=directories, git_ref={}, urls=URLS)
+    print(f"{len(lines)} lines, {len(directories)} triggers")
+
+    funcs = (
+        ("before", lambda line: expand_href_line_before(replace, line)),
+        ("after", replace.expand_href_line),
+    )
+    results = {}
+    for name, func in funcs:
+        time_start = time.perf_counter()
+        results[name] = [func(line).as_string() for line in lines]
+        duration_s = time.perf_counter() - time_start
+        print(
+            f"{name}: {duration_s:0.3f}s ({duration_s / len(lines) * 1e6:0.2f}us/line)"
+        )
+    differences = sum(
+        a != b for a, b in zip(results["before"], results["after"], strict=True)
+    )
+    print(f"lines rendered differently: {differences}")
+
+
+if __name__ == "__main__":
+    main()
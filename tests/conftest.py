@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import io
+import os
+import pathlib
+import shutil
+import tarfile
+import tempfile
+
+import pytest
+from fastapi import Request
+
+DIRECTORY_TESTS_ROOT = pathlib.Path(tempfile.mkdtemp(prefix="octoprobe_tests_"))
+"""
+Before 'app' is imported: All directories in 'app.constants' are siblings of
+DIRECTORY_REPORTS and end up in here. Never the reports of the server.
+"""
+
+os.environ["DIRECTORY_REPORTS"] = str(DIRECTORY_TESTS_ROOT / "reports")
+(DIRECTORY_TESTS_ROOT / "reports").mkdir()
+os.environ.setdefault("EMAIL_USERS", "hmaerki")
+
+
+def create_tgz(files: dict[str, bytes]) -> bytes:
+    """
+    Returns a tarball as uploaded by a testrun.
+    files: name -> content
+    """
+    fout = io.BytesIO()
+    with tarfile.open(fileobj=fout, mode="w:gz") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name=name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return fout.getvalue()
+
+
+def get_request(headers: dict[str, str]) -> Request:
+    """
+    A GET request with 'headers', not bound to an app.
+    """
+    return Request(
+        scope={
+            "type": "http",
+            "method": "GET",
+            "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+        }
+    )
+
+
+@pytest.fixture
+def reports(monkeypatch: pytest.MonkeyPatch) -> pathlib.Path:
+    """
+    An empty DIRECTORY_REPORTS with its sibling directories.
+    Returns DIRECTORY_REPORTS.
+    """
+    from app import constants, util_github2
+
+    for directory in DIRECTORY_TESTS_ROOT.iterdir():
+        shutil.rmtree(directory)
+    constants.DIRECTORY_REPORTS.mkdir()
+    constants.assert_directory_reports()
+
+    # Per process state
+    monkeypatch.setattr(util_github2, "_ACCESSED_AT", {})
+    monkeypatch.setattr(util_github2, "_synced", True)
+    return constants.DIRECTORY_REPORTS
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import asyncio
+import html.parser
+import pathlib
+
+import pytest
+from ansi2html import Ansi2HTMLConverter
+from ansi2html.style import get_styles
+from app import constants, render_ansii_color, util_ansi, util_render_cache
+from app.util_html import HtmlWriter
+from app.util_path_replace import PathReplace
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.datastructures import URL
+
+
+class _Runs(html.parser.HTMLParser):
+    """
+    Reduces html to the lines of text and their css classes.
+    The markup of the links and the css rules are ignored.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.lines: list[list[tuple[str, str]]] = []
+        self._classes: list[str] = []
+        self._style = False
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        attributes = dict(attrs)
+        if tag == "style":
+            self._style = True
+        if tag != "span":
+            return
+        if "id" in attributes:
+            self.lines.append([])
+        self._classes.append(attributes.get("class") or "")
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "style":
+            self._style = False
+        if tag == "span":
+            self._classes.pop()
+
+    def handle_data(self, data: str) -> None:
+        if self._style or not self.lines:
+            return
+        classes = " ".join(c for c in self._classes if c)
+        runs = self.lines[-1]
+        if runs and runs[-1][0] == classes:
+            runs[-1] = (classes, runs[-1][1] + data)
+        else:
+            runs.append((classes, data))
+
+    @staticmethod
+    def parse(text: str) -> list[list[tuple[str, str]]]:
+        runs = _Runs()
+        runs.feed(text)
+        runs.close()
+        return [[run for run in line if run[1] != "\n"] for line in runs.lines]
+
+
+def ansi2html(text: str) -> str:
+    conv = Ansi2HTMLConverter(
+        dark_bg=False,
+        linkify=False,
+        scheme="xterm",
+        markup_lines=True,
+    )
+    return conv.convert(text, full=False)
+
+
+def ansi_html(text: str, path_replace: PathReplace | None = None) -> str:
+    writer = HtmlWriter()
+    converter = util_ansi.AnsiHtml(path_replace=path_replace)
+    for line in text.split("\n"):
+        converter.write_line(sink=writer, line=line)
+    return writer.flush()
+
+
+@pytest.mark.parametrize(
+    "text",
+    (
+        "plain <a> & \"q\" 'x'\nline2\n",
+        "\x1b[32mgreen\x1b[0m normal\n",
+        "\x1b[34mblue\x1b[0m\n\x1b[38;5;214morange\x1b[0m\n",
+        "\x1b[1;32mbold green\x1b[0m \x1b[1mbold\x1b[22m normal",
+        "\x1b[32mg\x1b[34mb\x1b[39mdefault\n",
+        "\x1b[31mred\x1b[m\x1b[0m\x1b[0m",
+        "\x1b[32;0;34mreset inside\x1b[0m",
+        "\x1b[38;5;0;48;5;17mcube\x1b[0m \x1b[38;5;232mgrey\x1b[0m",
+        "\x1b[38;2;1;64;255mtrue color\x1b[0m",
+        "\x1b[7mnegative\x1b[32m green\x1b[27m\x1b[0m",
+        "\x1b[3;4;9mstyles\x1b[23;24;29m\x1b[0m",
+        "\x1b[92;101mbright\x1b[0m",
+        "\x1b[38;5mincomplete\x1b[0m",
+        "\x1b[2Kclear line\x1b[xunknown\r\n",
+        "a\r\nb\r\n\n",
+        "",
+    ),
+)
+def test_golden_ansi2html(text: str) -> None:
+    assert _Runs.parse(ansi_html(text)) == _Runs.parse(ansi2html(text))
+
+
+def test_color_continues_on_next_line() -> None:
+    lines = _Runs.parse(ansi_html("\x1b[34mblue\nstill blue\x1b[0m"))
+    assert lines == [[("ansi34", "blue")], [("ansi34", "still blue")]]
+
+
+def test_css_rules() -> None:
+    for rule in get_styles(dark_bg=False, scheme="xterm"):
+        css_class = rule.klass.lstrip(".")
+        if not css_class.startswith(("ansi", "inv")) or "_" in css_class:
+            continue
+        if css_class == "ansi2html-content":
+            continue
+        assert util_ansi.css_rule(css_class) == str(rule)
+
+
+def test_css_rules_written_once() -> None:
+    text = ansi_html("\x1b[32ma\x1b[0m \x1b[32mb\x1b[0m\n\x1b[32mc")
+    assert text.count("<style>.ansi32 { color: #00cd00; }</style>") == 1
+
+
+def test_linkify() -> None:
+    replace = PathReplace(
+        directories={"R": "/home/testresults"},
+        git_ref={},
+        urls={"R": "/label/"},
+    )
+    text = ansi_html("\x1b[32m/home/testresults/a.txt <b>\x1b[0m", path_replace=replace)
+    assert text == (
+        '<span id="line-0"><style>.ansi32 { color: #00cd00; }</style>'
+        '<span class="ansi32"><a href="/label/a.txt">a.txt</a> &lt;b&gt;</span></span>'
+    )
+
+
+@pytest.mark.parametrize("text", ("a\n\x1b[32mb\x1b[0m\n", "a\nb", ""))
+def test_iter_render(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, text: str
+) -> None:
+    color_file = tmp_path / "out.color"
+    color_file.write_text(text)
+    monkeypatch.setattr(render_ansii_color, "FLUSH_SIZE_CHARS", 1)
+    chunks = list(
+        render_ansii_color.iter_render(
+            color_file=color_file, path_replace=None, title="<t>"
+        )
+    )
+    assert len(chunks) >= 2
+    html_text = "".join(chunks)
+    assert "<title>&lt;t&gt;</title>" in html_text
+    body = html_text.split('<pre class="ansi2html-content">\n')[1].split("</pre>")[0]
+    assert body == ansi_html(text)
+
+
+def test_render_ansi_color_cached(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(constants, "DIRECTORY_REPORTS", tmp_path / "reports")
+    cache = util_render_cache.RenderCache(
+        directory=tmp_path / "reports_cache",
+        max_bytes=1_000_000,
+        memory_max_bytes=1_000_000,
+    )
+    monkeypatch.setattr(util_render_cache, "RENDER_CACHE_ANSI", cache)
+    color_file = tmp_path / "reports" / "label" / "out.color"
+    color_file.parent.mkdir(parents=True)
+    color_file.write_text("\x1b[32mgreen\x1b[0m\n")
+
+    def get() -> Response:
+        request = Request(scope={"type": "http", "method": "GET", "headers": []})
+        return render_ansii_color.render_ansi_color(
+            request=request, color_file=color_file, url=URL("/label/out.color")
+        )
+
+    async def body(response: StreamingResponse) -> str:
+        return "".join([chunk async for chunk in response.body_iterator])
+
+    html_text = asyncio.run(body(get()))
+    assert get().body.decode() == html_text
+    assert (cache.misses, cache.hits_memory) == (1, 1)
+
+    # Re-upload: A new identity
+    color_file.unlink()
+    color_file.write_text("\x1b[34mblue\x1b[0m\n")
+    assert "ansi34" in asyncio.run(body(get()))
+    assert cache.misses == 2
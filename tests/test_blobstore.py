@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import io
+import pathlib
+
+import pytest
+from app import util_blobstore
+
+
+def test_blobstore(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    blobstore = util_blobstore.BlobStore(directory=tmp_path / "reports_blobs")
+    data = b"firmware" * 1000
+
+    for report in ("report_1", "report_2"):
+        target = tmp_path / report / "firmware.uf2"
+        target.parent.mkdir()
+        deduplicated = blobstore.add_file(
+            fin=io.BytesIO(data), target=target, mode=0o644, mtime=0.0
+        )
+        assert deduplicated == (report == "report_2")
+        assert target.read_bytes() == data
+
+    stats = blobstore.stats()
+    assert stats.blobs == 1
+    assert stats.links == 2
+    assert stats.dedup_ratio == 2.0
+
+    for report in ("report_1", "report_2"):
+        (tmp_path / report / "firmware.uf2").unlink()
+    assert blobstore.stats().links == 0
+
+    # Blobs created just now are protected
+    assert blobstore.gc() == 0
+    monkeypatch.setattr(util_blobstore, "TMP_EXPIRY_S", -1.0)
+    assert blobstore.gc() == 1
+    assert blobstore.stats().blobs == 0
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import dataclasses
+import pathlib
+import sqlite3
+
+import pytest
+from app import util_catalog
+
+TODAY = "2025-05-27"
+
+
+def entry(
+    label: str,
+    expiry: str,
+    is_valid: bool = True,
+    email: str = "buhtig.hans.maerki@ergoinfo.ch",
+    conclusion: str = "success",
+    started_date: str = "2025-05-20",
+    is_github_workflow: bool = True,
+) -> util_catalog.CatalogEntry:
+    number = int(label.rpartition("_")[2])
+    return util_catalog.CatalogEntry(
+        label=label,
+        sortable=f"github_selfhosted_testrun__{number:010d}",
+        expiry=expiry,
+        is_valid=is_valid,
+        report_present=True,
+        archived=False,
+        is_github_workflow=is_github_workflow,
+        email=email,
+        conclusion=conclusion,
+        pr_number=str(4700 + number),
+        started_date=started_date,
+        size_bytes=1000 * number,
+        created_at=float(number),
+        signature=f"signature-{label}",
+        documents={"expiry": {"tag": "", "expiry": expiry}},
+    )
+
+
+ENTRIES = [
+    entry("github_selfhosted_testrun_9", "2025-05-28", started_date=""),
+    entry(
+        "github_selfhosted_testrun_10",
+        util_catalog.EXPIRY_NEVER,
+        email="Someone@example.com",
+        is_github_workflow=False,
+    ),
+    entry(
+        "github_selfhosted_testrun_11",
+        TODAY,
+        conclusion="failure",
+        started_date="2025-05-26",
+    ),
+    entry("github_selfhosted_testrun_12", "2025-05-26"),
+    entry("github_selfhosted_testrun_13", util_catalog.EXPIRY_TRASH),
+    entry("github_selfhosted_testrun_14", TODAY, is_valid=False),
+]
+
+
+@pytest.fixture
+def catalog(tmp_path: pathlib.Path) -> util_catalog.ReportCatalog:
+    catalog = util_catalog.ReportCatalog(filename=tmp_path / "catalog.sqlite3")
+    catalog.upsert(ENTRIES)
+    return catalog
+
+
+def labels(entries: list[util_catalog.CatalogEntry]) -> list[str]:
+    return [e.label for e in entries]
+
+
+@pytest.mark.parametrize(
+    "including_expired,limit,offset,expected",
+    (
+        (False, None, 0, [11, 10, 9]),
+        (True, None, 0, [13, 12, 11, 10, 9]),
+        (False, 2, 0, [11, 10]),
+        (False, 2, 2, [9]),
+        (True, 1, 1, [12]),
+    ),
+)
+def test_query(
+    catalog: util_catalog.ReportCatalog,
+    including_expired: bool,
+    limit: int | None,
+    offset: int,
+    expected: list[int],
+) -> None:
+    entries = catalog.query(
+        today=TODAY, including_expired=including_expired, limit=limit, offset=offset
+    )
+    assert labels(entries) == [f"github_selfhosted_testrun_{n}" for n in expected]
+
+
+@pytest.mark.parametrize(
+    "report_filter,expected",
+    (
+        (util_catalog.ReportFilter(), [11, 10, 9]),
+        (util_catalog.ReportFilter(author="SOMEONE@"), [10]),
+        (util_catalog.ReportFilter(conclusion="failure"), [11]),
+        (util_catalog.ReportFilter(pr_number="4709"), [9]),
+        (util_catalog.ReportFilter(started_from="2025-05-21"), [11]),
+        (util_catalog.ReportFilter(started_to="2025-05-21"), [10]),
+        (
+            util_catalog.ReportFilter(
+                started_from="2025-05-20", started_to="2025-05-26"
+            ),
+            [11, 10],
+        ),
+        (util_catalog.ReportFilter(workflow=util_catalog.Workflow.MANUAL), [10]),
+        (util_catalog.ReportFilter(workflow=util_catalog.Workflow.GITHUB), [11, 9]),
+    ),
+)
+def test_filter(
+    catalog: util_catalog.ReportCatalog,
+    report_filter: util_catalog.ReportFilter,
+    expected: list[int],
+) -> None:
+    entries = catalog.query(today=TODAY, report_filter=report_filter)
+    assert labels(entries) == [f"github_selfhosted_testrun_{n}" for n in expected]
+    assert catalog.count(today=TODAY, report_filter=report_filter) == len(expected)
+
+
+@pytest.mark.parametrize(
+    "report_filter,index",
+    (
+        (util_catalog.ReportFilter(conclusion="failure"), "reports_conclusion"),
+        (util_catalog.ReportFilter(pr_number="4709"), "reports_pr_number"),
+        (
+            util_catalog.ReportFilter(started_from="2025-05-21"),
+            "reports_started_date",
+        ),
+        (
+            util_catalog.ReportFilter(workflow=util_catalog.Workflow.MANUAL),
+            "reports_workflow",
+        ),
+        (util_catalog.ReportFilter(archived=True), "reports_archived"),
+    ),
+)
+def test_filter_index(
+    catalog: util_catalog.ReportCatalog,
+    report_filter: util_catalog.ReportFilter,
+    index: str,
+) -> None:
+    where, params = catalog._where(TODAY, False, report_filter)
+    with sqlite3.connect(catalog.filename) as connection:
+        plan = connection.execute(
+            f"EXPLAIN QUERY PLAN SELECT COUNT(*) FROM reports WHERE {where}", params
+        ).fetchall()
+    connection.close()
+    assert index in " ".join(row[-1] for row in plan)
+
+
+def test_filter_archived(catalog: util_catalog.ReportCatalog) -> None:
+    catalog.upsert(
+        [
+            dataclasses.replace(
+                entry("github_selfhosted_testrun_15", "2025-01-01"),
+                report_present=False,
+                archived=True,
+            ),
+        ]
+    )
+    # Expired: Only listed with the filter
+    assert labels(catalog.query(today=TODAY)) == [
+        f"github_selfhosted_testrun_{n}" for n in (11, 10, 9)
+    ]
+    report_filter = util_catalog.ReportFilter(archived=True)
+    assert labels(catalog.query(today=TODAY, report_filter=report_filter)) == [
+        "github_selfhosted_testrun_15"
+    ]
+    assert catalog.count(today=TODAY, report_filter=report_filter) == 1
+
+
+def test_upsert_delete(catalog: util_catalog.ReportCatalog) -> None:
+    assert len(catalog) == 6
+    catalog.upsert([entry("github_selfhosted_testrun_10", "2025-01-01")])
+    catalog.delete(["github_selfhosted_testrun_9", "github_selfhosted_testrun_99"])
+    assert len(catalog) == 5
+    assert labels(catalog.query(today=TODAY)) == ["github_selfhosted_testrun_11"]
+
+    signatures = catalog.signatures()
+    assert signatures["github_selfhosted_testrun_10"] == (
+        "signature-github_selfhosted_testrun_10"
+    )
+
+    (found,) = catalog.query(today=TODAY)
+    assert found == ENTRIES[2]
+
+
+def test_schema_version(catalog: util_catalog.ReportCatalog) -> None:
+    with sqlite3.connect(catalog.filename) as connection:
+        connection.execute("PRAGMA user_version = 0")
+    connection.close()
+    # Rebuilt: Empty
+    assert len(catalog) == 0
+
+
+def test_due(catalog: util_catalog.ReportCatalog) -> None:
+    catalog.upsert(
+        [
+            dataclasses.replace(
+                entry("github_selfhosted_testrun_15", "2025-01-01"),
+                report_present=False,
+            ),
+            dataclasses.replace(
+                entry("github_selfhosted_testrun_16", "2025-01-01"),
+                report_present=False,
+                archived=True,
+            ),
+        ]
+    )
+    # 16: Archived, not due again
+    assert catalog.due(today=TODAY) == [
+        "github_selfhosted_testrun_12",
+        "github_selfhosted_testrun_13",
+    ]
+    assert catalog.metadata_only() == ["github_selfhosted_testrun_15"]
+    assert catalog.archived_bytes() == 16000
+
+
+def test_purge_ticks(
+    catalog: util_catalog.ReportCatalog, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(util_catalog, "PURGE_TICKS_MAX", 3)
+    for started_at in range(5):
+        catalog.record_tick(
+            util_catalog.PurgeTick(
+                started_at=float(started_at),
+                duration_s=0.5,
+                reports_due=1,
+                reports_expired=1,
+                reports_archived=0,
+                metadata_purged=0,
+                reports_evicted=0,
+            )
+        )
+    purge_ticks = catalog.purge_ticks(limit=10)
+    assert [t.started_at for t in purge_ticks] == [4.0, 3.0, 2.0]
+    assert purge_ticks[0].duration_s == 0.5
+
+
+def test_eviction_candidates(catalog: util_catalog.ReportCatalog) -> None:
+    assert catalog.total_bytes() == 1000 * (9 + 10 + 11 + 12 + 13 + 14)
+    catalog.record_access(label="github_selfhosted_testrun_9", accessed_at=100.0)
+    catalog.record_access(label="github_selfhosted_testrun_12", accessed_at=50.0)
+    # 10: expiry 'never'
+    assert catalog.eviction_candidates() == [
+        ("github_selfhosted_testrun_11", 11000),
+        ("github_selfhosted_testrun_13", 13000),
+        ("github_selfhosted_testrun_14", 14000),
+        ("github_selfhosted_testrun_12", 12000),
+        ("github_selfhosted_testrun_9", 9000),
+    ]
+    catalog.delete(["github_selfhosted_testrun_9"])
+    catalog.upsert([entry("github_selfhosted_testrun_9", "2025-05-28")])
+    assert catalog.eviction_candidates()[0] == ("github_selfhosted_testrun_9", 9000)
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import json
+import pathlib
+
+import pytest
+from app import constants, util_context
+
+LABEL = "github_selfhosted_testrun_107"
+
+
+@pytest.fixture
+def directory_report(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> pathlib.Path:
+    monkeypatch.setattr(constants, "DIRECTORY_REPORTS", tmp_path)
+    util_context._CACHE.clear()
+    directory_report = tmp_path / LABEL
+    directory_report.mkdir()
+    write_context(directory_report, "/home/testresults")
+    return directory_report
+
+
+def write_context(directory_report: pathlib.Path, directory_r: str) -> None:
+    filename = util_context.get_context_filename(directory_report)
+    filename_tmp = filename.with_suffix(".tmp")
+    filename_tmp.write_text(
+        json.dumps({"directories": {"R": directory_r}, "git_ref": {}})
+    )
+    # Like a re-upload: A new inode
+    filename_tmp.rename(filename)
+
+
+def test_report_context_cached(directory_report: pathlib.Path) -> None:
+    report_context = util_context.get_report_context(directory_report)
+    assert report_context.label == LABEL
+    path_replace = util_context.get_path_replace(directory_report)
+    assert path_replace.urls["R"] == f"/{LABEL}/"
+
+    # Cached: Not read again and the same 'PathReplace'
+    assert util_context.get_report_context(directory_report) is report_context
+    assert util_context.get_path_replace(directory_report) is path_replace
+
+    # Re-uploaded
+    write_context(directory_report, "/home/testresults2")
+    report_context2 = util_context.get_report_context(directory_report)
+    assert report_context2 is not report_context
+    assert report_context2.context_json["directories"]["R"] == "/home/testresults2"
+
+
+def test_report_context_missing(directory_report: pathlib.Path) -> None:
+    util_context.get_context_filename(directory_report).unlink()
+    with pytest.raises(FileNotFoundError):
+        util_context.get_report_context(directory_report)
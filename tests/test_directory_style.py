@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import pytest
+from app import render_directory_style
+from app.render_directory_style import ListingStyle
+
+PATHS = (
+    "github_selfhosted_testrun_107",
+    "github_selfhosted_testrun_107/RUN-TESTS_BASICS",
+    "github_selfhosted_testrun_107/RUN-TESTS_BASICS/testresults",
+    "github_selfhosted_testrun_107/RUN-TESTS_BASICS/testresults.txt",
+    "github_selfhosted_testrun_107/RUN-TESTS_BASICS/logger_20_info.log",
+    "github_selfhosted_testrun_107/RUN-TESTS_BASICS/logger_10_debug.log",
+    "github_selfhosted_testrun_107/mpbuild",
+    "github_selfhosted_testrun_107/mpbuild/RPI_PICO2",
+    "github_selfhosted_testrun_107/mpbuild/RPI_PICO2/firmware.uf2",
+    "github_selfhosted_testrun_107/mpbuild/RUN-TESTS_BASICS",
+    "github_selfhosted_testrun_107/task_report.md",
+    "github_selfhosted_testrun_107/journalctl.txt",
+    "github_selfhosted_testrun_107/flashing_stdout.txt",
+    ".",
+    "",
+)
+
+
+def get_listing_style_linear(path: str) -> ListingStyle:
+    """
+    Reference implementation: The linear scan over 'LIST_RE_2_STYLE'.
+    Also used by 'benchmarks/bench_listing_style.py'.
+    """
+    for re_search, style in render_directory_style.LIST_RE_2_STYLE:
+        match = re_search.search(path)
+        if match is not None:
+            return style
+    return ListingStyle.GRAY
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_listing_style_as_linear(path: str) -> None:
+    """
+    The compiled classifier has to return the same as the linear scan.
+    """
+    style_expected = get_listing_style_linear(path)
+    assert render_directory_style.CLASSIFIER.classify(path) == style_expected
+    assert render_directory_style.get_listing_style(path) == style_expected
+
+
+def test_listing_style_first_match_wins() -> None:
+    """
+    '/mpbuild/[^/]+$' (FIRMWARE) comes before '/RUN-[^/]+$' (GREEN).
+    """
+    path = "github_selfhosted_testrun_107/mpbuild/RUN-TESTS_BASICS"
+    assert render_directory_style.get_listing_style(path) is ListingStyle.FIRMWARE
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import pathlib
+
+from app import util_file_response
+
+from conftest import get_request
+
+
+def test_is_not_modified(tmp_path: pathlib.Path) -> None:
+    filename = tmp_path / "firmware.uf2"
+    filename.write_bytes(b"firmware")
+    stat_result = filename.stat()
+    etag = util_file_response.etag(filename, stat_result)
+
+    def is_not_modified(headers: dict[str, str]) -> bool:
+        return util_file_response.is_not_modified(
+            request=get_request(headers), etag_=etag, stat_result=stat_result
+        )
+
+    assert not is_not_modified({})
+    assert is_not_modified({"if-none-match": etag})
+    assert is_not_modified({"if-none-match": f'"other", {etag}'})
+    assert not is_not_modified({"if-none-match": '"other"'})
+    assert is_not_modified({"if-modified-since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+    assert not is_not_modified({"if-modified-since": "Thu, 01 Jan 1970 00:00:00 GMT"})
+
+    filename.write_bytes(b"firmware changed")
+    assert util_file_response.etag(filename, filename.stat()) != etag
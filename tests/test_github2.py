@@ -0,0 +1,510 @@
+from __future__ import annotations
+
+import asyncio
+import errno
+import io
+import json
+import os
+import pathlib
+import shutil
+import sqlite3
+import time
+import typing
+
+import pytest
+from app import constants, util_blobstore, util_github2, util_report_archive
+
+LABEL = "github_selfhosted_testrun_107"
+LABEL_OTHER = "github_selfhosted_testrun_108"
+
+CREATED_AT = 1748304000.0
+"2025-05-27"
+
+
+def create_report(
+    label: str, files: dict[str, bytes] | None = None
+) -> util_github2.WorkflowExpiry:
+    """
+    A report with metadata, see 'util_github2.WorkflowInput'.
+    Returns the default expiry.
+    """
+    directory_metadata = constants.DIRECTORY_REPORTS_METADATA / label
+    filename_inputs = directory_metadata / constants.FILENAME_INPUTS_JSON
+    filename_inputs.parent.mkdir(parents=True)
+    filename_inputs.write_text(json.dumps({"job_title": label}))
+    directory_report = constants.DIRECTORY_REPORTS / label
+    directory_report.mkdir()
+    for name, data in (files or {"context.txt": b"x"}).items():
+        (directory_report / name).write_bytes(data)
+    for directory in (directory_metadata, directory_report):
+        os.utime(directory, (CREATED_AT, CREATED_AT))
+    return util_github2.WorkflowExpiry.default_for(workflow_unique_id=label)
+
+
+def read_expiry(label: str) -> dict[str, str]:
+    filename = util_github2.WorkflowExpiry.filename(workflow_unique_id=label)
+    return json.loads(filename.read_text())
+
+
+def test_read_or_default(reports: pathlib.Path) -> None:
+    create_report(LABEL)
+    workflow_expiry = util_github2.WorkflowExpiry.read_or_default(
+        workflow_unique_id=LABEL
+    )
+    assert workflow_expiry == util_github2.WorkflowExpiry(
+        tag="",
+        expiry=util_github2.WorkflowExpiry.format_expiry(
+            util_github2.EXPIRY_DAYS, start=CREATED_AT
+        ),
+    )
+    # Read only
+    assert not util_github2.WorkflowExpiry.filename(workflow_unique_id=LABEL).exists()
+
+
+def test_default_for(reports: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    create_report(LABEL)
+    expected = util_github2.WorkflowExpiry.default_for(workflow_unique_id=LABEL)
+
+    # Stable: Does not depend on the time of the read
+    monkeypatch.setattr(util_github2.time, "time", lambda: CREATED_AT + 10 * 24 * 3600)
+    assert util_github2.WorkflowExpiry.default_for(workflow_unique_id=LABEL) == expected
+
+
+@pytest.mark.parametrize(
+    "expiry,valid",
+    (
+        ("2025-08-16", True),
+        (util_github2.EXPIRY_NEVER, True),
+        (util_github2.EXPIRY_TRASH, True),
+        ("", False),
+        ("2025-8-16", False),
+        ("2025-02-30", False),
+        ("20250816", False),
+        ("tomorrow", False),
+    ),
+)
+def test_is_valid_expiry(expiry: str, valid: bool) -> None:
+    assert util_github2.WorkflowExpiry.is_valid_expiry(expiry) == valid
+
+
+def test_update_expiries(reports: pathlib.Path) -> None:
+    expiry_default = create_report(LABEL)
+    create_report(LABEL_OTHER)
+
+    util_github2.update_expiries(
+        labels=[LABEL, LABEL_OTHER], tag="release", expiry=None
+    )
+    assert read_expiry(LABEL) == {"tag": "release", "expiry": expiry_default.expiry}
+
+    util_github2.update_expiries(labels=[LABEL], tag=None, expiry="never")
+    assert read_expiry(LABEL) == {"tag": "release", "expiry": "never"}
+    assert read_expiry(LABEL_OTHER) == {
+        "tag": "release",
+        "expiry": expiry_default.expiry,
+    }
+    entries = util_github2.CATALOG.query(today="2025-05-27", including_expired=True)
+    assert {e.label: e.expiry for e in entries} == {
+        LABEL: "never",
+        LABEL_OTHER: expiry_default.expiry,
+    }
+
+
+def test_update_expiries_trash(reports: pathlib.Path) -> None:
+    create_report(LABEL)
+    util_github2.update_expiries(labels=[LABEL], tag=None, expiry="trash")
+    assert read_expiry(LABEL)["expiry"] == "trash"
+    assert not (constants.DIRECTORY_REPORTS / LABEL).exists()
+
+
+def test_write_expiries_empty(
+    reports: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def fail(*args: typing.Any, **kwargs: typing.Any) -> None:
+        raise AssertionError("Nothing written: Nothing to sync")
+
+    monkeypatch.setattr(util_github2, "fsync_directory", fail)
+    monkeypatch.setattr(util_github2, "update_catalog", fail)
+    util_github2.write_expiries({})
+
+
+def test_persist_default_expiries(
+    reports: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    expiry_default = create_report(LABEL)
+    create_report(LABEL_OTHER)
+    util_github2.update_expiries(labels=[LABEL_OTHER], tag=None, expiry="never")
+
+    synced: list[pathlib.Path] = []
+    fsync_directory = util_github2.fsync_directory
+
+    def spy(directory: pathlib.Path) -> None:
+        synced.append(directory)
+        fsync_directory(directory)
+
+    monkeypatch.setattr(util_github2, "fsync_directory", spy)
+    assert util_github2.persist_default_expiries() == 1
+    assert read_expiry(LABEL) == {"tag": "", "expiry": expiry_default.expiry}
+    assert read_expiry(LABEL_OTHER)["expiry"] == "never"
+    assert synced == [
+        constants.DIRECTORY_REPORTS_METADATA,
+        constants.DIRECTORY_REPORTS_METADATA / LABEL,
+    ]
+
+    assert util_github2.persist_default_expiries() == 0
+
+
+def _request(
+    method: str, path: str, query_string: str = "", payload: typing.Any = None
+) -> tuple[int, typing.Any]:
+    """
+    Calls the app, 'payload' is posted as json.
+    Returns the status code and the json response.
+    """
+    from app import main
+
+    body = b"" if payload is None else json.dumps(payload).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query_string.encode(),
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "server": ("testserver", 80),
+        "client": ("testclient", 50000),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    status_codes: list[int] = []
+    chunks: list[bytes] = []
+
+    async def receive() -> dict[str, typing.Any]:
+        return messages.pop(0)
+
+    async def send(message: dict[str, typing.Any]) -> None:
+        if message["type"] == "http.response.start":
+            status_codes.append(message["status"])
+        if message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    asyncio.run(main.app(scope, receive, send))
+    return status_codes[0], json.loads(b"".join(chunks))
+
+
+def test_expiry_api(reports: pathlib.Path) -> None:
+    expiry_default = create_report(LABEL)
+    create_report(LABEL_OTHER)
+
+    status_code, response = _request(
+        "POST",
+        "/api/expiry",
+        payload={"labels": [LABEL, LABEL_OTHER, LABEL], "tag": "release"},
+    )
+    assert (status_code, response) == (200, {"updated": 2})
+    assert read_expiry(LABEL) == {"tag": "release", "expiry": expiry_default.expiry}
+
+    status_code, _ = _request(
+        "POST", "/api/expiry", payload={"labels": [LABEL_OTHER], "expiry": "2030-01-01"}
+    )
+    assert status_code == 200
+    assert read_expiry(LABEL_OTHER) == {"tag": "release", "expiry": "2030-01-01"}
+
+
+@pytest.mark.parametrize(
+    "payload,status_code",
+    (
+        ({"labels": [LABEL, "github_selfhosted_testrun_999"], "tag": "x"}, 404),
+        ({"labels": [LABEL], "expiry": "tomorrow"}, 400),
+        ({"labels": ["../etc"], "tag": "x"}, 400),
+    ),
+)
+def test_expiry_api_invalid(
+    reports: pathlib.Path, payload: dict[str, typing.Any], status_code: int
+) -> None:
+    create_report(LABEL)
+    assert _request("POST", "/api/expiry", payload=payload)[0] == status_code
+    # Nothing written
+    assert not util_github2.WorkflowExpiry.filename(workflow_unique_id=LABEL).exists()
+
+
+def test_read_catalog_entry(reports: pathlib.Path) -> None:
+    expiry_default = create_report(LABEL, files={"context.txt": b"x" * 10000})
+    entry = util_github2.read_catalog_entry(label=LABEL)
+    assert entry.label == LABEL
+    assert entry.is_valid
+    assert entry.report_present
+    assert not entry.archived
+    assert entry.expiry == expiry_default.expiry
+    assert entry.size_bytes >= 10000
+    assert entry.created_at == CREATED_AT
+    assert entry.signature == util_github2.catalog_signature(label=LABEL)
+    assert entry.documents[util_github2.DOCUMENT_INPUTS] == {"job_title": LABEL}
+
+    # Only the metadata
+    shutil.rmtree(constants.DIRECTORY_REPORTS / LABEL)
+    entry = util_github2.read_catalog_entry(label=LABEL)
+    assert entry.is_valid
+    assert not entry.report_present
+    assert entry.size_bytes == 0
+
+
+def test_update_catalog(reports: pathlib.Path) -> None:
+    create_report(LABEL)
+    util_github2.update_catalog(labels=[LABEL])
+    assert util_github2.CATALOG.signatures() == {
+        LABEL: util_github2.catalog_signature(label=LABEL)
+    }
+
+    shutil.rmtree(constants.DIRECTORY_REPORTS / LABEL)
+    shutil.rmtree(constants.DIRECTORY_REPORTS_METADATA / LABEL)
+    util_github2.update_catalog(labels=[LABEL])
+    assert len(util_github2.CATALOG) == 0
+
+
+def test_sync_catalog(reports: pathlib.Path) -> None:
+    create_report(LABEL)
+    create_report(LABEL_OTHER)
+    assert util_github2.sync_catalog() == 2
+    # Unchanged: Nothing is read
+    assert util_github2.sync_catalog() == 0
+
+    util_github2.WorkflowExpiry(tag="", expiry="never").write(workflow_unique_id=LABEL)
+    assert util_github2.sync_catalog() == 1
+    assert util_github2.CATALOG.signatures()[LABEL] == (
+        util_github2.catalog_signature(label=LABEL)
+    )
+
+    shutil.rmtree(constants.DIRECTORY_REPORTS / LABEL_OTHER)
+    shutil.rmtree(constants.DIRECTORY_REPORTS_METADATA / LABEL_OTHER)
+    assert util_github2.sync_catalog() == 1
+    assert set(util_github2.CATALOG.signatures()) == {LABEL}
+
+
+def test_puge_reports(reports: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(util_github2, "ARCHIVE_EXPIRED_REPORTS", False)
+    create_report(LABEL)
+    create_report(LABEL_OTHER)
+    util_github2.update_expiries(labels=[LABEL], tag=None, expiry="2025-01-01")
+    util_github2.update_expiries(labels=[LABEL_OTHER], tag=None, expiry="never")
+
+    # The tick started earlier: The whole tick is timed
+    purge_tick = util_github2.puge_reports(time_start=time.monotonic() - 5.0)
+    assert purge_tick.duration_s >= 5.0
+    assert purge_tick.started_at <= time.time() - 5.0
+    assert purge_tick.reports_due == 1
+    assert purge_tick.reports_expired == 1
+    assert purge_tick.reports_archived == 0
+    assert purge_tick.metadata_purged == 1
+    assert util_github2.CATALOG.purge_ticks(limit=10) == [purge_tick]
+
+    assert not (constants.DIRECTORY_REPORTS / LABEL).exists()
+    assert not (constants.DIRECTORY_REPORTS_METADATA / LABEL).exists()
+    assert set(util_github2.CATALOG.signatures()) == {LABEL_OTHER}
+
+    # Nothing due anymore
+    purge_tick = util_github2.puge_reports()
+    assert (purge_tick.reports_due, purge_tick.reports_expired) == (0, 0)
+
+
+LABEL_THIRD = "github_selfhosted_testrun_109"
+UNIQUE_BYTES = 25 * 4096
+FIRMWARE_BYTES = 256 * 4096
+
+
+def create_deduplicated_reports() -> list[str]:
+    """
+    Three reports: A unique file each and the same firmware.
+    The firmware is stored once in the blob store.
+    """
+    labels = [LABEL, LABEL_OTHER, LABEL_THIRD]
+    for label in labels:
+        create_report(label, files={"unique.txt": label.encode() * UNIQUE_BYTES})
+        os.truncate(constants.DIRECTORY_REPORTS / label / "unique.txt", UNIQUE_BYTES)
+        util_blobstore.BLOBSTORE.add_file(
+            fin=io.BytesIO(b"\x55" * FIRMWARE_BYTES),
+            target=constants.DIRECTORY_REPORTS / label / "firmware.uf2",
+            mode=0o644,
+            mtime=CREATED_AT,
+        )
+        os.utime(constants.DIRECTORY_REPORTS / label, (CREATED_AT, CREATED_AT))
+    util_github2.update_catalog(labels=labels)
+    return labels
+
+
+def test_deduplicated_size(reports: pathlib.Path) -> None:
+    create_deduplicated_reports()
+    entry = util_github2.read_catalog_entry(label=LABEL)
+    # The firmware is in the blob store
+    assert UNIQUE_BYTES <= entry.size_bytes < FIRMWARE_BYTES
+    assert util_github2.reports_bytes() == (
+        util_github2.CATALOG.total_bytes() + FIRMWARE_BYTES
+    )
+    assert util_github2.reports_bytes() < 2 * FIRMWARE_BYTES
+
+
+def test_record_access(reports: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    create_deduplicated_reports()
+    recorded: list[tuple[str, float]] = []
+    catalog_record_access = util_github2.CATALOG.record_access
+
+    def record_access(label: str, accessed_at: float) -> None:
+        recorded.append((label, accessed_at))
+        catalog_record_access(label=label, accessed_at=accessed_at)
+
+    monkeypatch.setattr(util_github2.CATALOG, "record_access", record_access)
+    monkeypatch.setattr(util_github2.time, "time", lambda: CREATED_AT + 100.0)
+    util_github2.record_access(label=LABEL)
+    # Within ACCESS_RESOLUTION_S: Not written again
+    assert not util_github2.access_due(label=LABEL)
+    util_github2.record_access(label=LABEL)
+    # Not on disk
+    util_github2.record_access(label="github_selfhosted_testrun_999")
+    assert recorded == [(LABEL, CREATED_AT + 100.0)]
+    assert util_github2.CATALOG.eviction_candidates()[-1][0] == LABEL
+
+    monkeypatch.setattr(
+        util_github2.time,
+        "time",
+        lambda: CREATED_AT + 100.0 + util_github2.ACCESS_RESOLUTION_S,
+    )
+    util_github2.record_access(label=LABEL)
+    assert len(recorded) == 2
+
+
+def test_record_access_failed(
+    reports: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    create_report(LABEL)
+
+    def record_access(label: str, accessed_at: float) -> None:
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(util_github2.CATALOG, "record_access", record_access)
+    util_github2.record_access(label=LABEL)
+    # Not written: The next access tries again
+    assert util_github2.access_due(label=LABEL)
+
+
+@pytest.mark.parametrize(
+    "low_watermark_reclaimed,evicted",
+    (
+        # Only the unique files are freed: The firmware is still referenced
+        (UNIQUE_BYTES + 1, [LABEL_THIRD, LABEL_OTHER]),
+        # The firmware is freed with its last report
+        (3 * UNIQUE_BYTES + 1, [LABEL_THIRD, LABEL_OTHER, LABEL]),
+    ),
+)
+def test_evict_reports(
+    reports: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    low_watermark_reclaimed: int,
+    evicted: list[str],
+) -> None:
+    create_deduplicated_reports()
+    for accessed_at, label in enumerate((LABEL_THIRD, LABEL_OTHER, LABEL)):
+        with monkeypatch.context() as m:
+            m.setattr(
+                util_github2.time,
+                "time",
+                lambda accessed_at=accessed_at: CREATED_AT + accessed_at,
+            )
+            util_github2.record_access(label=label)
+    # The least recently accessed first
+    assert [label for label, _ in util_github2.CATALOG.eviction_candidates()] == [
+        LABEL_THIRD,
+        LABEL_OTHER,
+        LABEL,
+    ]
+
+    total_bytes = util_github2.reports_bytes()
+    reports_evicted = util_github2.evict_reports(
+        high_watermark_bytes=total_bytes - 1,
+        low_watermark_bytes=total_bytes - low_watermark_reclaimed,
+    )
+    assert reports_evicted == len(evicted)
+    for label in (LABEL, LABEL_OTHER, LABEL_THIRD):
+        assert (constants.DIRECTORY_REPORTS / label).exists() == (label not in evicted)
+    assert not any(
+        entry.report_present
+        for entry in util_github2.CATALOG.query(today="2025-05-27")
+        if entry.label in evicted
+    )
+
+
+def test_puge_reports_archive(reports: pathlib.Path) -> None:
+    create_report(LABEL)
+    create_report(LABEL_OTHER)
+    util_github2.update_expiries(labels=[LABEL], tag=None, expiry="2025-01-01")
+    util_github2.update_expiries(labels=[LABEL_OTHER], tag=None, expiry="never")
+
+    purge_tick = util_github2.puge_reports()
+    assert (purge_tick.reports_due, purge_tick.reports_archived) == (1, 1)
+    assert (purge_tick.reports_expired, purge_tick.metadata_purged) == (0, 0)
+    assert not (constants.DIRECTORY_REPORTS / LABEL).exists()
+    assert (
+        constants.DIRECTORY_REPORTS_COLD
+        / LABEL
+        / util_report_archive.FILENAME_REPORT_ARCHIVE
+    ).is_file()
+    entry = util_github2.read_catalog_entry(label=LABEL)
+    assert (entry.report_present, entry.archived) == (False, True)
+
+    # Archived reports have expired: Only listed with 'archived'
+    status_code, response = _request("GET", "/api/reports")
+    assert status_code == 200
+    assert [r["label"] for r in response["reports"]] == [LABEL_OTHER]
+    status_code, response = _request("GET", "/api/reports", query_string="archived=1")
+    assert status_code == 200
+    assert response["total"] == 1
+    (report,) = response["reports"]
+    assert (report["label"], report["archived"]) == (LABEL, True)
+
+    # Not due anymore
+    purge_tick = util_github2.puge_reports()
+    assert (purge_tick.reports_due, purge_tick.reports_archived) == (0, 0)
+
+
+def test_puge_reports_archive_time_budget(
+    reports: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    create_report(LABEL)
+    util_github2.update_expiries(labels=[LABEL], tag=None, expiry="2025-01-01")
+
+    # The budget is used up by the tick
+    monkeypatch.setattr(util_github2, "ARCHIVE_TIME_BUDGET_S", 5.0)
+    purge_tick = util_github2.puge_reports(time_start=time.monotonic() - 10.0)
+    assert (purge_tick.reports_due, purge_tick.reports_archived) == (1, 0)
+    assert (constants.DIRECTORY_REPORTS / LABEL).is_dir()
+
+    # Still due: The next tick continues
+    purge_tick = util_github2.puge_reports()
+    assert (purge_tick.reports_due, purge_tick.reports_archived) == (1, 1)
+
+
+def test_puge_reports_archive_failed(
+    reports: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    create_report(LABEL)
+    util_github2.update_expiries(labels=[LABEL], tag=None, expiry="2025-01-01")
+
+    def archive_cold(label: str) -> pathlib.Path:
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    with monkeypatch.context() as m:
+        m.setattr(util_report_archive, "archive_cold", archive_cold)
+        purge_tick = util_github2.puge_reports()
+    assert (purge_tick.reports_due, purge_tick.reports_archived) == (1, 0)
+    # Kept, neither trashed nor purged
+    assert (constants.DIRECTORY_REPORTS / LABEL).is_dir()
+    assert (purge_tick.reports_expired, purge_tick.metadata_purged) == (0, 0)
+    assert list(constants.DIRECTORY_REPORTS_TRASH.iterdir()) == []
+
+    # The next tick tries again
+    purge_tick = util_github2.puge_reports()
+    assert purge_tick.reports_archived == 1
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import pathlib
+
+from app import util_listing
+from app.render_directory_style import ListingStyle
+
+
+def test_key_number_sort() -> None:
+    names = ["testresults_97", "testresults_100", "testresults_92"]
+    assert sorted(names, key=util_listing.key_number_sort) == [
+        "testresults_92",
+        "testresults_97",
+        "testresults_100",
+    ]
+
+
+def test_list_directory(tmp_path: pathlib.Path) -> None:
+    directory = tmp_path / "github_selfhosted_testrun_107"
+    directory.mkdir()
+    for n in (9, 10, 100):
+        (directory / f"RUN-TESTS_{n}").mkdir()
+    (directory / "task_report.md").write_text("hello")
+
+    entries = util_listing.list_directory(
+        directory=directory, path="github_selfhosted_testrun_107"
+    )
+    assert [e.name for e in entries] == [
+        "task_report.md",
+        "RUN-TESTS_100",
+        "RUN-TESTS_10",
+        "RUN-TESTS_9",
+    ]
+    assert entries[1].path == "github_selfhosted_testrun_107/RUN-TESTS_100"
+    assert entries[1].is_dir
+    assert entries[1].style is ListingStyle.GREEN
+    assert not entries[0].is_dir
+
+    # Cached: Same tuple returned
+    assert (
+        util_listing.list_directory(
+            directory=directory, path="github_selfhosted_testrun_107"
+        )
+        is entries
+    )
+
+    # A new entry changes the mtime of the directory and invalidates the cache
+    (directory / "RUN-TESTS_101").mkdir()
+    entries = util_listing.list_directory(
+        directory=directory, path="github_selfhosted_testrun_107"
+    )
+    assert entries[1].name == "RUN-TESTS_101"
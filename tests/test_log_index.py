@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import pathlib
+
+import pytest
+from app import constants, util_log_index
+from app.util_log_index import LogIndex
+
+LABEL = "github_selfhosted_testrun_107"
+
+DICT_SEVERITY_TEXT = {"DEBUG": 1, "INFO": 2, "WARNING": 3, "ERROR": 4}
+
+LOGFILE_TEXT = """\
+no severity yet
+DEBUG - a
+DEBUG - [COLOR_INFO]b
+continuation\x0cform feed\rcarriage return\r\nwindows
+INFO - c
+WARNING - d
+ERROR - e
+ERROR - f
+DEBUG - g
+"""
+SEVERITIES_EXPECTED = [2, 1, 1, 1, 1, 1, 1, 2, 3, 4, 4, 1]
+ANCHORS_EXPECTED = [1, 7, 8, 9, 11]
+
+
+def parser(line: str) -> tuple[int, str | None] | None:
+    severity, sep, payload = line.partition(" - ")
+    if sep == "":
+        return None
+    schema = None
+    if payload.startswith("[COLOR_INFO]"):
+        schema = "COLOR_INFO"
+    return DICT_SEVERITY_TEXT[severity], schema
+
+
+@pytest.fixture
+def logfile(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> pathlib.Path:
+    monkeypatch.setattr(constants, "DIRECTORY_REPORTS", tmp_path / "reports")
+    monkeypatch.setattr(
+        constants, "DIRECTORY_REPORTS_METADATA", tmp_path / "reports_metadata"
+    )
+    util_log_index._CACHE.clear()
+    logfile = tmp_path / "reports" / LABEL / "RUN-TESTS_BASICS" / "logger_10_debug.log"
+    logfile.parent.mkdir(parents=True)
+    logfile.write_bytes(LOGFILE_TEXT.encode())
+    return logfile
+
+
+def assert_index(log_index: LogIndex, logfile: pathlib.Path) -> None:
+    lines = logfile.read_text().splitlines()
+    assert log_index.lines == len(lines) == len(SEVERITIES_EXPECTED)
+    assert list(log_index.iter_lines(logfile, 0, log_index.lines)) == lines
+    for line in range(log_index.lines):
+        assert list(log_index.iter_lines(logfile, line, line + 1)) == [lines[line]]
+    assert [log_index.severity(line) for line in range(log_index.lines)] == (
+        SEVERITIES_EXPECTED
+    )
+    assert [
+        line for line in range(log_index.lines) if log_index.is_anchor(line)
+    ] == ANCHORS_EXPECTED
+    assert log_index.first_matched == 1
+    assert log_index.schema_color_active
+    assert log_index.schema(0) == "COLOR_INFO"
+    assert log_index.schema(1) is None
+    assert log_index.schema(3) == "COLOR_INFO"
+
+    for severity in util_log_index.SEVERITIES:
+        visible = [line for line, s in enumerate(SEVERITIES_EXPECTED) if s >= severity]
+        assert log_index.count(severity) == len(visible)
+        for start in range(len(visible) + 1):
+            for stop in range(start, len(visible) + 1):
+                selected = [
+                    line
+                    for begin, end in log_index.iter_ranges(severity, start, stop)
+                    for line in range(begin, end)
+                ]
+                assert selected == visible[start:stop]
+        for rank, line in enumerate(visible):
+            assert log_index.rank(line, severity) == rank
+
+
+def test_build(logfile: pathlib.Path) -> None:
+    log_index = LogIndex.build(logfile=logfile, parser=parser, severity_default=2)
+    assert_index(log_index, logfile)
+
+
+def test_sidecar(logfile: pathlib.Path) -> None:
+    log_index = util_log_index.get_index(logfile, parser=parser, severity_default=2)
+    filename = util_log_index.index_filename(logfile)
+    assert filename == (
+        constants.DIRECTORY_REPORTS_METADATA
+        / LABEL
+        / "log_index/RUN-TESTS_BASICS/logger_10_debug.log.idx"
+    )
+    assert filename.is_file()
+    assert_index(LogIndex.load(filename), logfile)
+    assert util_log_index.get_index(logfile, parser, 2) is log_index
+
+    # A re-uploaded logfile invalidates the index
+    logfile.unlink()
+    logfile.write_bytes(b"ERROR - x\n")
+    log_index = util_log_index.get_index(logfile, parser=parser, severity_default=2)
+    assert log_index.lines == 1
+    assert LogIndex.load(filename).lines == 1
+
+
+def test_empty(logfile: pathlib.Path) -> None:
+    logfile.write_bytes(b"")
+    log_index = util_log_index.get_index(logfile, parser=parser, severity_default=2)
+    assert log_index.lines == 0
+    assert log_index.count(1) == 0
+    assert list(log_index.iter_ranges(1)) == []
+    assert LogIndex.load(util_log_index.index_filename(logfile)).lines == 0
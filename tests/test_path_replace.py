@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import pytest
+from app.util_html import HtmlWriter
 from app.util_path_replace import PathMatch, PathReplace, Segments
 from octoprobe.util_constants import DirectoryTag
 
@@ -87,3 +88,58 @@ def test_replace(line: str, line_expected: str) -> None:
         print("result:  " + line_result)
         print("expected:" + line_expected)
         raise ValueError("Test failed")
+
+
+@pytest.mark.parametrize(
+    "directories,line,line_expected",
+    (
+        # No url: The trigger is removed - for every occurrence
+        (
+            {"X": "/home/x"},
+            "A /home/x/a.txt B /home/x/<b>.txt",
+            "A a.txt B &lt;b&gt;.txt",
+        ),
+        # Same position: The first trigger wins
+        (
+            {DirectoryTag.R: "/home/testresults", DirectoryTag.T: "/home"},
+            "/home/testresults/a /home/b",
+            '<a href="https:/r/a">a</a> <a href="http:/t/b">b</a>',
+        ),
+        (
+            {DirectoryTag.T: "/home", DirectoryTag.R: "/home/testresults"},
+            "/home/testresults/a",
+            '<a href="http:/t/testresults/a">testresults/a</a>',
+        ),
+        # Empty triggers are ignored
+        (
+            {DirectoryTag.R: ""},
+            "A <b>",
+            "A &lt;b&gt;",
+        ),
+        # '\\n' ends the path, a backslash alone does not
+        (
+            {DirectoryTag.R: "/home/testresults"},
+            "/home/testresults/a\\nb /home/testresults/c\\d",
+            '<a href="https:/r/a">a</a>\\nb <a href="https:/r/c\\d">c\\d</a>',
+        ),
+    ),
+)
+def test_replace_triggers(
+    directories: dict[str, str], line: str, line_expected: str
+) -> None:
+    replace = PathReplace(
+        directories=directories,
+        git_ref={},
+        urls={
+            DirectoryTag.R: "https://r/",
+            DirectoryTag.T: "http://t/",
+        },
+    )
+    line_result = replace.expand_href_line(line=line).as_string()
+    assert line_result == line_expected
+
+    writer = HtmlWriter()
+    replace.write_line(sink=writer, line=line)
+    assert writer.size == len(line_expected)
+    assert writer.flush() == line_expected
+    assert writer.size == 0
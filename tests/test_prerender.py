@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import json
+import pathlib
+import shutil
+import zipfile
+
+import pytest
+from app import (
+    constants,
+    render_log,
+    util_prerender,
+    util_render_cache,
+    util_report_archive,
+)
+from fastapi import Request
+from starlette.datastructures import URL
+from testbed_micropython.report_test import util_constants
+
+LABEL = "github_selfhosted_testrun_107"
+
+FILES = {
+    "context.json": json.dumps(
+        {"directories": {"R": "/home/testresults"}, "git_ref": {}}
+    ),
+    f"{util_constants.FILENAME_OCTOPROBE_SUMMARY_REPORT_STEM}.html": "<html/>",
+    "RUN-TESTS_BASICS/logger_10_debug.log": "INFO     - /home/testresults/a.txt\n",
+    "RUN-TESTS_BASICS/logger_20_info.log": "INFO     - /home/testresults/a.txt\n",
+    "RUN-TESTS_BASICS/task_report.md": "# Task\n",
+    "RUN-TESTS_BASICS/testresults.color": "\x1b[32mpass\x1b[0m\n",
+    "RUN-TESTS_BASICS/testresults.txt": "pass\n",
+}
+
+
+@pytest.mark.parametrize(
+    "get_prerender,path",
+    (
+        (util_prerender.Prerender.LOG, f"{LABEL}/RUN-TESTS_BASICS/logger_20_info.log"),
+        (None, f"{LABEL}/RUN-TESTS_BASICS/logger_10_debug.log"),
+        (util_prerender.Prerender.MARKDOWN, f"{LABEL}/RUN-TESTS_BASICS/task_report.md"),
+        (util_prerender.Prerender.ANSI, f"{LABEL}/RUN-TESTS_BASICS/testresults.color"),
+        (None, f"{LABEL}/RUN-TESTS_BASICS/testresults.txt"),
+    ),
+)
+def test_get_prerender(
+    get_prerender: util_prerender.Prerender | None, path: str
+) -> None:
+    assert util_prerender.get_prerender(path) == get_prerender
+
+
+@pytest.mark.parametrize("storage", tuple(util_report_archive.ReportStorage))
+def test_prerender_report(
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    storage: util_report_archive.ReportStorage,
+) -> None:
+    monkeypatch.setattr(constants, "DIRECTORY_REPORTS", tmp_path / "reports")
+    monkeypatch.setattr(
+        constants, "DIRECTORY_REPORTS_METADATA", tmp_path / "reports_metadata"
+    )
+    caches = {}
+    for name in ("RENDER_CACHE_LOG", "RENDER_CACHE_MARKDOWN", "RENDER_CACHE_ANSI"):
+        caches[name] = util_render_cache.RenderCache(
+            directory=tmp_path / "reports_cache" / name, max_bytes=1_000_000
+        )
+        monkeypatch.setattr(util_render_cache, name, caches[name])
+
+    directory_report = tmp_path / "reports" / LABEL
+    for name, text in FILES.items():
+        filename = directory_report / name
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        filename.write_text(text)
+    if storage is util_report_archive.ReportStorage.ZIP:
+        filename_zip = tmp_path / util_report_archive.FILENAME_REPORT_ARCHIVE
+        with zipfile.ZipFile(filename_zip, "w") as zf:
+            for name, text in FILES.items():
+                zf.writestr(name, text)
+        shutil.rmtree(directory_report)
+        directory_report.mkdir()
+        filename_zip.rename(directory_report / filename_zip.name)
+
+    assert util_prerender.prerender_report(label=LABEL) == 3
+    assert util_prerender.prerender_report(label=LABEL) == 0
+
+    # The first request is a hit
+    logfile = util_report_archive.resolve(
+        f"{LABEL}/RUN-TESTS_BASICS/{render_log.DEFAULT_LOGFILE}",
+        directory_reports=constants.DIRECTORY_REPORTS,
+    )
+    response = render_log.render_log(
+        request=Request(scope={"type": "http", "method": "GET", "headers": []}),
+        logfile=logfile,
+        url=URL(f"/{LABEL}/RUN-TESTS_BASICS/logger_20_info.log"),
+        severity=render_log.SEVERITY_DEFAULT,
+    )
+    assert response.status_code == 200
+    assert caches["RENDER_CACHE_LOG"].stats()["hits_disk"] == 1
+    assert caches["RENDER_CACHE_LOG"].misses == 0
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import os
+import pathlib
+
+import pytest
+from app import util_render_cache
+from app.util_render_cache import RenderCache
+from fastapi.responses import FileResponse, StreamingResponse
+
+from conftest import get_request
+
+
+@pytest.mark.parametrize(
+    "accept_encoding,expected",
+    (
+        ("", False),
+        ("gzip", True),
+        ("deflate, gzip;q=1.0, *;q=0.5", True),
+        ("gzip;q=0", False),
+        ("br", False),
+    ),
+)
+def test_accepts_gzip(accept_encoding: str, expected: bool) -> None:
+    request = get_request({"accept-encoding": accept_encoding})
+    assert util_render_cache.accepts_gzip(request) == expected
+
+
+def test_tee(tmp_path: pathlib.Path) -> None:
+    cache = RenderCache(directory=tmp_path, max_bytes=1_000_000)
+    key = cache.key("logger_10_debug.log", "INFO", None)
+    assert key != cache.key("logger_10_debug.log", "DEBUG", None)
+    assert cache.get(key) is None
+
+    chunks = ["<html>", "ü" * 1000, "</html>"]
+    assert list(cache.tee(key=key, chunks=chunks)) == chunks
+    filename = cache.get(key)
+    assert filename is not None
+    assert gzip.decompress(filename.read_bytes()).decode() == "".join(chunks)
+
+    response = cache.response(
+        request=get_request({"accept-encoding": "gzip"}),
+        filename=filename,
+        media_type="text/html",
+        headers={"etag": '"x"'},
+    )
+    assert isinstance(response, FileResponse)
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == '"x"'
+
+    response = cache.response(
+        request=get_request({}), filename=filename, media_type="text/html", headers={}
+    )
+    assert isinstance(response, StreamingResponse)
+    assert "content-encoding" not in response.headers
+
+
+def test_tee_aborted(tmp_path: pathlib.Path) -> None:
+    cache = RenderCache(directory=tmp_path, max_bytes=1_000_000)
+    key = cache.key("aborted")
+    it = cache.tee(key=key, chunks=["a", "b", "c"])
+    assert next(it) == "a"
+    it.close()
+    assert cache.get(key) is None
+    assert list(tmp_path.rglob("*.tmp")) == []
+
+
+def test_evict(tmp_path: pathlib.Path) -> None:
+    cache = RenderCache(directory=tmp_path, max_bytes=1_000_000)
+    keys = [cache.key(i) for i in range(4)]
+    for i, key in enumerate(keys):
+        list(cache.tee(key=key, chunks=[os.urandom(1000).hex()]))
+        os.utime(cache.filename(key), (1000 + i, 1000 + i))
+    size = cache.filename(keys[0]).stat().st_size
+
+    # A hit marks the entry as recently used
+    assert cache.get(keys[0]) is not None
+
+    cache.max_bytes = 2 * size + size // 2
+    assert cache.evict() == 2
+    assert [cache.get(key) is not None for key in keys] == [True, False, False, True]
+
+
+def test_serve(tmp_path: pathlib.Path) -> None:
+    cache = RenderCache(directory=tmp_path, max_bytes=1_000_000, memory_max_bytes=0)
+    key = cache.key("report.md", 1)
+    renders: list[str] = []
+
+    def render() -> list[str]:
+        renders.append("rendered")
+        return ["<html>", "</html>"]
+
+    async def body(response: StreamingResponse) -> str:
+        chunks = [chunk async for chunk in response.body_iterator]
+        return "".join(c if isinstance(c, str) else bytes(c).decode() for c in chunks)
+
+    response = cache.serve(
+        request=get_request({}), key=key, media_type="text/html", render=render
+    )
+    assert isinstance(response, StreamingResponse)
+    assert asyncio.run(body(response)) == "<html></html>"
+
+    response = cache.serve(
+        request=get_request({}), key=key, media_type="text/html", render=render
+    )
+    assert isinstance(response, StreamingResponse)
+    assert asyncio.run(body(response)) == "<html></html>"
+    assert renders == ["rendered"]
+
+    response = cache.serve(
+        request=get_request({"if-none-match": response.headers["etag"]}),
+        key=key,
+        media_type="text/html",
+        render=render,
+    )
+    assert response.status_code == 304
+    assert cache.stats() == {
+        "hits_memory": 0,
+        "hits_disk": 1,
+        "misses": 1,
+        "memory_entries": 0,
+        "memory_bytes": 0,
+    }
+
+
+def test_serve_memory(tmp_path: pathlib.Path) -> None:
+    cache = RenderCache(
+        directory=tmp_path, max_bytes=1_000_000, memory_max_bytes=16 * 1000
+    )
+    key_small = cache.key("small")
+    key_large = cache.key("large")
+    list(cache.tee(key=key_small, chunks=["<html>"]))
+    list(cache.tee(key=key_large, chunks=[os.urandom(2000).hex()]))
+    assert cache.get_memory(key_small) is not None
+    # Larger than memory_max_bytes / MEMORY_ENTRY_FRACTION
+    assert cache.get_memory(key_large) is None
+
+    for headers in ({"accept-encoding": "gzip"}, {}):
+        response = cache.serve(
+            request=get_request(headers),
+            key=key_small,
+            media_type="text/html",
+            render=lambda: pytest.fail("Not expected to render"),
+        )
+        assert not isinstance(response, (FileResponse, StreamingResponse))
+        assert response.headers.get("content-encoding") == headers.get(
+            "accept-encoding"
+        )
+        if not headers:
+            assert response.body == b"<html>"
+    assert cache.hits_memory == 2
+
+    cache.memory_max_bytes = 1
+    list(cache.tee(key=key_small, chunks=["<html>"]))
+    assert cache.memory_bytes == 0
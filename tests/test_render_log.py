@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import pathlib
+import re
+import typing
+
+import pytest
+from app import constants, render_log, util_log_index, util_render_cache
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.datastructures import URL
+
+LABEL = "github_selfhosted_testrun_107"
+DIRECTORY_GOLDEN = pathlib.Path(__file__).parent / "golden"
+
+LOGFILE_TEXT = """\
+DEBUG    - starting
+INFO     - [COLOR_INFO]RPI_PICO2: Firmware build start.
+INFO     - /home/testresults/RUN-TESTS_BASICS/testresults.txt <b>
+WARNING  - flaky test
+ERROR    - failed\x0cform feed
+continuation of the error
+
+DEBUG    - done
+"""
+
+
+@pytest.fixture
+def logfile(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> pathlib.Path:
+    monkeypatch.setattr(constants, "DIRECTORY_REPORTS", tmp_path / "reports")
+    monkeypatch.setattr(
+        constants, "DIRECTORY_REPORTS_METADATA", tmp_path / "reports_metadata"
+    )
+    directory_report = tmp_path / "reports" / LABEL
+    (directory_report / "RUN-TESTS_BASICS").mkdir(parents=True)
+    (directory_report / "context.json").write_text(
+        json.dumps(
+            {
+                "directories": {"R": "/home/testresults"},
+                "git_ref": {},
+            }
+        )
+    )
+    logfile = directory_report / "RUN-TESTS_BASICS" / render_log.DEFAULT_LOGFILE
+    logfile.write_text(LOGFILE_TEXT)
+    return logfile
+
+
+@pytest.mark.parametrize("severity_text", ("DEBUG", "INFO", "WARNING", "ERROR"))
+def test_iter_render(
+    logfile: pathlib.Path, monkeypatch: pytest.MonkeyPatch, severity_text: str
+) -> None:
+    """
+    The golden files were rendered by the original 'Render.render()'
+    before it was turned into a generator.
+    """
+    html_golden = (DIRECTORY_GOLDEN / f"render_log_{severity_text}.html").read_text()
+    url = URL(f"/{LABEL}/RUN-TESTS_BASICS/{render_log.DEFAULT_LOGFILE}")
+    html = render_log.Render(
+        logfile=logfile, url=url, severity_text=severity_text
+    ).render()
+    assert html == html_golden
+
+    # Flush after every line
+    monkeypatch.setattr(render_log, "FLUSH_SIZE_CHARS", 1)
+    chunks = list(
+        render_log.Render(
+            logfile=logfile, url=url, severity_text=severity_text
+        ).iter_render()
+    )
+    assert len(chunks) > 2
+    assert "".join(chunks) == html_golden
+
+    assert "schema_color_active: True" in html_golden
+    assert ("starting" in html_golden) == (severity_text == "DEBUG")
+    assert ("&lt;b&gt;" in html_golden) == (severity_text in ("DEBUG", "INFO"))
+    assert ("flaky test" in html_golden) == (severity_text != "ERROR")
+    assert "failed" in html_golden
+    assert 'id="line5"' in html_golden
+    assert (
+        '<a href="/github_selfhosted_testrun_107/RUN-TESTS_BASICS/testresults.txt">'
+        in html_golden
+    ) == (severity_text in ("DEBUG", "INFO"))
+
+
+def test_render_index_lazy(
+    logfile: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    The constructor runs on the event loop: The index is built when rendering.
+    """
+    calls: list[pathlib.Path] = []
+    get_index = util_log_index.get_index
+
+    def get_index_spy(**kwargs: typing.Any) -> util_log_index.LogIndex:
+        calls.append(kwargs["logfile"])
+        return get_index(**kwargs)
+
+    monkeypatch.setattr(util_log_index, "get_index", get_index_spy)
+    url = URL(f"/{LABEL}/RUN-TESTS_BASICS/{render_log.DEFAULT_LOGFILE}")
+    chunks = render_log.Render(
+        logfile=logfile, url=url, severity_text="INFO"
+    ).iter_render()
+    assert calls == []
+    assert "failed" in "".join(chunks)
+    assert calls == [logfile]
+
+
+@pytest.mark.parametrize("severity_text", ("DEBUG", "INFO", "WARNING", "ERROR"))
+def test_iter_render_pages(
+    logfile: pathlib.Path, monkeypatch: pytest.MonkeyPatch, severity_text: str
+) -> None:
+    url = URL(f"/{LABEL}/RUN-TESTS_BASICS/{render_log.DEFAULT_LOGFILE}")
+    html = render_log.Render(
+        logfile=logfile, url=url, severity_text=severity_text
+    ).render()
+
+    monkeypatch.setattr(render_log, "LOG_PAGE_LINES", 2)
+    r = render_log.Render(logfile=logfile, url=url, severity_text=severity_text, page=1)
+    html_pages = [
+        render_log.Render(
+            logfile=logfile, url=url, severity_text=severity_text, page=page
+        ).render()
+        for page in range(1, r.pages + 1)
+    ]
+
+    def lines(html: str) -> list[str]:
+        html = re.sub(r"&page=\d+", "", html)
+        return html.split('<div class="line">')[1:]
+
+    assert [line for h in html_pages for line in lines(h)] == lines(html)
+    assert f"page: |&lt; &lt; 1/{r.pages}" in html_pages[0]
+
+
+def test_render_log_cached(
+    logfile: pathlib.Path, monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path
+) -> None:
+    cache = util_render_cache.RenderCache(
+        directory=tmp_path / "reports_cache", max_bytes=1_000_000
+    )
+    monkeypatch.setattr(util_render_cache, "RENDER_CACHE_LOG", cache)
+    url = URL(f"/{LABEL}/RUN-TESTS_BASICS/{render_log.DEFAULT_LOGFILE}")
+
+    def get(headers: dict[str, str]) -> Response:
+        return render_log.render_log(
+            request=Request(
+                scope={
+                    "type": "http",
+                    "method": "GET",
+                    "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+                }
+            ),
+            logfile=logfile,
+            url=url,
+            severity="INFO",
+        )
+
+    async def body(response: StreamingResponse) -> str:
+        return "".join([chunk async for chunk in response.body_iterator])
+
+    # Miss: Rendered and stored
+    response = get({})
+    assert isinstance(response, StreamingResponse)
+    html = asyncio.run(body(response))
+    etag = response.headers["etag"]
+
+    # Hit
+    response = get({"accept-encoding": "gzip"})
+    assert isinstance(response, FileResponse)
+    assert gzip.decompress(pathlib.Path(response.path).read_bytes()).decode() == html
+    assert response.headers["etag"] == etag
+
+    # Revalidation
+    assert get({"if-none-match": etag}).status_code == 304
+
+    # Another severity is another entry
+    response = render_log.render_log(
+        request=Request(scope={"type": "http", "method": "GET", "headers": []}),
+        logfile=logfile,
+        url=url,
+        severity="ERROR",
+    )
+    assert response.headers["etag"] != etag
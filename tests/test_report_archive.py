@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import io
+import pathlib
+import shutil
+import zipfile
+
+import pytest
+from app import util_report_archive, util_upload
+
+from conftest import create_tgz
+
+FILES = {
+    "context.json": b"{}",
+    "RUN-TESTS_BASICS/logger_10_debug.log": b"DEBUG    - hello\n" * 1000,
+    "RUN-TESTS_BASICS/firmware.uf2": bytes(range(256)) * 100,
+}
+
+
+def test_report_archive(tmp_path: pathlib.Path) -> None:
+    directory_reports = tmp_path / "reports"
+    directory_staging = tmp_path / "reports_staging"
+    directory_reports.mkdir()
+    directory_staging.mkdir()
+
+    filename_zip = util_upload.ingest_tgz(
+        fin=io.BytesIO(create_tgz(FILES)),
+        label="label",
+        directory_reports=directory_reports,
+        directory_staging=directory_staging,
+        max_bytes=1_000_000,
+        storage=util_report_archive.ReportStorage.ZIP,
+    )
+    assert filename_zip == directory_reports / "label" / "report.zip"
+    assert [f.name for f in (directory_reports / "label").iterdir()] == ["report.zip"]
+
+    def resolve(path: str) -> util_report_archive.ReportFile:
+        return util_report_archive.resolve(path, directory_reports=directory_reports)
+
+    root = resolve("label")
+    assert isinstance(root, zipfile.Path)
+    assert root.is_dir()
+    assert sorted(f.name for f in root.iterdir()) == [
+        "RUN-TESTS_BASICS",
+        "context.json",
+    ]
+    assert util_report_archive.report_label(root) == "label"
+
+    directory = resolve("label/RUN-TESTS_BASICS")
+    assert directory.is_dir()
+    assert (
+        util_report_archive.relative_path(
+            directory, directory_reports=directory_reports
+        )
+        == "label/RUN-TESTS_BASICS"
+    )
+
+    for name, data in FILES.items():
+        report_file = resolve(f"label/{name}")
+        assert report_file.is_file()
+        assert report_file.read_bytes() == data
+        assert (
+            util_report_archive.relative_path(
+                report_file, directory_reports=directory_reports
+            )
+            == f"label/{name}"
+        )
+        root = util_report_archive.report_root(report_file)
+        assert (root / "context.json").read_bytes() == b"{}"
+
+    assert not resolve("label/missing.txt").exists()
+    assert isinstance(resolve("other/x.txt"), pathlib.Path)
+
+
+@pytest.mark.parametrize("storage", list(util_report_archive.ReportStorage))
+def test_archive_cold(
+    tmp_path: pathlib.Path, storage: util_report_archive.ReportStorage
+) -> None:
+    directory_reports = tmp_path / "reports"
+    directory_staging = tmp_path / "reports_staging"
+    directory_cold = tmp_path / "reports_cold"
+    directory_reports.mkdir()
+    directory_staging.mkdir()
+
+    util_upload.ingest_tgz(
+        fin=io.BytesIO(create_tgz(FILES)),
+        label="label",
+        directory_reports=directory_reports,
+        directory_staging=directory_staging,
+        max_bytes=1_000_000,
+        storage=storage,
+    )
+
+    def resolve(path: str) -> util_report_archive.ReportFile:
+        return util_report_archive.resolve(
+            path, directory_reports=directory_reports, directory_cold=directory_cold
+        )
+
+    filename_zip = util_report_archive.archive_cold(
+        label="label",
+        directory_reports=directory_reports,
+        directory_cold=directory_cold,
+    )
+    assert filename_zip == directory_cold / "label" / "report.zip"
+    assert [f.name for f in filename_zip.parent.iterdir()] == ["report.zip"]
+    assert filename_zip.stat().st_size < sum(len(d) for d in FILES.values()) / 4
+
+    with zipfile.ZipFile(filename_zip) as zf:
+        # The uploaded tarball is not archived
+        assert "label.tgz" not in zf.namelist()
+        for name in FILES:
+            assert zf.getinfo(name).compress_type == zipfile.ZIP_LZMA
+
+    # Not touched: The caller moves it to the trash
+    assert (directory_reports / "label").is_dir()
+
+    shutil.rmtree(directory_reports / "label")
+    root = resolve("label")
+    assert isinstance(root, zipfile.Path)
+    assert util_report_archive.report_label(root) == "label"
+    for name, data in FILES.items():
+        report_file = resolve(f"label/{name}")
+        assert report_file.read_bytes() == data
+        assert (
+            util_report_archive.relative_path(
+                report_file, directory_reports=directory_reports
+            )
+            == f"label/{name}"
+        )
+
+    with pytest.raises(FileNotFoundError):
+        util_report_archive.archive_cold(
+            label="label",
+            directory_reports=directory_reports,
+            directory_cold=directory_cold,
+        )
+
+
+def test_open_archive_closed(tmp_path: pathlib.Path) -> None:
+    """
+    A replaced or removed archive is closed: Its file descriptor is released.
+    """
+    filename_zip = tmp_path / "label" / "report.zip"
+    filename_zip.parent.mkdir()
+
+    def write(data: bytes) -> None:
+        filename_tmp = filename_zip.with_suffix(".tmp")
+        with zipfile.ZipFile(filename_tmp, mode="w") as zf:
+            zf.writestr("context.json", data)
+        filename_tmp.replace(filename_zip)
+
+    write(b"{}")
+    root = util_report_archive.open_archive(filename_zip)
+    assert util_report_archive.open_archive(filename_zip) is root
+
+    # Re-uploaded
+    write(b'{"a": 1}')
+    root_replaced = util_report_archive.open_archive(filename_zip)
+    assert root.root.fp is None
+    assert (root_replaced / "context.json").read_bytes() == b'{"a": 1}'
+
+    util_report_archive.close_archive(filename_zip.parent)
+    assert root_replaced.root.fp is None
+    assert util_report_archive.open_archive(filename_zip) is not root_replaced
+    util_report_archive.close_archive(filename_zip.parent)
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import pathlib
+
+import pytest
+from app import util_sniff
+from app.util_sniff import Sniff
+
+
+@pytest.mark.parametrize(
+    "sample,complete,sniff_expected",
+    (
+        (b"hello\n", True, Sniff.ASCII),
+        (b"", True, Sniff.ASCII),
+        ("grün".encode(), True, Sniff.UTF8),
+        # Multibyte character cut at the end of the sample
+        ("grün".encode()[:3], False, Sniff.UTF8),
+        ("grün".encode()[:3], True, Sniff.BINARY),
+        (b"\x00\xff\xfe", True, Sniff.BINARY),
+    ),
+)
+def test_sniff_bytes(sample: bytes, complete: bool, sniff_expected: Sniff) -> None:
+    assert util_sniff.sniff_bytes(sample, complete=complete) == sniff_expected
+
+
+@pytest.mark.parametrize(
+    "data",
+    (
+        b"",
+        b"hello\n",
+        b"a\tb\r\n\x1b[0m\\x\x7f",
+        bytes(range(256)),
+    ),
+)
+def test_escape_bytes(data: bytes) -> None:
+    expected = "".join(
+        chr(b) if (0x20 <= b <= 0x7E) or (b == 0x0A) else f"\\x{b:02x}" for b in data
+    )
+    assert util_sniff.escape_bytes(data) == expected
+
+
+def test_sniff_file(tmp_path: pathlib.Path) -> None:
+    filename = tmp_path / "capture.txt"
+    filename.write_bytes(b"a" * util_sniff.SAMPLE_SIZE_BYTES + b"\xff")
+    # The binary byte is beyond the sample
+    assert util_sniff.sniff(filename) == Sniff.ASCII
+
+    filename.write_bytes(b"\xff")
+    assert util_sniff.sniff(filename) == Sniff.BINARY
+    assert "".join(util_sniff.iter_escaped(filename)) == (
+        util_sniff.ESCAPE_HEADER + "\\xff"
+    )
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import errno
+import pathlib
+import time
+
+import pytest
+from app import util_trash
+
+
+def make_tree(directory: pathlib.Path, files: int) -> None:
+    for i in range(files):
+        filename = directory / f"board_{i % 3}" / "sub" / f"file_{i}.txt"
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        filename.write_text("x" * 10)
+
+
+def test_move_to_trash(tmp_path: pathlib.Path) -> None:
+    trash = util_trash.Trash(directory=tmp_path / "reports_trash")
+    directory = tmp_path / "reports" / "github_selfhosted_testrun_107"
+    make_tree(directory, files=5)
+
+    assert trash.move(directory)
+    assert not directory.exists()
+    assert not trash.move(directory)
+    (trashed,) = (tmp_path / "reports_trash").iterdir()
+    assert trashed.name.endswith("_github_selfhosted_testrun_107")
+    assert trash.progress().directories == 1
+
+
+@pytest.mark.parametrize("workers", (1, 4))
+def test_empty(tmp_path: pathlib.Path, workers: int) -> None:
+    trash = util_trash.Trash(directory=tmp_path / "reports_trash")
+    for label in ("a", "b"):
+        directory = tmp_path / "reports" / label
+        make_tree(directory, files=200)
+        trash.move(directory)
+
+    progress = trash.empty(files_per_s=1e6, workers=workers, time_budget_s=60.0)
+    assert progress == trash.progress()
+    assert (progress.directories, progress.files_pending, progress.bytes_pending) == (
+        0,
+        0,
+        0,
+    )
+    assert (progress.files_deleted, progress.bytes_deleted) == (400, 4000)
+    assert [p.name for p in trash.directory.iterdir()] == [util_trash.FILENAME_PROGRESS]
+
+
+def test_empty_time_budget(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(util_trash, "BATCH_FILES", 10)
+    trash = util_trash.Trash(directory=tmp_path / "reports_trash")
+    directory = tmp_path / "reports" / "a"
+    make_tree(directory, files=100)
+    trash.move(directory)
+
+    progress = trash.empty(files_per_s=200.0, workers=2, time_budget_s=0.05)
+    assert 0 < progress.files_deleted < 100
+    assert progress.files_pending == 100 - progress.files_deleted
+    assert progress.directories == 1
+
+    # The next call continues
+    progress = trash.empty(files_per_s=1e6, workers=2, time_budget_s=60.0)
+    assert progress.files_pending == 0
+    assert progress.directories == 0
+
+
+def test_empty_time_budget_large_directory(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    All files in one directory: The budget is checked between the batches.
+    """
+    monkeypatch.setattr(util_trash, "BATCH_FILES", 10)
+    trash = util_trash.Trash(directory=tmp_path / "reports_trash")
+    directory = tmp_path / "reports" / "a"
+    directory.mkdir(parents=True)
+    for i in range(100):
+        (directory / f"file_{i}.txt").write_text("x" * 10)
+    trash.move(directory)
+
+    progress = trash.empty(files_per_s=200.0, workers=2, time_budget_s=0.05)
+    assert 0 < progress.files_deleted < 100
+    assert progress.directories == 1
+
+
+def test_empty_unlink_error(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    trash = util_trash.Trash(directory=tmp_path / "reports_trash")
+    for label in ("a", "b"):
+        directory = tmp_path / "reports" / label
+        make_tree(directory, files=20)
+        trash.move(directory)
+
+    unlink = util_trash.os.unlink
+
+    def unlink_busy(path: str) -> None:
+        if path.endswith("file_7.txt"):
+            raise OSError(errno.EBUSY, "Device or resource busy", path)
+        unlink(path)
+
+    monkeypatch.setattr(util_trash.os, "unlink", unlink_busy)
+    progress = trash.empty(files_per_s=1e6, workers=2, time_budget_s=60.0)
+    # Skipped, the other files and directories are deleted
+    assert progress.files_deleted == 38
+    assert len(list(trash.directory.glob("*/board_1/sub/file_7.txt"))) == 2
+
+    monkeypatch.setattr(util_trash.os, "unlink", unlink)
+    progress = trash.empty(files_per_s=1e6, workers=2, time_budget_s=60.0)
+    assert progress.files_deleted == 2
+    assert (progress.directories, progress.files_pending) == (0, 0)
+    assert [p.name for p in trash.directory.iterdir()] == [util_trash.FILENAME_PROGRESS]
+
+
+def test_empty_carry_forward(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(util_trash, "BATCH_FILES", 10)
+    trash = util_trash.Trash(directory=tmp_path / "reports_trash")
+    directory = tmp_path / "reports" / "a"
+    make_tree(directory, files=100)
+    trash.move(directory)
+    progress = trash.empty(files_per_s=200.0, workers=2, time_budget_s=0.05)
+    assert progress.directories == 1
+
+    directory = tmp_path / "reports" / "b"
+    make_tree(directory, files=30)
+    trash.move(directory)
+
+    scanned: list[str] = []
+    count = util_trash._count
+
+    def count_spy(directory: pathlib.Path) -> list[int]:
+        scanned.append(directory.name)
+        return count(directory)
+
+    monkeypatch.setattr(util_trash, "_count", count_spy)
+    progress = trash.empty(files_per_s=200.0, workers=2, time_budget_s=0.05)
+    # Only the directory trashed since the previous call
+    assert [name[-2:] for name in scanned] == ["_b"]
+    # The counts carried forward match the files left
+    files_left = [p for p in trash.directory.glob("*/**/*") if p.is_file()]
+    assert progress.files_pending == len(files_left)
+    assert progress.bytes_pending == 10 * len(files_left)
+
+    progress = trash.empty(files_per_s=1e6, workers=2, time_budget_s=60.0)
+    assert (progress.directories, progress.files_pending, progress.bytes_pending) == (
+        0,
+        0,
+        0,
+    )
+    assert progress.scanned == {}
+
+
+def test_throttle() -> None:
+    throttle = util_trash.Throttle(rate_per_s=1000.0)
+    time_start = time.monotonic()
+    for _ in range(5):
+        throttle.acquire(count=20)
+    # The first batch is not delayed
+    assert time.monotonic() - time_start >= 0.08
@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import pathlib
+import typing
+
+import pytest
+from app import util_blobstore, util_upload
+from fastapi import FastAPI, HTTPException, Request
+from starlette.datastructures import Headers
+
+from conftest import create_tgz
+
+FILES = {
+    "context.json": b"{}",
+    "RUN-TESTS_BASICS/logger_10_debug.log": b"DEBUG    - hello\n" * 1000,
+    "RUN-TESTS_BASICS/firmware.uf2": bytes(range(256)) * 100,
+}
+
+
+def test_extract_tgz(tmp_path: pathlib.Path) -> None:
+    tgz_bytes = create_tgz(FILES)
+    directory = tmp_path / "label"
+    filename_tgz = directory / "label.tgz"
+
+    size_bytes = util_upload.extract_tgz(
+        fin=io.BytesIO(tgz_bytes),
+        directory=directory,
+        filename_tgz=filename_tgz,
+        max_bytes=len(tgz_bytes),
+    )
+
+    assert size_bytes == len(tgz_bytes)
+    assert filename_tgz.read_bytes() == tgz_bytes
+    for name, data in FILES.items():
+        assert (directory / name).read_bytes() == data
+
+
+def test_extract_tgz_too_large(tmp_path: pathlib.Path) -> None:
+    tgz_bytes = create_tgz(FILES)
+    directory = tmp_path / "label"
+
+    with pytest.raises(util_upload.UploadTooLargeError):
+        util_upload.extract_tgz(
+            fin=io.BytesIO(tgz_bytes),
+            directory=directory,
+            filename_tgz=directory / "label.tgz",
+            max_bytes=len(tgz_bytes) - 1,
+        )
+
+
+def test_ingest_tgz_replaces_report(tmp_path: pathlib.Path) -> None:
+    directory_reports = tmp_path / "reports"
+    directory_staging = tmp_path / "reports_staging"
+    directory_reports.mkdir()
+    directory_staging.mkdir()
+    directory_old = directory_reports / "label"
+    directory_old.mkdir()
+    (directory_old / "obsolete.txt").write_text("obsolete")
+
+    filename_tgz = util_upload.ingest_tgz(
+        fin=io.BytesIO(create_tgz(FILES)),
+        label="label",
+        directory_reports=directory_reports,
+        directory_staging=directory_staging,
+        max_bytes=1_000_000,
+    )
+
+    assert filename_tgz == directory_old / "label.tgz"
+    assert not (directory_old / "obsolete.txt").exists()
+    assert (directory_old / "context.json").read_bytes() == FILES["context.json"]
+    assert list(directory_staging.iterdir()) == []
+
+
+def test_ingest_tgz_failure_keeps_report(tmp_path: pathlib.Path) -> None:
+    directory_reports = tmp_path / "reports"
+    directory_staging = tmp_path / "reports_staging"
+    directory_reports.mkdir()
+    directory_staging.mkdir()
+    directory_old = directory_reports / "label"
+    directory_old.mkdir()
+    (directory_old / "context.json").write_text("old")
+
+    with pytest.raises(util_upload.UploadTooLargeError):
+        util_upload.ingest_tgz(
+            fin=io.BytesIO(create_tgz(FILES)),
+            label="label",
+            directory_reports=directory_reports,
+            directory_staging=directory_staging,
+            max_bytes=10,
+        )
+
+    assert (directory_old / "context.json").read_text() == "old"
+    assert list(directory_staging.iterdir()) == []
+
+
+def test_extract_tgz_blobstore(tmp_path: pathlib.Path) -> None:
+    blobstore = util_blobstore.BlobStore(directory=tmp_path / "reports_blobs")
+    tgz_bytes = create_tgz(FILES)
+    for label in ("label_1", "label_2"):
+        directory = tmp_path / label
+        util_upload.extract_tgz(
+            fin=io.BytesIO(tgz_bytes),
+            directory=directory,
+            filename_tgz=directory / f"{label}.tgz",
+            max_bytes=len(tgz_bytes),
+            blobstore=blobstore,
+        )
+        for name, data in FILES.items():
+            assert (directory / name).read_bytes() == data
+
+    stats = blobstore.stats()
+    assert stats.blobs == len(FILES)
+    assert stats.links == 2 * len(FILES)
+
+
+BOUNDARY = "boundary-1234"
+
+
+def _multipart(fields: list[tuple[str, bytes]]) -> bytes:
+    body = b""
+    for name, data in fields:
+        filename = '; filename="x.tgz"' if name == "file" else ""
+        header = f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"{filename}\r\n\r\n'
+        body += header.encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+HEADERS = Headers({"content-type": f"multipart/form-data; boundary={BOUNDARY}"})
+
+
+def _receive_upload(
+    tmp_path: pathlib.Path, body: bytes, chunk_size: int = 1000
+) -> tuple[str, pathlib.Path, bool]:
+    """
+    Returns (label, filename, whether the extraction started before the body was complete)
+    """
+    directory_reports = tmp_path / "reports"
+    directory_staging = tmp_path / "reports_staging"
+    directory_reports.mkdir()
+    directory_staging.mkdir()
+    started_early = False
+
+    async def main() -> tuple[str, pathlib.Path]:
+        nonlocal started_early
+        started = asyncio.Event()
+
+        async def stream() -> typing.AsyncIterator[bytes]:
+            nonlocal started_early
+            for i in range(0, len(body), chunk_size):
+                yield body[i : i + chunk_size]
+                await asyncio.sleep(0)
+            started_early = started.is_set()
+
+        async def ingest(label: str, fin: typing.BinaryIO) -> pathlib.Path:
+            started.set()
+            return await util_upload.run_in_executor(
+                util_upload.ingest_tgz,
+                fin=fin,
+                label=label,
+                directory_reports=directory_reports,
+                directory_staging=directory_staging,
+                max_bytes=1_000_000,
+            )
+
+        return await util_upload.receive_upload(
+            headers=HEADERS, stream=stream(), ingest=ingest
+        )
+
+    label, filename = asyncio.run(main())
+    for name, data in FILES.items():
+        assert (directory_reports / label / name).read_bytes() == data
+    return label, filename, started_early
+
+
+def test_receive_upload(tmp_path: pathlib.Path) -> None:
+    tgz_bytes = create_tgz(FILES)
+    body = _multipart([("label", b"label"), ("file", tgz_bytes)])
+    label, filename, started_early = _receive_upload(tmp_path, body)
+    assert label == "label"
+    assert filename.read_bytes() == tgz_bytes
+    assert started_early
+
+
+def test_receive_upload_file_first(tmp_path: pathlib.Path) -> None:
+    tgz_bytes = create_tgz(FILES)
+    body = _multipart([("file", tgz_bytes), ("label", b"label")])
+    label, filename, started_early = _receive_upload(tmp_path, body)
+    assert label == "label"
+    assert filename.read_bytes() == tgz_bytes
+    # Spooled: The label was not known yet
+    assert not started_early
+
+
+@pytest.mark.parametrize(
+    "fields",
+    (
+        [("label", b"label")],
+        [("file", b"x")],
+    ),
+)
+def test_receive_upload_missing_field(
+    tmp_path: pathlib.Path, fields: list[tuple[str, bytes]]
+) -> None:
+    with pytest.raises(HTTPException) as e:
+        _receive_upload(tmp_path, _multipart(fields))
+    assert e.value.status_code == 400
+
+
+def test_receive_upload_truncated(tmp_path: pathlib.Path) -> None:
+    body = _multipart([("label", b"label"), ("file", create_tgz(FILES))])
+    with pytest.raises(EOFError, match="The upload was aborted"):
+        _receive_upload(tmp_path, body[: len(body) // 2])
+    assert not (tmp_path / "reports" / "label").exists()
+    assert list((tmp_path / "reports_staging").iterdir()) == []
+
+
+def _post_limited(chunks: list[bytes], content_length: bool) -> int:
+    """
+    Posts 'chunks' to '/upload' through 'UploadLimitMiddleware'.
+    Returns the status code.
+    """
+    app = FastAPI()
+    app.add_middleware(
+        util_upload.UploadLimitMiddleware, paths=("/upload",), max_bytes=100
+    )
+
+    @app.post("/upload")
+    async def upload(request: Request) -> dict[str, int]:
+        return {"size": len(await request.body())}
+
+    headers = []
+    if content_length:
+        headers.append((b"content-length", str(sum(map(len, chunks))).encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/upload",
+        "raw_path": b"/upload",
+        "root_path": "",
+        "query_string": b"",
+        "headers": headers,
+        "server": ("testserver", 80),
+        "client": ("testclient", 50000),
+    }
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+    status_codes: list[int] = []
+
+    async def receive() -> dict[str, typing.Any]:
+        return messages.pop(0)
+
+    async def send(message: dict[str, typing.Any]) -> None:
+        if message["type"] == "http.response.start":
+            status_codes.append(message["status"])
+
+    asyncio.run(app(scope, receive, send))
+    return status_codes[0]
+
+
+@pytest.mark.parametrize("size,status_code", ((100, 200), (101, 413)))
+def test_upload_limit_content_length(size: int, status_code: int) -> None:
+    assert _post_limited([b"x" * size], content_length=True) == status_code
+
+
+@pytest.mark.parametrize("size,status_code", ((100, 200), (101, 413)))
+def test_upload_limit_streamed(size: int, status_code: int) -> None:
+    # No 'content-length': The bytes are counted while they arrive
+    assert _post_limited([b"x"] * size, content_length=False) == status_code
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import pathlib
+import time
+import typing
+
+import pytest
+from app import util_upload_session
+from fastapi import HTTPException
+
+from conftest import create_tgz
+
+FILES = {"RUN-TESTS_BASICS/firmware.uf2": bytes(range(256)) * 1000}
+
+
+async def _stream(data: bytes):
+    for i in range(0, len(data), 1000):
+        yield data[i : i + 1000]
+
+
+def _put_chunk(
+    session: util_upload_session.UploadSession,
+    data: bytes,
+    offset: int,
+    sha256: str | None = None,
+) -> None:
+    if sha256 is None:
+        sha256 = hashlib.sha256(data).hexdigest()
+    asyncio.run(session.write_chunk(offset=offset, stream=_stream(data), sha256=sha256))
+
+
+def test_merge_ranges() -> None:
+    assert util_upload_session._merge_ranges([(10, 5), (0, 10), (20, 1)]) == [
+        (0, 15),
+        (20, 1),
+    ]
+
+
+def test_upload_session(tmp_path: pathlib.Path) -> None:
+    directory_spool = tmp_path / "reports_spool"
+    directory_reports = tmp_path / "reports"
+    directory_staging = tmp_path / "reports_staging"
+    for d in (directory_spool, directory_reports, directory_staging):
+        d.mkdir()
+
+    tgz_bytes = create_tgz(FILES)
+    half = len(tgz_bytes) // 2
+    session = util_upload_session.UploadSession.create(
+        directory_spool=directory_spool,
+        label="label",
+        size_bytes=len(tgz_bytes),
+        sha256=hashlib.sha256(tgz_bytes).hexdigest(),
+        max_bytes=10_000_000,
+    )
+
+    # Second half first, with a wrong checksum: not accepted
+    with pytest.raises(HTTPException):
+        _put_chunk(session, tgz_bytes[half:], offset=half, sha256="0" * 64)
+    assert session.missing_ranges() == [(0, len(tgz_bytes))]
+
+    _put_chunk(session, tgz_bytes[half:], offset=half)
+    assert session.missing_ranges() == [(0, half)]
+
+    # Incomplete
+    with pytest.raises(HTTPException):
+        session.finalize(
+            directory_reports=directory_reports,
+            directory_staging=directory_staging,
+            max_bytes=10_000_000,
+        )
+
+    session = util_upload_session.UploadSession.read(
+        directory_spool=directory_spool, session_id=session.session_id
+    )
+    _put_chunk(session, tgz_bytes[:half], offset=0)
+    assert session.missing_ranges() == []
+
+    filename_tgz = session.finalize(
+        directory_reports=directory_reports,
+        directory_staging=directory_staging,
+        max_bytes=10_000_000,
+    )
+    assert filename_tgz.read_bytes() == tgz_bytes
+    assert (directory_reports / "label/RUN-TESTS_BASICS/firmware.uf2").is_file()
+    assert list(directory_spool.iterdir()) == []
+
+
+def test_purge_expired_sessions(tmp_path: pathlib.Path) -> None:
+    util_upload_session.UploadSession.create(
+        directory_spool=tmp_path,
+        label="label",
+        size_bytes=10,
+        sha256="",
+        max_bytes=10_000_000,
+    )
+    assert util_upload_session.purge_expired_sessions(tmp_path, expiry_s=60.0) == 0
+    assert util_upload_session.purge_expired_sessions(tmp_path, expiry_s=-1.0) == 1
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_upload_session_corrupt_resend(tmp_path: pathlib.Path) -> None:
+    directory_spool = tmp_path / "reports_spool"
+    directory_reports = tmp_path / "reports"
+    directory_staging = tmp_path / "reports_staging"
+    for d in (directory_spool, directory_reports, directory_staging):
+        d.mkdir()
+
+    tgz_bytes = create_tgz(FILES)
+    session = util_upload_session.UploadSession.create(
+        directory_spool=directory_spool,
+        label="label",
+        size_bytes=len(tgz_bytes),
+        sha256="",
+        max_bytes=10_000_000,
+    )
+    _put_chunk(session, tgz_bytes, offset=0)
+    assert session.missing_ranges() == []
+
+    # A corrupt resend overlapping the received range: Rejected and not written
+    corrupt = bytes(b ^ 0xFF for b in tgz_bytes[100:200])
+    with pytest.raises(HTTPException) as e:
+        _put_chunk(
+            session,
+            corrupt,
+            offset=100,
+            sha256=hashlib.sha256(tgz_bytes[100:200]).hexdigest(),
+        )
+    assert e.value.status_code == 400
+    assert list(session.directory_incoming.iterdir()) == []
+
+    filename_tgz = session.finalize(
+        directory_reports=directory_reports,
+        directory_staging=directory_staging,
+        max_bytes=10_000_000,
+    )
+    assert filename_tgz.read_bytes() == tgz_bytes
+
+
+def test_purge_expired_sessions_incoming(tmp_path: pathlib.Path) -> None:
+    session = util_upload_session.UploadSession.create(
+        directory_spool=tmp_path,
+        label="label",
+        size_bytes=10,
+        sha256="",
+        max_bytes=10_000_000,
+    )
+    session.directory_incoming.mkdir()
+    filename_chunk = session.directory_incoming / "chunk"
+    filename_chunk.write_bytes(b"x")
+    expired = time.time() - 120.0
+    for path in (
+        session.directory,
+        session.directory_chunks,
+        session.directory_incoming,
+    ):
+        os.utime(path, (expired, expired))
+
+    # A chunk is beeing received
+    assert util_upload_session.purge_expired_sessions(tmp_path, expiry_s=60.0) == 0
+
+    os.utime(filename_chunk, (expired, expired))
+    assert util_upload_session.purge_expired_sessions(tmp_path, expiry_s=60.0) == 1
+
+
+def test_upload_session_finalize_concurrent(reports: pathlib.Path) -> None:
+    """
+    The second finalize waits for the first: Then the session is gone.
+    """
+    from app import constants, main
+
+    tgz_bytes = create_tgz(FILES)
+    constants.DIRECTORY_REPORTS_SPOOL.mkdir(exist_ok=True)
+    session = util_upload_session.UploadSession.create(
+        directory_spool=constants.DIRECTORY_REPORTS_SPOOL,
+        label="label",
+        size_bytes=len(tgz_bytes),
+        sha256="",
+        max_bytes=10_000_000,
+    )
+    _put_chunk(session, tgz_bytes, offset=0)
+
+    async def finalize_twice() -> list[typing.Any]:
+        return await asyncio.gather(
+            main.upload_session_finalize(session.session_id),
+            main.upload_session_finalize(session.session_id),
+            return_exceptions=True,
+        )
+
+    response, exception = asyncio.run(finalize_twice())
+    assert response.status_code == 200
+    assert isinstance(exception, HTTPException)
+    assert exception.status_code == 404
+    assert (reports / "label/RUN-TESTS_BASICS/firmware.uf2").is_file()